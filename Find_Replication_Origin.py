@@ -1,6 +1,17 @@
 import argparse
 import os
 
+from cache import open_cache
+from fasta import genome_length, read_regions
+from genome import decode_kmer, encode_kmer, load_genome, reverse_complement
+from hamming import approx_count
+from kmers import frequent_words_mismatches
+from parallel import map_items, map_windows
+from profiling import Profiler
+from skew import skew_array, skew_extremes, stream_skew_extremes
+from skew_index import load_or_build_rmq
+from topk import top_k_mismatch_words
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -17,7 +28,14 @@ def parse_cmd_line(as_dict=False):
         "genome_fname" : "./Salmonella_enterica.txt",
         "pattern_len" : 9,
         "mismatches" : 1,
-        "window" : 500
+        "window" : 500,
+        "stream" : False,
+        "workers" : 1,
+        "cache_dir" : None,
+        "top_k" : None,
+        "per_contig" : False,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -27,7 +45,7 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome."""
+        help="""File containing genome. (plain or FASTA). Use file:contig to pick one contig"""
     )
     parser.add_argument("--pattern_len", 
         type=int,
@@ -44,7 +62,46 @@ def parse_cmd_line(as_dict=False):
         default=defaults["window"],
         help="""Value to subtract and add to min position found using skew method"""
     )
+    parser.add_argument("--stream",
+        action="store_true",
+        default=defaults["stream"],
+        help="""Read the genome in chunks and only keep the skew minima windows in memory"""
+    )
+    parser.add_argument("--workers",
+        type=int,
+        default=defaults["workers"],
+        help="""Number of processes to analyse the skew minima windows with. 0 uses every core"""
+    )
+    parser.add_argument("--cache_dir",
+        type=str,
+        default=defaults["cache_dir"],
+        help="""Directory to keep skew arrays and results in between runs. No caching if not set or with --stream"""
+    )
+    parser.add_argument("--top_k",
+        type=int,
+        default=defaults["top_k"],
+        help="""Report the top_k sequences of each window grouped by count instead of only the most frequent"""
+    )
+    parser.add_argument("--per_contig",
+        action="store_true",
+        default=defaults["per_contig"],
+        help="""Search around the skew min of each contig (plasmids...) instead of the whole genome's.
+        Minima come from a range-minimum index saved next to the genome file"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
     args = parser.parse_args()
+
+    if args.stream and args.per_contig:
+        parser.error("--per_contig needs the genome in memory, not --stream")
     
     if as_dict:
         args = vars(args)
@@ -55,33 +112,23 @@ def tally(genome):
     Finds skew of nucleuotide sequence.
     
     Parameters:
-        genome - str
+        genome - str or PackedSequence
             whole genome nucleotide sequence.
     Returns:
-        skew - list
-            ints
+        skew - int32 array
+            len(genome) + 1 values. C = -1, G = +1, other bases 0
     """
-    skew = [0]
-    for i in range(len(genome)):
-        if genome[i] == 'C':
-            count = skew[i] - 1
-        elif genome[i] == 'G':
-            count = skew[i] + 1
-        else:
-            count = skew[i] + 0
-
-        skew.append(count)
-    return skew
+    return skew_array(genome)
 
 def pattern_mismatch(genome, pattern, mismatches):
     """
     Counts the number of times the approximate pattern is observed in genome.
     
     Parameters:
-        genome - str
-            whole genome nucleotide sequence. case sensitive
+        genome - str or PackedSequence
+            whole genome nucleotide sequence. case insensitive
         pattern - str
-            specified nucleotide sequence. case sensitive
+            specified nucleotide sequence. case insensitive
         mismatches - int
             max amount of mismatches between genome and pattern allowed
     Returns:
@@ -89,41 +136,7 @@ def pattern_mismatch(genome, pattern, mismatches):
             number of times approx pattern occurs in genome
 
     """
-    pattern_index = []
-    
-    for i in range(len(genome) - (len(pattern)-1)):
-        j = 0
-        count = 0
-        while j < len(pattern):
-            if genome[j] != pattern[j]:
-                count += 1
-            j += 1
-
-        if count <= mismatches:
-            pattern_index.append(i)
-
-        genome = genome[1:]
-    
-    return len(pattern_index)
-
-def reverse_complement(forward_sequence):
-    """
-    Generates the reverse complement of a nucleotide sequence
-    
-    Parameters:
-        forward_sequence - str
-            nucleotide sequence.
-    Returns:
-        rev_comp - str
-            the reverse complement of the input nucleotide sequence
-            
-    """
-    complement = forward_sequence.replace('A', '%temp%').replace('T', 'A').replace('%temp%', 'T')
-    complement = complement.replace('G', '%temp%').replace('C', 'G').replace('%temp%', 'C')
-
-    rev_comp = complement[::-1]
-
-    return rev_comp
+    return approx_count(genome, pattern, mismatches)
 
 def approx_pattern(genome, pattern_len, mismatches):
     """
@@ -131,7 +144,7 @@ def approx_pattern(genome, pattern_len, mismatches):
     Pattern reverse compliments are included in the count.
     
     Parameters:
-        genome - str
+        genome - str or PackedSequence
             whole genome nucleotide sequence
         pattern_len - int
             length of nucleotide sequence
@@ -139,68 +152,142 @@ def approx_pattern(genome, pattern_len, mismatches):
             max amount of mismatches between genome and pattern allowed
     Returns:
         max_key_list - list of str
-             nucleotide seq n nucleotides long (pattern_len) that occur most frequently
+             nucleotide seq n nucleotides long (pattern_len) that occur most frequently,
+             in alphabetical order
 
     """
 
-    counts_dict = {}
-    for i in range(len(genome) - pattern_len-1):
-        seq = genome[i:pattern_len+i]
-        
-        # counting how many times seq appears in genome, allowing n mismatches
-        forward_count = pattern_mismatch(genome, seq, mismatches)
-        
-        # finding reverse compliment and counting how often it occurs, allowing n mismatches
-        reverse_comp = reverse_complement(seq)
-        reverse_count = pattern_mismatch(genome, reverse_comp, mismatches)
-
-        count = forward_count + reverse_count
-
-        if seq not in counts_dict:
-            counts_dict[seq] = count
-    
-    max_key = max(counts_dict, key=counts_dict.get)
+    # called once per ori window: both strands are counted in one pass over
+    # the window, not one approximate scan per k-mer and strand
+    max_key_list, _ = frequent_words_mismatches(genome, pattern_len, mismatches,
+        reverse_complement=True)
+    return max_key_list
 
-    max_key_list = []
+def top_patterns(genome, pattern_len, mismatches, top_k):
+    """
+    Finds the top_k patterns (pattern_len long) with fewer than n number of
+    mismatches, reverse complements included in the count.
 
-    for key, value in counts_dict.items():
-        if value == counts_dict[max_key]:
-            max_key_list.append(key)
+    Returns:
+        groups - list of (int, list of str)
+            count and the patterns with that count, highest count first
+    """
+    return top_k_mismatch_words(genome, pattern_len, mismatches, top_k,
+        reverse_complement=True)
 
-    return max_key_list
+def merge_windows(min_list, window, genome_len):
+    """
+    Builds the windows (min position +/- window) to search for DnaA boxes.
+    Windows that run off either end of the genome are dropped, and windows
+    that overlap (adjacent skew minima) are merged so no stretch of the
+    genome is analysed twice.
+
+    Parameters:
+        min_list - list of int
+            positions of the skew minimum, increasing.
+        window - int
+            value to subtract and add to each min position.
+        genome_len - int
+            length of the genome.
+    Returns:
+        regions - list of (int, int)
+            [start, stop) windows, increasing and non-overlapping
+    """
+    regions = []
+    for pos in min_list:
+        start = pos - window
+        stop = pos + window
+        if start < 0 or stop > genome_len:
+            continue
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], stop)
+        else:
+            regions.append((start, stop))
+    return regions
+
+def analyse_windows(genome, regions, pattern_len, mismatches, workers):
+    """
+    Runs approx_pattern on every window, in the flat form stored in the
+    cache.
+
+    Returns:
+        results - dict
+            lengths - number of words found in each window
+            words - 2-bit codes of the words, window after window
+    """
+    max_approx_seqs = map_windows(approx_pattern, genome, regions,
+        (pattern_len, mismatches), workers)
+    return {
+        "lengths" : [len(seqs) for seqs in max_approx_seqs],
+        "words" : [encode_kmer(seq) for seqs in max_approx_seqs for seq in seqs]
+    }
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
-
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
-
     pattern_len = args["pattern_len"]
     mismatches = args["mismatches"]
     window = args["window"]
+    workers = args["workers"]
 
-    skew = tally(genome)
-    
-    min_value = min(skew)
-    min_list = [i for i, x in enumerate(skew) if x == min_value]
-    
-    bounding_box = {}
-    for i in range(len(min_list)):
-        genome_copy = genome
-        if min_list[i] - window < 0 or min_list[i] + window > len(genome):
-            # report an error
-            x=9
+    if args["top_k"] is None:
+        kernel, kernel_args = approx_pattern, (pattern_len, mismatches)
+    else:
+        kernel, kernel_args = top_patterns, (pattern_len, mismatches, args["top_k"])
+
+    if args["stream"]:
+        with profiler.stage("skew"):
+            min_value, min_list, _, _ = stream_skew_extremes(args["genome_fname"])
+        with profiler.stage("windows"):
+            regions = merge_windows(min_list, window, genome_length(args["genome_fname"]))
+            ori_windows = read_regions(args["genome_fname"], regions)
+        with profiler.stage("ori"):
+            max_approx_seqs = map_items(kernel, ori_windows, kernel_args, workers)
+    else:
+        with profiler.stage("load"):
+            genome = load_genome(args["genome_fname"])
+        cache = open_cache(args["cache_dir"])
+
+        if args["per_contig"]:
+            with profiler.stage("skew"):
+                rmq = load_or_build_rmq(args["genome_fname"], genome)
+            with profiler.stage("windows"):
+                regions = []
+                labels = []
+                for (name, start, length), (_, _, min_list) in zip(rmq.contigs, rmq.contig_minima()):
+                    contig_regions = merge_windows(min_list, window, length)
+                    regions.extend((start + lo, start + hi) for lo, hi in contig_regions)
+                    labels.extend("{} ori{}".format(name, i) for i in range(len(contig_regions)))
         else:
-            start = min_list[i] - window
-            stop = min_list[i] + window
-            genome_copy = genome_copy[start:stop]
+            with profiler.stage("skew"):
+                if cache is None:
+                    skew = tally(genome)
+                else:
+                    skew = cache.cached(genome, "skew", lambda: {"skew" : tally(genome)})["skew"]
 
-            max_approx_seq = approx_pattern(genome_copy, pattern_len, mismatches)
+                min_value, min_list, _, _ = skew_extremes(skew)
 
-            bounding_box["ori" + str(i)] = max_approx_seq
+            with profiler.stage("windows"):
+                regions = merge_windows(min_list, window, len(genome))
+
+        # windows are read from shared memory by the workers
+        with profiler.stage("ori"):
+            if cache is None or args["top_k"] is not None or args["per_contig"]:
+                max_approx_seqs = map_windows(kernel, genome, regions, kernel_args, workers)
+            else:
+                results = cache.cached(genome, "ori",
+                    lambda: analyse_windows(genome, regions, pattern_len, mismatches, workers),
+                    k=pattern_len, d=mismatches, window=window)
+                words = iter(results["words"])
+                max_approx_seqs = [[decode_kmer(int(next(words)), pattern_len) for _ in range(n)]
+                    for n in results["lengths"]]
+
+    if not args["per_contig"]:
+        labels = ["ori" + str(i) for i in range(len(regions))]
+    bounding_box = dict(zip(labels, max_approx_seqs))
 
     print('Possible DNA bounding boxes allowing {} mismatch(es) : '.format(mismatches), 
-    bounding_box)
\ No newline at end of file
+    bounding_box)
+
+    profiler.finish()
@@ -0,0 +1,152 @@
+from genome import BASE_CODES, PackedSequence, reverse_complement as _reverse_complement
+
+# ASCII letter -> 2-bit code, 4 for anything that is not A, C, G or T
+_SEARCH_TABLE = bytearray([4]) * 256
+for _base, _code in BASE_CODES.items():
+    _SEARCH_TABLE[ord(_base)] = _code
+_SEARCH_TABLE = bytes(_SEARCH_TABLE)
+
+def read_patterns(pattern_fname):
+    """
+    Reads a pattern library: one nucleotide sequence per line. Blank lines
+    and lines starting with '#' or '>' are skipped.
+
+    Parameters:
+        pattern_fname - str
+            file containing patterns.
+    Returns:
+        patterns - list of str
+            uppercase patterns in file order
+    """
+    patterns = []
+    with open(pattern_fname) as pattern_file:
+        for line in pattern_file:
+            line = line.strip()
+            if line and line[0] not in "#>":
+                patterns.append(line.upper())
+    return patterns
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over A, C, G, T. Every pattern is found in one
+    linear pass over the genome, whatever the number of patterns.
+
+    Failure links are folded into a complete transition table (4 entries
+    per state), so each base costs one list lookup. Non-ACGT bases send the
+    automaton back to the root, so no match spans an N.
+    """
+
+    def __init__(self, patterns):
+        """
+        Parameters:
+            patterns - list of str
+                nucleotide sequences of A, C, G, T. case insensitive.
+                patterns with other letters can never match
+        """
+        self.patterns = [pattern.upper() for pattern in patterns]
+
+        # trie, -1 = no edge yet
+        delta = [-1, -1, -1, -1]
+        outputs = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            if not pattern or any(base not in BASE_CODES for base in pattern):
+                continue
+            state = 0
+            for base in pattern:
+                edge = 4 * state + BASE_CODES[base]
+                if delta[edge] == -1:
+                    delta[edge] = len(outputs)
+                    delta.extend((-1, -1, -1, -1))
+                    outputs.append([])
+                state = delta[edge]
+            outputs[state].append(pattern_id)
+
+        # breadth first: fill missing edges from the failure state and
+        # inherit the failure state's outputs
+        fail = [0] * len(outputs)
+        queue = []
+        for code in range(4):
+            child = delta[code]
+            if child == -1:
+                delta[code] = 0
+            else:
+                queue.append(child)
+        for state in queue:
+            for code in range(4):
+                edge = 4 * state + code
+                child = delta[edge]
+                if child == -1:
+                    delta[edge] = delta[4 * fail[state] + code]
+                else:
+                    fail[child] = delta[4 * fail[state] + code]
+                    outputs[child] = outputs[child] + outputs[fail[child]]
+                    queue.append(child)
+
+        self._delta = delta
+        self._outputs = [tuple(output) for output in outputs]
+
+    def search(self, genome):
+        """
+        Finds every occurrence of every pattern.
+
+        Parameters:
+            genome - str or PackedSequence
+                whole genome nucleotide sequence. case insensitive
+        Returns:
+            positions - list of list of int
+                start positions of each pattern, in pattern order
+        """
+        if isinstance(genome, PackedSequence):
+            text = genome.to_bytes()
+        else:
+            text = genome.upper().encode("ascii", "replace")
+
+        lengths = [len(pattern) - 1 for pattern in self.patterns]
+        positions = [[] for _ in self.patterns]
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        for i, code in enumerate(text.translate(_SEARCH_TABLE)):
+            if code == 4:
+                state = 0
+                continue
+            state = delta[4 * state + code]
+            if outputs[state]:
+                for pattern_id in outputs[state]:
+                    positions[pattern_id].append(i - lengths[pattern_id])
+        return positions
+
+def multi_pattern_search(genome, patterns, reverse_complement=False):
+    """
+    Counts and locates a whole library of patterns in one pass over the
+    genome.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        patterns - list of str
+            nucleotide sequences to look for.
+        reverse_complement - bool
+            also look for the reverse complement of every pattern.
+    Returns:
+        results - list of dict
+            one per pattern, in pattern order, with keys
+            pattern - str
+            positions - list of int
+            reverse_complement_positions - list of int (only if
+                reverse_complement is set)
+    """
+    patterns = [pattern.upper() for pattern in patterns]
+    searched = list(patterns)
+    if reverse_complement:
+        searched += [_reverse_complement(pattern) for pattern in patterns]
+
+    found = AhoCorasick(searched).search(genome)
+
+    results = []
+    for pattern_id, pattern in enumerate(patterns):
+        result = {"pattern" : pattern, "positions" : found[pattern_id]}
+        if reverse_complement:
+            result["reverse_complement_positions"] = found[len(patterns) + pattern_id]
+        results.append(result)
+    return results
@@ -0,0 +1,297 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fasta import split_genome_fname
+from Find_Replication_Origin import approx_pattern, merge_windows, tally
+from genome import load_genome
+from parallel import default_workers
+from profiling import Profiler
+from skew import skew_extremes
+
+# files picked up from --genome_dir
+GENOME_EXTENSIONS = (".fa", ".fasta", ".fna", ".ffn", ".fas", ".txt")
+
+# settings every row is computed with, so a resumed run can check them
+PARAMETERS = ("pattern_len", "mismatches", "window")
+
+COLUMNS = ("genome", "length", "skew_min", "min_positions", "windows", "sequences",
+    "load_seconds", "skew_seconds", "ori_seconds", "seconds", "error") + PARAMETERS
+
+def parse_cmd_line(as_dict=False):
+    """
+    Description:
+        Parses the command line arguments for the program
+    Parameters:
+        as_dict - bool
+            Returns the args as a dict. Default=False
+    Returns:
+        The command line arguments as a dictionary or a Namespace object and the
+        parser used to parse the command line.
+    """
+
+    defaults = {
+        "genome_dir" : None,
+        "manifest" : None,
+        "output_fname" : "./ori_predictions.csv",
+        "pattern_len" : 9,
+        "mismatches" : 1,
+        "window" : 500,
+        "workers" : 0,
+        "resume" : False,
+        "profile" : None,
+        "profile_dump" : None
+    }
+
+    parser = argparse.ArgumentParser(
+        description="""Predicts the ori of many genomes: skew minima and the most frequent
+        pattern(s) with mismatches around them, one CSV row per genome. Genomes are
+        spread over a process pool, largest first.""",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--genome_dir",
+        type=str,
+        default=defaults["genome_dir"],
+        help="""Directory of genome files ({})""".format(" ".join(GENOME_EXTENSIONS))
+    )
+    parser.add_argument("--manifest",
+        type=str,
+        default=defaults["manifest"],
+        help="""File listing one genome file per line (file:contig allowed, # starts a comment)"""
+    )
+    parser.add_argument("--output_fname",
+        type=str,
+        default=defaults["output_fname"],
+        help="""CSV file to write a row per genome to, as each one finishes"""
+    )
+    parser.add_argument("--pattern_len",
+        type=int,
+        default=defaults["pattern_len"],
+        help="""Sample length of specified nucleotide sequence"""
+    )
+    parser.add_argument("--mismatches",
+        type=int,
+        default=defaults["mismatches"],
+        help="""Max amount of mismatches allowed"""
+    )
+    parser.add_argument("--window",
+        type=int,
+        default=defaults["window"],
+        help="""Value to subtract and add to skew min positions"""
+    )
+    parser.add_argument("--workers",
+        type=int,
+        default=defaults["workers"],
+        help="""Number of processes, one genome each at a time. 0 uses every core, 1 runs in this process"""
+    )
+    parser.add_argument("--resume",
+        action="store_true",
+        default=defaults["resume"],
+        help="""Keep the rows already in output_fname and only predict the genomes missing or
+        failed there. Refused if those rows were computed with another --pattern_len,
+        --mismatches or --window. Otherwise output_fname is overwritten"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
+    args = parser.parse_args()
+
+    if (args.genome_dir is None) == (args.manifest is None):
+        parser.error("give one of --genome_dir or --manifest")
+
+    if as_dict:
+        args = vars(args)
+    return args
+
+def list_genomes(genome_dir=None, manifest=None):
+    """
+    Returns the genome files of a directory (by extension) or listed in a
+    manifest, largest file first so the longest jobs start first and do
+    not finish last on an otherwise idle pool.
+
+    Returns:
+        genome_fnames - list of str
+    """
+    if genome_dir is not None:
+        genome_fnames = [os.path.join(genome_dir, fname) for fname in sorted(os.listdir(genome_dir))
+            if fname.lower().endswith(GENOME_EXTENSIONS)]
+    else:
+        genome_fnames = []
+        with open(manifest) as manifest_file:
+            for line in manifest_file:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    genome_fnames.append(line)
+
+    def size(genome_fname):
+        try:
+            return os.path.getsize(split_genome_fname(genome_fname)[0])
+        except OSError:
+            # reported as an error when predicted
+            return 0
+    return sorted(genome_fnames, key=size, reverse=True)
+
+def predict_ori(genome_fname, pattern_len, mismatches, window):
+    """
+    Predicts the ori of one genome file, timing each step. Errors are
+    reported in the row instead of raised, so one bad file does not stop
+    a batch.
+
+    Returns:
+        row - dict
+            COLUMNS -> value, ready for csv.DictWriter
+    """
+    row = dict.fromkeys(COLUMNS, "")
+    row.update(genome=genome_fname, pattern_len=pattern_len, mismatches=mismatches, window=window)
+    start = time.perf_counter()
+    try:
+        genome = load_genome(genome_fname)
+        loaded = time.perf_counter()
+        min_value, min_list, _, _ = skew_extremes(tally(genome))
+        skewed = time.perf_counter()
+        regions = merge_windows(min_list, window, len(genome))
+        sequences = [approx_pattern(genome.subsequence(lo, hi), pattern_len, mismatches)
+            for lo, hi in regions]
+        done = time.perf_counter()
+    except (OSError, ValueError, KeyError) as error:
+        row["error"] = "{}: {}".format(type(error).__name__, error)
+        row["seconds"] = "{:.4f}".format(time.perf_counter() - start)
+        return row
+
+    row.update({
+        "length" : len(genome),
+        "skew_min" : min_value,
+        "min_positions" : " ".join(map(str, min_list)),
+        # windows separated by ';', sequences of one window by ' '
+        "windows" : ";".join("{}-{}".format(lo, hi) for lo, hi in regions),
+        "sequences" : ";".join(" ".join(seqs) for seqs in sequences),
+        "load_seconds" : "{:.4f}".format(loaded - start),
+        "skew_seconds" : "{:.4f}".format(skewed - loaded),
+        "ori_seconds" : "{:.4f}".format(done - skewed),
+        "seconds" : "{:.4f}".format(done - start)
+    })
+    return row
+
+def read_done(output_fname, parameters):
+    """
+    Reads the rows of a previous run and truncates a row cut short by an
+    interrupted write, so appending resumes cleanly.
+
+    Parameters:
+        output_fname - str
+            CSV file of the previous run.
+        parameters - dict
+            PARAMETERS -> value of this run. the previous run must have
+            used the same, or its rows would be kept for the wrong settings
+    Returns:
+        done - set of str
+            genomes predicted without error
+    """
+    if not os.path.exists(output_fname):
+        return set()
+    with open(output_fname, "rb+") as output_file:
+        content = output_file.read()
+        complete = content.rfind(b"\n") + 1
+        if complete < len(content):
+            output_file.truncate(complete)
+    lines = content[:complete].decode("utf-8").splitlines()
+    reader = csv.DictReader(lines)
+    if lines and tuple(reader.fieldnames or ()) != COLUMNS:
+        raise ValueError("{} was not written with the columns of this version, "
+            "rerun without --resume or write to another file".format(output_fname))
+
+    done = set()
+    for row in reader:
+        previous = {name : row[name] for name in PARAMETERS}
+        if previous != {name : str(value) for name, value in parameters.items()}:
+            raise ValueError("{} was computed with {}, not {}: rerun without --resume or write "
+                "to another file".format(output_fname, _describe(previous), _describe(parameters)))
+        if not row["error"]:
+            done.add(row["genome"])
+    return done
+
+def _describe(parameters):
+    return ", ".join("--{} {}".format(name, parameters[name]) for name in PARAMETERS)
+
+def run_batch(genome_fnames, output_fname, pattern_len, mismatches, window, workers=0,
+        resume=False):
+    """
+    Predicts the ori of every genome and writes a CSV row per genome as
+    soon as it is done, so a killed run loses at most the genomes in
+    flight.
+
+    Parameters:
+        genome_fnames - list of str
+            genome files, in the order to schedule them.
+        output_fname - str
+            CSV file.
+        pattern_len, mismatches, window - int
+            as in Find_Replication_Origin.
+        workers - int
+            number of processes. 1 runs in this process, 0 uses every core.
+        resume - bool
+            skip the genomes already predicted in output_fname and append.
+            failed genomes are retried, so they may have several rows, the
+            last one being the latest attempt. a ValueError is raised if
+            output_fname was computed with other settings
+    Returns:
+        counts - dict
+            predicted, skipped and failed genomes
+    """
+    parameters = {"pattern_len" : pattern_len, "mismatches" : mismatches, "window" : window}
+    done = read_done(output_fname, parameters) if resume else set()
+    todo = [genome_fname for genome_fname in genome_fnames if genome_fname not in done]
+    counts = {"predicted" : 0, "skipped" : len(genome_fnames) - len(todo), "failed" : 0}
+
+    append = resume and os.path.exists(output_fname) and os.path.getsize(output_fname) > 0
+    with open(output_fname, "a" if append else "w", newline="") as output_file:
+        writer = csv.DictWriter(output_file, COLUMNS)
+        if not append:
+            writer.writeheader()
+
+        def write(row):
+            writer.writerow(row)
+            output_file.flush()
+            counts["failed" if row["error"] else "predicted"] += 1
+
+        if workers == 0:
+            workers = default_workers()
+        if workers <= 1 or len(todo) <= 1:
+            for genome_fname in todo:
+                write(predict_ori(genome_fname, pattern_len, mismatches, window))
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+                # submitted largest first, so the pool starts on them first
+                futures = [pool.submit(predict_ori, genome_fname, pattern_len, mismatches, window)
+                    for genome_fname in todo]
+                for future in as_completed(futures):
+                    write(future.result())
+    return counts
+
+if __name__ == "__main__":
+    args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
+
+    with profiler.stage("list"):
+        genome_fnames = list_genomes(args["genome_dir"], args["manifest"])
+    with profiler.stage("predict"):
+        try:
+            counts = run_batch(genome_fnames, args["output_fname"], args["pattern_len"],
+                args["mismatches"], args["window"], args["workers"], args["resume"])
+        except ValueError as error:
+            sys.exit("{}: error: {}".format(os.path.basename(sys.argv[0]), error))
+
+    print("{} genome(s) predicted, {} already done, {} failed : ".format(counts["predicted"],
+        counts["skipped"], counts["failed"]), args["output_fname"])
+
+    profiler.finish()
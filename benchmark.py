@@ -0,0 +1,347 @@
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import Find_Replication_Origin
+import problem1
+import problem2
+import problem3
+import problem4
+import problem5
+import problem6
+import problem7
+import problem8
+import problem9
+import problem10
+from genome import PackedSequence
+from profiling import Profiler
+
+GENOME_KINDS = ("random", "gc_biased", "repeat_rich")
+
+# G + C fraction of the gc_biased genomes
+GC_FRACTION = 0.65
+
+# fraction of a repeat_rich genome covered by copies of a few repeat units
+REPEAT_FRACTION = 0.5
+
+PATTERN = "ATGATCAAG"
+
+# name, function, arguments after the genome, whether the function takes a
+# str rather than a PackedSequence.
+# problem12.generator does not take a genome and is not timed.
+BENCHMARKS = [
+    ("problem1.pattern_count", problem1.pattern_count, (PATTERN,), False),
+    ("problem2.pattern_frequency", problem2.pattern_frequency, (9,), False),
+    ("problem3.reverse_complement", problem3.reverse_complement, (), True),
+    ("problem4.seq_position", problem4.seq_position, (PATTERN,), False),
+    ("problem5.clump_finder", problem5.clump_finder, (9, 500, 3), False),
+    ("problem6.tally", problem6.tally, (), False),
+    ("problem7.tally", problem7.tally, (), False),
+    ("problem8.approx_pattern", problem8.approx_pattern, (PATTERN, 1), False),
+    ("problem9.pattern_mismatch", problem9.pattern_mismatch, (PATTERN, 1), False),
+    ("problem9.approx_pattern", problem9.approx_pattern, (9, 1), False),
+    ("problem10.pattern_mismatch", problem10.pattern_mismatch, (PATTERN, 1), False),
+    ("problem10.approx_pattern", problem10.approx_pattern, (9, 1), False),
+    ("Find_Replication_Origin.tally", Find_Replication_Origin.tally, (), False),
+    ("Find_Replication_Origin.pattern_mismatch", Find_Replication_Origin.pattern_mismatch,
+        (PATTERN, 1), False),
+    ("Find_Replication_Origin.approx_pattern", Find_Replication_Origin.approx_pattern,
+        (9, 1), False),
+]
+
+def parse_cmd_line(as_dict=False):
+    """
+    Description:
+        Parses the command line arguments for the program
+    Parameters:
+        as_dict - bool
+            Returns the args as a dict. Default=False
+    Returns:
+        The command line arguments as a dictionary or a Namespace object and the
+        parser used to parse the command line.
+    """
+
+    defaults = {
+        "sizes" : [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8],
+        "kinds" : list(GENOME_KINDS),
+        "benchmarks" : None,
+        "repeats" : 3,
+        "max_seconds" : 10.0,
+        "seed" : 0,
+        "output_fname" : None,
+        "compare_fname" : None,
+        "profile" : None,
+        "profile_dump" : None
+    }
+
+    parser = argparse.ArgumentParser(
+        description="""Times every entry point function on synthetic genomes
+        of increasing size and reports throughput and scaling.""",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--sizes",
+        type=int,
+        nargs="+",
+        default=defaults["sizes"],
+        help="""Genome lengths to time, in bases"""
+    )
+    parser.add_argument("--kinds",
+        nargs="+",
+        choices=GENOME_KINDS,
+        default=defaults["kinds"],
+        help="""Kinds of synthetic genome to generate"""
+    )
+    parser.add_argument("--benchmarks",
+        nargs="+",
+        default=defaults["benchmarks"],
+        help="""Only time functions whose name contains one of these. All if not set"""
+    )
+    parser.add_argument("--repeats",
+        type=int,
+        default=defaults["repeats"],
+        help="""Runs per function and size. The fastest is kept"""
+    )
+    parser.add_argument("--max_seconds",
+        type=float,
+        default=defaults["max_seconds"],
+        help="""Skip larger sizes of a function once one run is predicted to take longer than this"""
+    )
+    parser.add_argument("--seed",
+        type=int,
+        default=defaults["seed"],
+        help="""Seed of the synthetic genomes. Same seed, same genomes"""
+    )
+    parser.add_argument("--output_fname",
+        type=str,
+        default=defaults["output_fname"],
+        help="""File to save the results to as JSON"""
+    )
+    parser.add_argument("--compare_fname",
+        type=str,
+        default=defaults["compare_fname"],
+        help="""JSON results of an earlier run to compare against"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to,
+        one stage per benchmark, kind and size. '-' writes it to stderr. Tracing memory slows
+        the timed runs down"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
+    args = parser.parse_args()
+
+    if as_dict:
+        args = vars(args)
+    return args
+
+def _base_table(gc_fraction):
+    """
+    Returns a 256 byte translate table turning uniform random bytes into
+    bases, with G or C for about gc_fraction of the bytes.
+    """
+    n_gc = round(256 * gc_fraction)
+    table = (b"GC" * 128)[:n_gc] + (b"AT" * 128)[:256 - n_gc]
+    return bytes(table)
+
+_COMPLEMENT = bytes.maketrans(b"ACGT", b"TGCA")
+
+def synthetic_genome(length, kind="random", seed=0):
+    """
+    Generates a deterministic synthetic genome: the same arguments always
+    give the same sequence.
+
+    Parameters:
+        length - int
+            number of bases.
+        kind - str
+            random - uniform A, C, G, T
+            gc_biased - GC_FRACTION G + C
+            repeat_rich - random, with REPEAT_FRACTION of it overwritten by
+                mutated (and sometimes reverse complemented) copies of a
+                few repeat units
+        seed - int
+    Returns:
+        genome - bytes
+            uppercase ASCII
+    """
+    rng = random.Random("{}-{}-{}".format(kind, length, seed))
+    gc_fraction = GC_FRACTION if kind == "gc_biased" else 0.5
+    genome = bytearray(rng.randbytes(length).translate(_base_table(gc_fraction)))
+
+    if kind == "repeat_rich" and length >= 100:
+        units = []
+        for _ in range(8):
+            unit_len = rng.randint(50, min(2000, length // 2))
+            units.append(rng.randbytes(unit_len).translate(_base_table(0.5)))
+
+        covered = 0
+        while covered < REPEAT_FRACTION * length:
+            copy = bytearray(rng.choice(units))
+            # about 2% point mutations per copy
+            for _ in range(len(copy) // 50):
+                copy[rng.randrange(len(copy))] = rng.choice(b"ACGT")
+            if rng.random() < 0.5:
+                copy = copy.translate(_COMPLEMENT)[::-1]
+            start = rng.randrange(length - len(copy) + 1)
+            genome[start:start + len(copy)] = copy
+            covered += len(copy)
+
+    return bytes(genome)
+
+def time_call(function, args, repeats):
+    """
+    Returns the fastest wall time (seconds) of function(*args) over repeats
+    runs.
+    """
+    best = math.inf
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def scaling_exponent(sizes, seconds):
+    """
+    Fits seconds = c * size ** exponent by least squares on the log-log
+    points. About 1 for linear functions, 2 for quadratic ones.
+
+    Returns:
+        exponent - float or None
+            None with fewer than two usable points
+    """
+    points = [(math.log(size), math.log(t)) for size, t in zip(sizes, seconds) if t > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+def run_benchmarks(sizes, kinds, benchmarks, repeats, max_seconds, seed, profiler=None):
+    """
+    Times every benchmark on every kind and size of synthetic genome.
+    Once a function's next size is predicted (from its last time and
+    scaling so far) to take longer than max_seconds, its larger sizes are
+    skipped. With a profiler, each timed benchmark, kind and size is a
+    stage.
+
+    Returns:
+        results - list of dict
+            benchmark, kind, size, seconds, bases_per_sec
+        scaling - dict
+            "benchmark kind" -> scaling exponent
+    """
+    if profiler is None:
+        profiler = Profiler()
+    sizes = sorted(sizes)
+    results = []
+    timings = {}
+    for kind in kinds:
+        for size in sizes:
+            todo = []
+            for name, function, args, takes_str in benchmarks:
+                key = "{} {}".format(name, kind)
+                done = timings.setdefault(key, ([], []))
+                if done[0]:
+                    exponent = scaling_exponent(*done) or 1.0
+                    predicted = done[1][-1] * (size / done[0][-1]) ** max(exponent, 1.0)
+                    if predicted > max_seconds:
+                        continue
+                todo.append((name, function, args, takes_str, done))
+            # large genomes take a while to generate, only make the ones and
+            # the forms (str, PackedSequence) that are timed
+            if not todo:
+                continue
+            text = synthetic_genome(size, kind, seed)
+            genome = None
+            if not all(takes_str for _, _, _, takes_str, _ in todo):
+                genome = PackedSequence(text)
+            text = text.decode("ascii") if any(takes_str for _, _, _, takes_str, _ in todo) else None
+
+            for name, function, args, takes_str, done in todo:
+                with profiler.stage("{} {} {}".format(name, kind, size)):
+                    seconds = time_call(function, (text if takes_str else genome,) + args, repeats)
+                done[0].append(size)
+                done[1].append(seconds)
+                results.append({
+                    "benchmark" : name,
+                    "kind" : kind,
+                    "size" : size,
+                    "seconds" : seconds,
+                    "bases_per_sec" : size / seconds if seconds > 0 else None
+                })
+                print("{:<45} {:<12} {:>11,} {:>10.4f} s {:>14,.0f} bases/s".format(
+                    name, kind, size, seconds, size / seconds if seconds > 0 else 0),
+                    flush=True)
+
+    scaling = {key : scaling_exponent(*done) for key, done in timings.items()}
+    return results, scaling
+
+def compare(results, previous):
+    """
+    Prints the speedup of every (benchmark, kind, size) timed in both runs.
+    Above 1 is faster than the previous run.
+    """
+    before = {(r["benchmark"], r["kind"], r["size"]) : r["seconds"] for r in previous["results"]}
+    print("\nSpeedup vs previous run:")
+    for r in results:
+        key = (r["benchmark"], r["kind"], r["size"])
+        if key in before and r["seconds"] > 0:
+            print("{:<45} {:<12} {:>11,} {:>8.2f}x".format(*key, before[key] / r["seconds"]))
+
+if __name__ == "__main__":
+    args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
+
+    benchmarks = BENCHMARKS
+    if args["benchmarks"]:
+        benchmarks = [b for b in BENCHMARKS if any(s in b[0] for s in args["benchmarks"])]
+
+    results, scaling = run_benchmarks(args["sizes"], args["kinds"], benchmarks,
+        args["repeats"], args["max_seconds"], args["seed"], profiler)
+
+    print("\nScaling exponents (seconds ~ size ** exponent):")
+    for key, exponent in scaling.items():
+        print("{:<58} {}".format(key, "n/a" if exponent is None else "{:.2f}".format(exponent)))
+
+    report = {
+        "meta" : {
+            "python" : platform.python_version(),
+            "platform" : platform.platform(),
+            "numpy" : np is not None,
+            "cpu_count" : os.cpu_count(),
+            "seed" : args["seed"],
+            "repeats" : args["repeats"],
+            "time" : time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "results" : results,
+        "scaling" : scaling
+    }
+
+    if args["compare_fname"]:
+        with open(args["compare_fname"]) as previous_file:
+            compare(results, json.load(previous_file))
+
+    if args["output_fname"]:
+        with open(args["output_fname"], "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    profiler.finish()
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import struct
+import tempfile
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from genome import PackedSequence
+
+MAGIC = b"GCACHE01"
+
+# default size limit of a cache directory, in bytes
+DEFAULT_MAX_BYTES = 1 << 30
+
+# number of arrays in an entry
+_ENTRY_HEADER = struct.Struct("<8sI")
+# name length, typecode, item count
+_ARRAY_HEADER = struct.Struct("<Hcq")
+
+def genome_digest(genome):
+    """
+    Content hash of a genome. Two genomes with the same bases (and masked
+    positions) have the same digest whatever file they came from.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+    Returns:
+        digest - str
+            hex sha256
+    """
+    if not isinstance(genome, PackedSequence):
+        genome = PackedSequence(genome)
+    packed, mask = genome.packed
+    digest = hashlib.sha256(struct.pack("<Q", len(genome)))
+    digest.update(packed)
+    if mask is not None:
+        digest.update(mask)
+    return digest.hexdigest()
+
+def _typecode(values):
+    if np is not None and isinstance(values, np.ndarray):
+        return np.dtype(values.dtype).char
+    return values.typecode
+
+def _as_array(values, typecode):
+    """
+    Turns a list into an array.array. arrays (NumPy or not) are kept as is.
+    """
+    if isinstance(values, array) or (np is not None and isinstance(values, np.ndarray)):
+        return values
+    return array(typecode, values)
+
+class GenomeCache:
+    """
+    On-disk cache of results computed from a genome (skew arrays, k-mer
+    tables...). Entries are keyed by the genome's content hash plus the
+    parameters used, so editing the genome file invalidates them
+    automatically. Each entry is a small binary file of named flat arrays.
+
+    The directory is kept under max_bytes by evicting the least recently
+    used entries; reading an entry marks it as used.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Parameters:
+            cache_dir - str
+                directory to keep entries in. created if missing.
+            max_bytes - int
+                size limit of the directory.
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._digests = {}
+
+    def _digest(self, genome):
+        key = id(genome)
+        if key not in self._digests or self._digests[key][0] is not genome:
+            self._digests[key] = (genome, genome_digest(genome))
+        return self._digests[key][1]
+
+    def entry_fname(self, genome, kind, **params):
+        """
+        Returns the file an entry is stored in.
+
+        Parameters:
+            genome - str or PackedSequence
+                genome the entry was computed from.
+            kind - str
+                what is stored, e.g. "skew" or "kmer_counts".
+            params - int or str
+                parameters the result depends on (k, d, window...).
+        """
+        parts = [self._digest(genome)[:32], kind]
+        parts += ["{}={}".format(name, params[name]) for name in sorted(params)]
+        return os.path.join(self.cache_dir, "-".join(parts) + ".bin")
+
+    def get(self, genome, kind, **params):
+        """
+        Reads an entry.
+
+        Returns:
+            arrays - dict of str to array, or None on a miss
+                NumPy arrays when NumPy is installed, array.array otherwise.
+        """
+        fname = self.entry_fname(genome, kind, **params)
+        try:
+            with open(fname, "rb") as entry_file:
+                data = entry_file.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            arrays = _decode(data)
+        except (ValueError, struct.error):
+            os.remove(fname)
+            return None
+        os.utime(fname)
+        return arrays
+
+    def put(self, genome, kind, arrays, **params):
+        """
+        Writes an entry, then evicts old entries if the cache is too big.
+
+        Parameters:
+            arrays - dict of str to array or list
+                flat arrays to store. lists are stored as int64.
+        """
+        fname = self.entry_fname(genome, kind, **params)
+        handle, tmp_fname = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(handle, "wb") as entry_file:
+            entry_file.write(_ENTRY_HEADER.pack(MAGIC, len(arrays)))
+            for name, values in arrays.items():
+                values = _as_array(values, "q")
+                encoded = name.encode("utf-8")
+                entry_file.write(_ARRAY_HEADER.pack(len(encoded),
+                    _typecode(values).encode("ascii"), len(values)))
+                entry_file.write(encoded)
+                entry_file.write(memoryview(values).cast("B"))
+        os.replace(tmp_fname, fname)
+        self.evict()
+
+    def cached(self, genome, kind, compute, **params):
+        """
+        Returns the entry if present, otherwise runs compute(), stores what
+        it returns and returns that.
+
+        Parameters:
+            compute - function
+                takes no arguments, returns a dict of arrays.
+        """
+        arrays = self.get(genome, kind, **params)
+        if arrays is None:
+            arrays = compute()
+            self.put(genome, kind, arrays, **params)
+        return arrays
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache fits in
+        max_bytes.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".bin"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def _decode(data):
+    magic, n_arrays = _ENTRY_HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a cache entry")
+
+    arrays = {}
+    offset = _ENTRY_HEADER.size
+    for _ in range(n_arrays):
+        name_len, typecode, count = _ARRAY_HEADER.unpack_from(data, offset)
+        offset += _ARRAY_HEADER.size
+        name = data[offset:offset + name_len].decode("utf-8")
+        offset += name_len
+
+        typecode = typecode.decode("ascii")
+        if np is not None:
+            # raises ValueError if the entry is truncated
+            values = np.frombuffer(data, dtype=np.dtype(typecode), count=count, offset=offset)
+        else:
+            values = array(typecode)
+            values.frombytes(data[offset:offset + values.itemsize * count])
+            if len(values) != count:
+                raise ValueError("truncated cache entry")
+        offset += values.itemsize * count
+        arrays[name] = values
+    return arrays
+
+def open_cache(cache_dir):
+    """
+    Returns a GenomeCache for cache_dir, or None if cache_dir is None (the
+    --cache_dir default, caching off). The size limit can be changed with
+    the GENOME_CACHE_MAX_BYTES environment variable.
+    """
+    if cache_dir is None:
+        return None
+    max_bytes = int(os.environ.get("GENOME_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    return GenomeCache(cache_dir, max_bytes)
@@ -0,0 +1,326 @@
+import mmap
+import os
+
+WHITESPACE = b" \t\r\n\v\f"
+
+# uppercases ASCII letters, leaves every other byte alone
+_UPPERCASE = bytes.maketrans(
+    b"abcdefghijklmnopqrstuvwxyz",
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+)
+
+# complement of every IUPAC nucleotide letter, case kept (R <-> Y, K <-> M,
+# B <-> V, D <-> H; S, W and N are their own complement). Other bytes are
+# left alone
+COMPLEMENT = bytes.maketrans(
+    b"ACGTRYKMBVDHacgtrykmbvdh",
+    b"TGCAYRMKVBHDtgcayrmkvbhd"
+)
+
+def normalize(sequence):
+    """
+    Uppercases a raw nucleotide sequence and strips line breaks and other
+    whitespace in a single bulk pass.
+
+    Parameters:
+        sequence - bytes-like
+            raw sequence lines.
+    Returns:
+        sequence - bytes
+            uppercase sequence with no whitespace.
+    """
+    return bytes(sequence).translate(_UPPERCASE, WHITESPACE)
+
+def split_genome_fname(genome_fname):
+    """
+    Splits a --genome_fname value of the form 'file' or 'file:contig'.
+
+    A name that exists on disk as given is always treated as a plain file
+    name, so paths containing ':' still work.
+
+    Parameters:
+        genome_fname - str
+            file name, optionally followed by ':' and a contig name.
+    Returns:
+        fname - str
+        contig - str or None
+    """
+    genome_fname = os.path.expanduser(genome_fname)
+    if os.path.exists(genome_fname) or ":" not in genome_fname:
+        return genome_fname, None
+    fname, contig = genome_fname.rsplit(":", 1)
+    return fname, contig
+
+class FastaRecord:
+    """
+    One contig of a FASTA file. The record only holds offsets into the
+    memory-mapped file; nothing is copied until sequence() is called.
+    """
+
+    def __init__(self, buffer, name, description, start, stop):
+        """
+        Parameters:
+            buffer - mmap or bytes
+                contents of the whole file.
+            name - str
+                first word of the header line.
+            description - str
+                whole header line without the '>'.
+            start, stop - int
+                byte offsets of the sequence lines in buffer.
+        """
+        self._buffer = buffer
+        self.name = name
+        self.description = description
+        self.start = start
+        self.stop = stop
+
+    def __repr__(self):
+        return "FastaRecord('{}', bytes {}-{})".format(self.name, self.start, self.stop)
+
+    @property
+    def view(self):
+        """
+        Zero-copy memoryview of the raw sequence lines (line breaks and
+        original case included).
+        """
+        return memoryview(self._buffer)[self.start:self.stop]
+
+    def sequence(self):
+        """
+        Returns the uppercase sequence with line breaks removed.
+        """
+        return normalize(self._buffer[self.start:self.stop])
+
+    def chunks(self, chunk_size=1 << 22):
+        """
+        Yields the normalized sequence in pieces of at most chunk_size raw
+        bytes, so a contig can be processed without holding it in memory.
+        """
+        for start in range(self.start, self.stop, chunk_size):
+            yield normalize(self._buffer[start:min(start + chunk_size, self.stop)])
+
+class FastaFile:
+    """
+    Memory-mapped FASTA / multi-FASTA reader. Files without a '>' header are
+    read as a single record named after the file.
+
+    Records are parsed lazily the first time they are iterated over, so
+    opening a multi-GB assembly costs nothing until a contig is needed.
+
+    Usage:
+        with FastaFile("assembly.fa") as fasta:
+            for record in fasta:
+                print(record.name, len(record.sequence()))
+    """
+
+    def __init__(self, fname):
+        """
+        Parameters:
+            fname - str
+                FASTA or plain sequence file.
+        """
+        self.fname = fname
+        self._file = open(fname, "rb")
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._buffer = b""
+        else:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Releases the memory map. Record views must not be used afterwards.
+        """
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+    def __iter__(self):
+        if self._records is not None:
+            yield from self._records
+            return
+
+        records = []
+        for record in self._parse():
+            records.append(record)
+            yield record
+        self._records = records
+
+    def __len__(self):
+        return len(self.records())
+
+    def __getitem__(self, name):
+        for record in self:
+            if record.name == name:
+                return record
+        raise KeyError("No contig named '{}' in {}".format(name, self.fname))
+
+    def records(self):
+        """
+        Returns every record in the file as a list.
+        """
+        if self._records is None:
+            for _ in self:
+                pass
+        return self._records
+
+    def names(self):
+        """
+        Returns the contig names in file order.
+        """
+        return [record.name for record in self.records()]
+
+    def _parse(self):
+        buffer = self._buffer
+        size = len(buffer)
+        pos = 0
+        while pos < size and buffer[pos:pos + 1] in WHITESPACE:
+            pos += 1
+
+        if pos >= size or buffer[pos:pos + 1] != b">":
+            name = os.path.splitext(os.path.basename(self.fname))[0]
+            yield FastaRecord(buffer, name, name, pos, size)
+            return
+
+        while pos < size:
+            header_end = buffer.find(b"\n", pos)
+            if header_end == -1:
+                header_end = size
+            description = bytes(buffer[pos + 1:header_end]).decode("ascii", "replace").strip()
+            name = description.split()[0] if description else ""
+
+            start = min(header_end + 1, size)
+            if buffer[start:start + 1] == b">":
+                stop = start
+            else:
+                stop = buffer.find(b"\n>", start)
+            if stop == start:
+                next_pos = start
+            elif stop == -1:
+                stop = size
+                next_pos = size
+            else:
+                stop += 1
+                next_pos = stop
+
+            yield FastaRecord(buffer, name, description, start, stop)
+            pos = next_pos
+
+def stream_sequence(genome_fname, chunk_size=1 << 22):
+    """
+    Yields the normalized sequence of a genome file chunk by chunk, in the
+    same coordinates as genome.load_genome() (contigs joined by one 'N').
+    Memory use is bounded by chunk_size whatever the size of the file.
+
+    Parameters:
+        genome_fname - str
+            file containing genome, optionally followed by ':contig'.
+        chunk_size - int
+            raw bytes read per chunk.
+    Yields:
+        chunk - bytes
+            uppercase sequence with no whitespace. may be empty
+    """
+    fname, contig = split_genome_fname(genome_fname)
+    with FastaFile(fname) as fasta:
+        if contig is not None:
+            records = [fasta[contig]]
+        else:
+            records = fasta
+        for n, record in enumerate(records):
+            if n > 0:
+                yield b"N"
+            yield from record.chunks(chunk_size)
+
+def genome_length(genome_fname, chunk_size=1 << 22):
+    """
+    Returns the number of bases in load_genome() coordinates, found with one
+    streaming pass.
+    """
+    return sum(len(chunk) for chunk in stream_sequence(genome_fname, chunk_size))
+
+def read_regions(genome_fname, regions, chunk_size=1 << 22):
+    """
+    Extracts several regions of a genome file in one streaming pass.
+
+    Parameters:
+        genome_fname - str
+            file containing genome, optionally followed by ':contig'.
+        regions - list of (int, int)
+            [start, stop) positions in load_genome() coordinates.
+    Returns:
+        sequences - list of str or None
+            one entry per region, None if the region runs off either end of
+            the genome.
+    """
+    pieces = [[] for _ in regions]
+    pos = 0
+    for chunk in stream_sequence(genome_fname, chunk_size):
+        chunk_stop = pos + len(chunk)
+        for n, (start, stop) in enumerate(regions):
+            if start < chunk_stop and stop > pos:
+                pieces[n].append(chunk[max(start - pos, 0):stop - pos])
+        pos = chunk_stop
+
+    sequences = []
+    for (start, stop), piece in zip(regions, pieces):
+        if start < 0 or stop > pos:
+            sequences.append(None)
+        else:
+            sequences.append(b"".join(piece).decode("ascii", "replace"))
+    return sequences
+
+def write_reverse_complement(genome_fname, out_fname, chunk_size=1 << 22, line_width=60):
+    """
+    Writes the reverse complement of every contig of a genome file as FASTA,
+    reading each contig backwards from the end of the file in chunks.
+    Memory use is bounded by chunk_size whatever the size of the file.
+    Case is kept and IUPAC codes are complemented.
+
+    Parameters:
+        genome_fname - str
+            file containing genome, optionally followed by ':contig'.
+        out_fname - str
+            FASTA file to write. contigs keep their order, and their names
+            get a '_rc' suffix.
+        chunk_size - int
+            raw bytes read per chunk.
+        line_width - int
+            bases per output line.
+    """
+    fname, contig = split_genome_fname(genome_fname)
+    with FastaFile(fname) as fasta, open(out_fname, "wb") as out_file:
+        if contig is not None:
+            records = [fasta[contig]]
+        else:
+            records = fasta
+        for record in records:
+            header = record.name + "_rc"
+            if record.description != record.name:
+                header += record.description[len(record.name):]
+            out_file.write(b">" + header.encode("ascii", "replace") + b"\n")
+
+            # bases left over from the last chunk, shorter than a line
+            pending = b""
+            view = record.view
+            # released even on error, or closing the mmap raises BufferError
+            try:
+                for stop in range(len(view), 0, -chunk_size):
+                    piece = bytes(view[max(0, stop - chunk_size):stop])
+                    pending += piece.translate(COMPLEMENT, WHITESPACE)[::-1]
+                    n_full = len(pending) - len(pending) % line_width
+                    if n_full:
+                        out_file.write(b"\n".join(pending[i:i + line_width]
+                            for i in range(0, n_full, line_width)) + b"\n")
+                    pending = pending[n_full:]
+            finally:
+                view.release()
+            if pending:
+                out_file.write(pending + b"\n")
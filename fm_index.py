@@ -0,0 +1,320 @@
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from fasta import split_genome_fname
+from genome import PackedSequence, load_genome
+
+MAGIC = b"FMINDEX1"
+
+# symbols of the indexed text in sort order. '$' ends the text
+SYMBOLS = b"$ACGTN"
+
+# BWT positions between two stored occurrence checkpoints
+CHECKPOINT = 64
+
+# magic, text length (with '$'), source size, source mtime (ns)
+_HEADER = struct.Struct("<8sQQQ")
+
+def index_fname(genome_fname):
+    """
+    Returns the file the index of genome_fname is saved to: next to the
+    genome file, with the contig name (if any) in the file name.
+
+    Parameters:
+        genome_fname - str
+            file containing genome, optionally followed by ':contig'.
+    Returns:
+        fname - str
+    """
+    fname, contig = split_genome_fname(genome_fname)
+    if contig is None:
+        return fname + ".fmi"
+    return "{}.{}.fmi".format(fname, contig)
+
+# letter -> rank in SYMBOLS (A=1 ... N=5)
+_RANK_TABLE = bytes.maketrans(b"ACGTN", b"\x01\x02\x03\x04\x05")
+
+def _ranks(genome):
+    """
+    Returns the text as ranks in SYMBOLS order followed by the '$'
+    terminator (0).
+    """
+    return genome.to_bytes().translate(_RANK_TABLE) + b"\0"
+
+def _suffix_array(text):
+    """
+    Builds the suffix array of text by prefix doubling: suffixes are
+    sorted by their first h symbols, then by (rank of first h, rank of
+    next h), doubling h until every rank is distinct.
+
+    Parameters:
+        text - bytes
+            ranks of the text, ending with a unique smallest 0.
+    Returns:
+        sa - numpy.ndarray or list of int
+    """
+    n = len(text)
+    if np is not None:
+        rank = np.frombuffer(text, dtype=np.uint8).astype(np.int64)
+        h = 1
+        while True:
+            second = np.zeros(n, dtype=np.int64)
+            second[:n - h] = rank[h:]
+            sa = np.lexsort((second, rank))
+            first_sorted = rank[sa]
+            second_sorted = second[sa]
+            new = np.empty(n, dtype=bool)
+            new[0] = True
+            new[1:] = ((first_sorted[1:] != first_sorted[:-1])
+                | (second_sorted[1:] != second_sorted[:-1]))
+            rank = np.empty(n, dtype=np.int64)
+            rank[sa] = np.cumsum(new)
+            if rank.max() == n or h >= n:
+                return sa
+            h *= 2
+
+    rank = list(text)
+    h = 1
+    while True:
+        width = n + 1
+        keys = [rank[i] * width + (rank[i + h] if i + h < n else 0) for i in range(n)]
+        sa = sorted(range(n), key=keys.__getitem__)
+        new_rank = [0] * n
+        current = 1
+        new_rank[sa[0]] = current
+        for previous, i in zip(sa, sa[1:]):
+            if keys[i] != keys[previous]:
+                current += 1
+            new_rank[i] = current
+        rank = new_rank
+        if current == n or h >= n:
+            return sa
+        h *= 2
+
+class FMIndex:
+    """
+    Suffix array + FM-index of one genome. Built once, saved next to the
+    genome file and memory-mapped on later runs.
+
+    count() runs a backward search in O(len(pattern)) and locate() reads
+    the matching suffix array interval, O(len(pattern) + occurrences).
+    Patterns containing non-ACGT bases never match.
+    """
+
+    def __init__(self, sa, bwt, checkpoints, counts, buffer=None):
+        """
+        Use build() or load() rather than calling this directly.
+
+        Parameters:
+            sa - sequence of int
+                suffix array of the text including '$'.
+            bwt - bytes-like
+                Burrows-Wheeler transform, as ranks (0 = '$').
+            checkpoints - sequence of int
+                occurrences of each of the 6 symbols in bwt[:i * CHECKPOINT].
+            counts - list of int
+                number of symbols smaller than each symbol (the C array).
+            buffer - mmap or None
+                map backing the other arguments, kept open while in use.
+        """
+        self._sa = sa
+        self._bwt = bwt
+        self._checkpoints = checkpoints
+        self._counts = counts
+        self._buffer = buffer
+
+    def __len__(self):
+        """
+        Length of the indexed genome (without '$').
+        """
+        return len(self._bwt) - 1
+
+    @classmethod
+    def build(cls, genome):
+        """
+        Builds the index of a genome.
+
+        Parameters:
+            genome - str or PackedSequence
+                whole genome nucleotide sequence.
+        Returns:
+            index - FMIndex
+        """
+        if not isinstance(genome, PackedSequence):
+            genome = PackedSequence(genome)
+        text = _ranks(genome)
+        n = len(text)
+        sa = _suffix_array(text)
+        n_symbols = len(SYMBOLS)
+
+        if np is not None:
+            ranks = np.frombuffer(text, dtype=np.uint8)
+            sa = sa.astype(np.uint32)
+            bwt = ranks[(sa.astype(np.int64) - 1) % n].tobytes()
+            bwt_ranks = np.frombuffer(bwt, dtype=np.uint8)
+            checkpoints = np.zeros((n // CHECKPOINT + 1, n_symbols), dtype=np.uint32)
+            for symbol in range(n_symbols):
+                running = np.cumsum(bwt_ranks == symbol, dtype=np.uint32)
+                checkpoints[1:, symbol] = running[CHECKPOINT - 1::CHECKPOINT]
+            checkpoints = checkpoints.ravel()
+        else:
+            sa = array("I", sa)
+            bwt = bytes(text[i - 1] for i in sa)
+            checkpoints = array("I", [0] * n_symbols)
+            running = [0] * n_symbols
+            for i, symbol in enumerate(bwt, 1):
+                running[symbol] += 1
+                if i % CHECKPOINT == 0:
+                    checkpoints.extend(running)
+
+        counts = []
+        total = 0
+        for symbol in range(n_symbols):
+            counts.append(total)
+            total += text.count(symbol)
+        return cls(sa, bwt, checkpoints, counts)
+
+    def save(self, fname, source_size=0, source_mtime_ns=0):
+        """
+        Writes the index to fname. The size and mtime of the genome file are
+        stored so load() can tell when the index is stale.
+        """
+        # written aside and renamed over fname, so processes that have the
+        # old index memory-mapped keep reading the old file
+        handle, tmp_fname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)),
+            suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as index_file:
+                index_file.write(_HEADER.pack(MAGIC, len(self._bwt), source_size, source_mtime_ns))
+                index_file.write(struct.pack("<{}Q".format(len(SYMBOLS)), *self._counts))
+                for section in (self._sa, self._checkpoints, self._bwt):
+                    index_file.write(memoryview(section).cast("B"))
+            os.replace(tmp_fname, fname)
+        except BaseException:
+            os.unlink(tmp_fname)
+            raise
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Memory-maps an index written by save(). Nothing is read into memory
+        beyond the header.
+
+        Returns:
+            index - FMIndex
+            source_size, source_mtime_ns - int
+                genome file stats recorded when the index was saved.
+        """
+        with open(fname, "rb") as index_file:
+            buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, source_size, source_mtime_ns = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            buffer.close()
+            raise ValueError("{} is not an FM-index file".format(fname))
+
+        n_symbols = len(SYMBOLS)
+        offset = _HEADER.size
+        counts = list(struct.unpack_from("<{}Q".format(n_symbols), buffer, offset))
+        offset += 8 * n_symbols
+
+        view = memoryview(buffer)
+        sa = view[offset:offset + 4 * n].cast("I")
+        offset += 4 * n
+        n_checkpoints = (n // CHECKPOINT + 1) * n_symbols
+        checkpoints = view[offset:offset + 4 * n_checkpoints].cast("I")
+        offset += 4 * n_checkpoints
+        bwt = view[offset:offset + n]
+        return cls(sa, bwt, checkpoints, counts, buffer), source_size, source_mtime_ns
+
+    def close(self):
+        """
+        Releases the memory map of a loaded index.
+        """
+        if self._buffer is not None:
+            self._sa = self._bwt = self._checkpoints = None
+            self._buffer.close()
+            self._buffer = None
+
+    def _occ(self, symbol, i):
+        """
+        Number of symbol in bwt[:i].
+        """
+        block = i // CHECKPOINT
+        start = block * CHECKPOINT
+        return (self._checkpoints[block * len(SYMBOLS) + symbol]
+            + bytes(self._bwt[start:i]).count(symbol))
+
+    def interval(self, pattern):
+        """
+        Backward search. Returns the [lo, hi) suffix array interval of the
+        suffixes starting with pattern.
+        """
+        lo, hi = 0, len(self._bwt)
+        # case sensitive, and N matches the N of masked bases, like a scan of
+        # str(genome)
+        for base in reversed(pattern):
+            symbol = SYMBOLS.find(base.encode("ascii", "replace"))
+            if symbol <= 0:
+                return 0, 0
+            lo = self._counts[symbol] + self._occ(symbol, lo)
+            hi = self._counts[symbol] + self._occ(symbol, hi)
+            if lo >= hi:
+                return 0, 0
+        return lo, hi
+
+    def count(self, pattern):
+        """
+        Counts the occurrences of pattern. case sensitive. the empty
+        pattern occurs once per base, as in problem1.pattern_count
+        """
+        if not pattern:
+            return len(self)
+        lo, hi = self.interval(pattern)
+        return hi - lo
+
+    def locate(self, pattern):
+        """
+        Returns the positions of pattern in increasing order.
+        """
+        lo, hi = self.interval(pattern)
+        return sorted(int(i) for i in self._sa[lo:hi])
+
+def load_or_build_index(genome_fname, genome=None):
+    """
+    Memory-maps the saved index of a genome file, building and saving it
+    first if it is missing or older than the genome file.
+
+    Parameters:
+        genome_fname - str
+            file containing genome, optionally followed by ':contig'.
+        genome - PackedSequence or None
+            the already loaded genome, to avoid reading it again on a build.
+    Returns:
+        index - FMIndex
+    """
+    fname, _ = split_genome_fname(genome_fname)
+    stat = os.stat(fname)
+    saved = index_fname(genome_fname)
+
+    if os.path.exists(saved):
+        try:
+            index, size, mtime_ns = FMIndex.load(saved)
+        except (ValueError, struct.error):
+            index = None
+        if index is not None:
+            if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                return index
+            index.close()
+
+    if genome is None:
+        genome = load_genome(genome_fname)
+    FMIndex.build(genome).save(saved, stat.st_size, stat.st_mtime_ns)
+    return FMIndex.load(saved)[0]
@@ -0,0 +1,439 @@
+from fasta import COMPLEMENT, FastaFile, WHITESPACE, split_genome_fname
+
+# 2-bit base codes. Complement of a code is 3 - code.
+BASES = "ACGT"
+BASE_CODES = {"A" : 0, "C" : 1, "G" : 2, "T" : 3}
+
+# byte -> 2-bit code (non-ACGT bytes map to 0 and are recorded in the mask)
+_CODE_TABLE = bytearray(256)
+# byte -> 1 if the byte is not an ACGT base (either case), else 0
+_MASK_TABLE = bytearray([1]) * 256
+for _base, _code in BASE_CODES.items():
+    for _char in (_base, _base.lower()):
+        _CODE_TABLE[ord(_char)] = _code
+        _MASK_TABLE[ord(_char)] = 0
+_CODE_TABLE = bytes(_CODE_TABLE)
+_MASK_TABLE = bytes(_MASK_TABLE)
+
+# 2-bit code -> its high bit / its low bit
+_HIGH_BIT_TABLE = bytes([0, 0, 1, 1]) + bytes(252)
+_LOW_BIT_TABLE = bytes([0, 1, 0, 1]) + bytes(252)
+
+# (code + 4 * masked) -> letter
+_LETTER_TABLE = bytes(b"ACGTNNNN" + bytes(248))
+
+# packed byte -> its 4 bases complemented and in reverse order
+_REVERSE_COMPLEMENT_BYTE = bytes(
+    sum((3 - ((byte >> (2 * j)) & 3)) << (2 * (3 - j)) for j in range(4))
+    for byte in range(256)
+)
+# mask byte -> its 8 bits in reverse order
+_REVERSE_BITS_BYTE = bytes(int(format(byte, "08b")[::-1], 2) for byte in range(256))
+
+# mask value (0 or 1) -> 2-bit code with every bit set if masked
+_MASKED_CODE_TABLE = bytes([0, 3]) + bytes(254)
+
+# str version of fasta.COMPLEMENT
+_STR_COMPLEMENT = {i : c for i, c in enumerate(COMPLEMENT) if i != c}
+
+def _pack(values, bits):
+    """
+    Packs a bytes object of small ints (each < 2**bits) into 8 // bits values
+    per byte. Each value lands at bit offset bits * (index % per_byte).
+
+    The packing is done with whole-sequence integer shifts instead of a
+    per-base Python loop, so it stays fast on multi-megabase genomes.
+
+    Parameters:
+        values - bytes
+            one small int per byte
+        bits - int
+            width of each value. must divide 8
+    Returns:
+        packed - bytes
+            ceil(len(values) / (8 // bits)) bytes
+    """
+    per_byte = 8 // bits
+    values = bytes(values) + bytes(-len(values) % per_byte)
+    n_bytes = len(values) // per_byte
+
+    packed = 0
+    for j in range(per_byte):
+        packed |= int.from_bytes(values[j::per_byte], "little") << (bits * j)
+    return packed.to_bytes(n_bytes, "little")
+
+def _unpack(packed, bits, start, stop):
+    """
+    Inverse of _pack for the values in [start, stop).
+
+    Parameters:
+        packed - bytes
+            output of _pack
+        bits - int
+            width of each value. must divide 8
+        start, stop - int
+            value positions to unpack
+    Returns:
+        values - bytes
+            one value per byte
+    """
+    per_byte = 8 // bits
+    first = start // per_byte
+    last = -(-stop // per_byte)
+    chunk = packed[first:last]
+    n_bytes = len(chunk)
+
+    value = int.from_bytes(chunk, "little")
+    low = int.from_bytes(bytes([(1 << bits) - 1]) * n_bytes, "little")
+    values = bytearray(n_bytes * per_byte)
+    for j in range(per_byte):
+        values[j::per_byte] = ((value >> (bits * j)) & low).to_bytes(n_bytes, "little")
+
+    offset = start - first * per_byte
+    return bytes(values[offset:offset + (stop - start)])
+
+def _bit_slice(data, bit_start, n_bits):
+    """
+    Returns bits [bit_start, bit_start + n_bits) of data as new bytes, with
+    the first bit moved to bit 0.
+    """
+    first = bit_start >> 3
+    last = (bit_start + n_bits + 7) >> 3
+    value = int.from_bytes(data[first:last], "little") >> (bit_start & 7)
+    value &= (1 << n_bits) - 1
+    return value.to_bytes((n_bits + 7) >> 3, "little")
+
+class PackedSequence:
+    """
+    Nucleotide sequence stored 2 bits per base (4 bases per byte).
+
+    Bases other than A, C, G and T (N, IUPAC codes, gaps...) are recorded in
+    a 1 bit per base mask and read back as 'N'. The mask is only allocated
+    when the sequence actually contains such bases. Lowercase input is read
+    as uppercase and whitespace is dropped.
+
+    Indexing returns a one letter str and slicing returns a str, so functions
+    written against plain str genomes (genome[i], genome[i:i+k] == pattern,
+    dict keys...) accept a PackedSequence unchanged.
+    """
+
+    # bases decoded per block when iterating
+    _BLOCK = 1 << 16
+
+    def __init__(self, sequence):
+        """
+        Parameters:
+            sequence - str or bytes
+                nucleotide sequence. case insensitive
+        """
+        if isinstance(sequence, str):
+            sequence = sequence.encode("ascii")
+        sequence = bytes(sequence).translate(None, WHITESPACE)
+
+        self._length = len(sequence)
+        self._packed = _pack(sequence.translate(_CODE_TABLE), 2)
+
+        mask = sequence.translate(_MASK_TABLE)
+        if 1 in mask:
+            self._mask = _pack(mask, 1)
+        else:
+            self._mask = None
+        self._bit_planes = None
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step != 1:
+                return self._decode(0, self._length)[key]
+            if stop <= start:
+                return ""
+            return self._decode(start, stop)
+
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError("PackedSequence index out of range")
+        if self.is_masked(key):
+            return "N"
+        return BASES[self.code(key)]
+
+    def __iter__(self):
+        for start in range(0, self._length, self._BLOCK):
+            yield from self._decode(start, min(start + self._BLOCK, self._length))
+
+    def __str__(self):
+        return self._decode(0, self._length)
+
+    def __repr__(self):
+        preview = self[:20]
+        if self._length > 20:
+            preview += "..."
+        return "PackedSequence('{}', length={})".format(preview, self._length)
+
+    @property
+    def nbytes(self):
+        """
+        Number of bytes used to hold the bases and mask.
+        """
+        total = len(self._packed)
+        if self._mask is not None:
+            total += len(self._mask)
+        return total
+
+    @property
+    def has_mask(self):
+        """
+        True if the sequence contains any non-ACGT base.
+        """
+        return self._mask is not None
+
+    def code(self, i):
+        """
+        Returns the 2-bit code (A=0, C=1, G=2, T=3) of base i. Masked bases
+        return 0, check is_masked() first if that matters.
+        """
+        return (self._packed[i >> 2] >> ((i & 3) << 1)) & 3
+
+    def is_masked(self, i):
+        """
+        Returns True if base i is not an A, C, G or T.
+        """
+        if self._mask is None:
+            return False
+        return bool((self._mask[i >> 3] >> (i & 7)) & 1)
+
+    def codes(self, start=0, stop=None):
+        """
+        Returns the 2-bit codes of bases [start, stop) as bytes, one per base.
+        """
+        if stop is None:
+            stop = self._length
+        return _unpack(self._packed, 2, start, stop)
+
+    def mask(self, start=0, stop=None):
+        """
+        Returns the mask of bases [start, stop) as bytes, one per base
+        (1 = non-ACGT base).
+        """
+        if stop is None:
+            stop = self._length
+        if self._mask is None:
+            return bytes(stop - start)
+        return _unpack(self._mask, 1, start, stop)
+
+    def to_bytes(self, start=0, stop=None):
+        """
+        Returns bases [start, stop) as uppercase ASCII bytes.
+        """
+        if stop is None:
+            stop = self._length
+        codes = self.codes(start, stop)
+        if self._mask is not None:
+            codes = (int.from_bytes(codes, "little")
+                | int.from_bytes(self.mask(start, stop), "little") << 2
+            ).to_bytes(len(codes), "little")
+        return codes.translate(_LETTER_TABLE)
+
+    @classmethod
+    def from_packed(cls, packed, length, mask=None):
+        """
+        Wraps already packed bases (e.g. a view of shared memory) without
+        copying them.
+
+        Parameters:
+            packed - bytes-like
+                2-bit codes, 4 bases per byte, as stored by PackedSequence.
+            length - int
+                number of bases.
+            mask - bytes-like or None
+                1 bit per base non-ACGT mask.
+        Returns:
+            genome - PackedSequence
+        """
+        genome = cls.__new__(cls)
+        genome._length = length
+        genome._packed = packed
+        genome._mask = mask
+        genome._bit_planes = None
+        return genome
+
+    @property
+    def packed(self):
+        """
+        The packed 2-bit codes and the mask (or None), as stored.
+        """
+        return self._packed, self._mask
+
+    def subsequence(self, start, stop):
+        """
+        Returns bases [start, stop) as a new PackedSequence. The packed
+        bits are copied as they are, nothing is decoded.
+        """
+        start, stop, _ = slice(start, stop).indices(self._length)
+        stop = max(start, stop)
+
+        length = stop - start
+        mask = None
+        if self._mask is not None:
+            mask = _bit_slice(self._mask, start, length)
+            if not mask.strip(b"\0"):
+                mask = None
+        return PackedSequence.from_packed(
+            _bit_slice(self._packed, 2 * start, 2 * length), length, mask)
+
+    def bit_planes(self):
+        """
+        Returns the sequence split into 1 bit per base planes: bit i of
+        each plane belongs to base i. Computed once and then cached.
+
+        Returns:
+            high - bytes
+                high bit of each base code
+            low - bytes
+                low bit of each base code
+            mask - bytes or None
+                1 for non-ACGT bases. None if there are none
+        """
+        if self._bit_planes is None:
+            codes = self.codes()
+            self._bit_planes = (
+                _pack(codes.translate(_HIGH_BIT_TABLE), 1),
+                _pack(codes.translate(_LOW_BIT_TABLE), 1),
+                self._mask
+            )
+        return self._bit_planes
+
+    def reverse_complement(self):
+        """
+        Returns the reverse complement as a new PackedSequence, computed on
+        the packed bytes with a 256 entry table and one shift, without
+        decoding a base. Masked bases stay masked.
+        """
+        n = self._length
+        packed = bytes(self._packed).translate(_REVERSE_COMPLEMENT_BYTE)[::-1]
+        # base i of the reversed bytes is base 4 * len(packed) - 1 - i of
+        # the original: drop the padding bases now at the start
+        value = int.from_bytes(packed, "little") >> (2 * (4 * len(packed) - n))
+
+        mask = None
+        if self._mask is not None:
+            mask_bytes = bytes(self._mask).translate(_REVERSE_BITS_BYTE)[::-1]
+            mask_value = int.from_bytes(mask_bytes, "little") >> (8 * len(mask_bytes) - n)
+            mask = mask_value.to_bytes(len(mask_bytes), "little")
+            # masked bases are stored as code 0, like PackedSequence() does
+            spread = int.from_bytes(_pack(_unpack(mask, 1, 0, n).translate(
+                _MASKED_CODE_TABLE), 2), "little")
+            value &= ~spread
+        return PackedSequence.from_packed(value.to_bytes(len(packed), "little"), n, mask)
+
+    def kmer_code(self, i, k):
+        """
+        Returns the 2-bit integer encoding of the k-mer starting at i (first
+        base in the highest bits), or None if it contains a masked base.
+        """
+        if self._mask is not None and 1 in self.mask(i, i + k):
+            return None
+        code = 0
+        for c in self.codes(i, i + k):
+            code = (code << 2) | c
+        return code
+
+    def _decode(self, start, stop):
+        return self.to_bytes(start, stop).decode("ascii")
+
+def reverse_complement(sequence):
+    """
+    Reverse complement of a nucleotide sequence in one translate pass plus
+    the reversal. Case is kept and IUPAC codes (N, R, Y...) are
+    complemented; other characters are left as they are.
+
+    Parameters:
+        sequence - str, bytes-like or PackedSequence
+            nucleotide sequence.
+    Returns:
+        rev_comp - same type as sequence (bytes for other bytes-likes)
+    """
+    if isinstance(sequence, PackedSequence):
+        return sequence.reverse_complement()
+    if isinstance(sequence, str):
+        return sequence.translate(_STR_COMPLEMENT)[::-1]
+    return bytes(sequence).translate(COMPLEMENT)[::-1]
+
+def encode_kmer(kmer):
+    """
+    Encodes a nucleotide sequence as an int, 2 bits per base, first base in
+    the highest bits.
+
+    Parameters:
+        kmer - str
+            nucleotide sequence of A, C, G, T. case insensitive, any other
+            base raises ValueError
+    Returns:
+        code - int
+    """
+    code = 0
+    for base in kmer.upper():
+        if base not in BASE_CODES:
+            raise ValueError("{!r} in {} is not A, C, G or T".format(base, kmer))
+        code = (code << 2) | BASE_CODES[base]
+    return code
+
+def decode_kmer(code, k):
+    """
+    Inverse of encode_kmer.
+
+    Parameters:
+        code - int
+            2-bit encoded k-mer
+        k - int
+            length of k-mer
+    Returns:
+        kmer - str
+    """
+    bases = []
+    for _ in range(k):
+        bases.append(BASES[code & 3])
+        code >>= 2
+    return "".join(reversed(bases))
+
+def load_genome(genome_fname):
+    """
+    Loads a genome file into a PackedSequence. Plain sequence files and
+    FASTA / multi-FASTA files are both accepted; headers are never counted
+    as sequence and line breaks are dropped.
+
+    A single contig can be selected with 'file:contig'. Otherwise the
+    contigs of a multi-FASTA file are joined with an 'N' between them, which
+    the packed sequence masks, so no k-mer spans two contigs.
+
+    Parameters:
+        genome_fname - str
+            file containing genome, optionally followed by ':contig'.
+    Returns:
+        genome - PackedSequence
+    """
+    fname, contig = split_genome_fname(genome_fname)
+    with FastaFile(fname) as fasta:
+        if contig is not None:
+            return PackedSequence(fasta[contig].sequence())
+        return PackedSequence(b"N".join(record.sequence() for record in fasta))
+
+def load_contigs(genome_fname):
+    """
+    Loads each contig of a genome file separately.
+
+    Parameters:
+        genome_fname - str
+            FASTA / multi-FASTA or plain sequence file.
+    Returns:
+        contigs - list of (str, PackedSequence)
+            contig name and sequence, in file order.
+    """
+    fname, contig = split_genome_fname(genome_fname)
+    with FastaFile(fname) as fasta:
+        if contig is not None:
+            return [(contig, PackedSequence(fasta[contig].sequence()))]
+        return [(record.name, PackedSequence(record.sequence())) for record in fasta]
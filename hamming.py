@@ -0,0 +1,121 @@
+from genome import BASE_CODES, PackedSequence
+from profiling import count_event
+
+# alignments tested together. must be a multiple of 8
+CHUNK_SIZE = 1 << 12
+
+def _as_packed(genome):
+    if isinstance(genome, PackedSequence):
+        return genome
+    return PackedSequence(genome)
+
+def _iter_bits(value, offset):
+    """
+    Yields offset + i for every set bit i of value, lowest first.
+    """
+    bits = bin(value)[:1:-1]
+    i = bits.find("1")
+    while i != -1:
+        yield offset + i
+        i = bits.find("1", i + 1)
+
+def _scan(genome, pattern, mismatches, chunk_size):
+    """
+    Yields (offset, hits) per chunk of alignments, where bit p of hits is
+    set if the alignment at offset + p has at most mismatches mismatches.
+
+    The genome is held as bit planes (high bit, low bit and mask of each
+    base), so XORing a shifted plane with the pattern's bit tests one
+    pattern position against every alignment of the chunk at once.
+    Mismatches are tallied in bit-sliced "at least t" counters, and a chunk
+    stops early as soon as every alignment in it has exceeded the limit.
+    """
+    genome = _as_packed(genome)
+    k = len(pattern)
+    n_alignments = len(genome) - k + 1
+    if k == 0 or n_alignments <= 0:
+        return
+
+    # (high bit, low bit) per pattern base, None for non-ACGT bases
+    pattern_bits = []
+    for base in pattern.upper():
+        code = BASE_CODES.get(base)
+        pattern_bits.append(None if code is None else (code >> 1, code & 1))
+
+    high, low, mask = genome.bit_planes()
+    for start in range(0, n_alignments, chunk_size):
+        n_chunk = min(chunk_size, n_alignments - start)
+        first = start >> 3
+        last = (start + n_chunk + k + 6) >> 3
+        chunk_high = int.from_bytes(high[first:last], "little")
+        chunk_low = int.from_bytes(low[first:last], "little")
+        chunk_mask = int.from_bytes(mask[first:last], "little") if mask else 0
+
+        every = (1 << n_chunk) - 1
+        # at_least[t] has bit p set once alignment p has >= t mismatches
+        at_least = [every] + [0] * (mismatches + 1)
+        tested = k
+        for j, bits in enumerate(pattern_bits):
+            if bits is None:
+                mismatch = every
+            else:
+                mismatch = (chunk_high >> j) ^ (every if bits[0] else 0)
+                mismatch |= (chunk_low >> j) ^ (every if bits[1] else 0)
+                mismatch |= chunk_mask >> j
+                mismatch &= every
+            for t in range(mismatches + 1, 0, -1):
+                at_least[t] |= at_least[t - 1] & mismatch
+            if at_least[mismatches + 1] == every:
+                tested = j + 1
+                count_event("early_exits")
+                break
+
+        count_event("alignments_scanned", n_chunk)
+        count_event("base_comparisons", n_chunk * tested)
+        yield start, every & ~at_least[mismatches + 1]
+
+def approx_positions(genome, pattern, mismatches, chunk_size=CHUNK_SIZE):
+    """
+    Finds every position where pattern occurs with at most mismatches
+    mismatches, testing thousands of alignments per big-integer operation.
+    Non-ACGT bases (N...) count as a mismatch against anything.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence. case insensitive
+        pattern - str
+            specified nucleotide sequence. case insensitive
+        mismatches - int
+            max amount of mismatches between genome and pattern allowed
+        chunk_size - int
+            alignments tested together. must be a multiple of 8
+    Returns:
+        positions - list of int
+            position(s) in genome where approx pattern is found
+    """
+    positions = []
+    for start, hits in _scan(genome, pattern, mismatches, chunk_size):
+        positions.extend(_iter_bits(hits, start))
+    return positions
+
+def approx_count(genome, pattern, mismatches, chunk_size=CHUNK_SIZE):
+    """
+    Counts the number of times pattern occurs with at most mismatches
+    mismatches, without building the list of positions.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence. case insensitive
+        pattern - str
+            specified nucleotide sequence. case insensitive
+        mismatches - int
+            max amount of mismatches between genome and pattern allowed
+        chunk_size - int
+            alignments tested together. must be a multiple of 8
+    Returns:
+        count - int
+    """
+    count = 0
+    for _, hits in _scan(genome, pattern, mismatches, chunk_size):
+        count += bin(hits).count("1")
+    return count
@@ -0,0 +1,570 @@
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from genome import PackedSequence, decode_kmer
+from neighborhood import mismatch_masks
+from profiling import count_event
+
+# longest k-mer that fits a uint64 code with room for the INVALID sentinel
+MAX_K = 31
+
+# code given to windows that contain a masked (non-ACGT) base
+INVALID = (1 << 64) - 1
+
+# largest k counted into a dense 4**k array (4**12 counts = 128 MB as int64)
+DENSE_MAX_K = 12
+
+# 2-bit code -> code of the complementary base
+_COMPLEMENT_CODE_TABLE = bytes([3, 2, 1, 0]) + bytes(252)
+
+def _as_packed(genome):
+    if isinstance(genome, PackedSequence):
+        return genome
+    return PackedSequence(genome)
+
+def _has_invalid(codes):
+    """
+    Returns True if any window in codes contains a masked base.
+    """
+    if np is not None and isinstance(codes, np.ndarray):
+        return bool((codes == np.uint64(INVALID)).any())
+    return INVALID in codes
+
+def _lane_width(k):
+    """
+    Bytes per k-mer code in the pure Python encoder.
+    """
+    for width in (1, 2, 4, 8):
+        if 2 * k <= 8 * width:
+            return width
+    raise ValueError("k-mers longer than 32 bases do not fit in 64 bits")
+
+def kmer_codes(genome, k):
+    """
+    Rolls a 2-bit integer encoding along the genome. codes[i] encodes
+    genome[i:i+k] with the first base in the highest bits, so sorting codes
+    sorts k-mers alphabetically. Windows containing a masked base get the
+    INVALID code.
+
+    With NumPy the encoding takes k whole-array shift/or steps. Without it
+    the same steps are done on one big integer holding every window in its
+    own fixed width lane.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length. 1 <= k <= MAX_K
+    Returns:
+        codes - numpy.ndarray or array.array
+            len(genome) - k + 1 unsigned codes. always 64 bit when the
+            genome has masked bases
+    """
+    if not 1 <= k <= MAX_K:
+        raise ValueError("k must be between 1 and {}".format(MAX_K))
+    genome = _as_packed(genome)
+    n_windows = len(genome) - k + 1
+    if n_windows <= 0:
+        return np.zeros(0, dtype=np.uint64) if np is not None else array("Q")
+
+    base_codes = genome.codes()
+    count_event("windows_scanned", n_windows)
+
+    if np is not None:
+        bases = np.frombuffer(base_codes, dtype=np.uint8).astype(np.uint64)
+        codes = np.zeros(n_windows, dtype=np.uint64)
+        for j in range(k):
+            codes <<= np.uint64(2)
+            codes |= bases[j:j + n_windows]
+    else:
+        width = _lane_width(k)
+        lanes = bytearray(len(base_codes) * width)
+        lanes[0::width] = base_codes
+        lanes = int.from_bytes(lanes, "little")
+        packed = 0
+        for j in range(k):
+            packed |= (lanes >> (8 * width * j)) << (2 * (k - 1 - j))
+        packed &= (1 << (8 * width * n_windows)) - 1
+        codes = array({1 : "B", 2 : "H", 4 : "I", 8 : "Q"}[width])
+        codes.frombytes(packed.to_bytes(width * n_windows, "little"))
+
+    if genome.has_mask:
+        if np is None:
+            codes = array("Q", codes)
+        mask = genome.mask()
+        masked = mask.find(1)
+        while masked != -1:
+            for i in range(max(masked - k + 1, 0), min(masked + 1, n_windows)):
+                codes[i] = INVALID
+            masked = mask.find(1, masked + 1)
+    return codes
+
+# (mask, shift) steps reversing the order of the 2-bit groups of a 64 bit word
+_GROUP_SWAPS = (
+    (0x3333333333333333, 2),
+    (0x0F0F0F0F0F0F0F0F, 4),
+    (0x00FF00FF00FF00FF, 8),
+    (0x0000FFFF0000FFFF, 16),
+    (0x00000000FFFFFFFF, 32)
+)
+
+def reverse_complement_codes(codes, k):
+    """
+    Reverse complement of 2-bit k-mer codes with bit tricks: complementing
+    is XOR with all ones (3 - code per base), and the base order is
+    reversed with five mask/shift/or steps on the 64 bit word.
+
+    Parameters:
+        codes - int or numpy.ndarray of uint64
+            k-mer codes, as from kmer_codes or encode_kmer.
+        k - int
+            k-mer length.
+    Returns:
+        rc_codes - same type as codes
+    """
+    full = (1 << 64) - 1
+    if np is not None and isinstance(codes, np.ndarray):
+        x = codes ^ np.uint64((1 << (2 * k)) - 1)
+        for mask, shift in _GROUP_SWAPS:
+            mask, shift = np.uint64(mask), np.uint64(shift)
+            x = ((x >> shift) & mask) | ((x & mask) << shift)
+        return x >> np.uint64(64 - 2 * k)
+
+    x = codes ^ ((1 << (2 * k)) - 1)
+    for mask, shift in _GROUP_SWAPS:
+        x = ((x >> shift) & mask) | (((x & mask) << shift) & full)
+    return x >> (64 - 2 * k)
+
+def canonical_kmer_codes(genome, k):
+    """
+    Rolls the forward and the reverse complement encoding of every window
+    along the genome in the same pass. The reverse complement code of
+    genome[i:i+k] gets the complement of base j at bits 2 * j.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length. 1 <= k <= MAX_K
+    Returns:
+        codes - numpy.ndarray or array.array
+            forward codes, as kmer_codes returns them
+        canonical - numpy.ndarray or array.array
+            smaller of the forward and reverse complement code of each
+            window, so a k-mer and its reverse complement share one code.
+            INVALID for windows containing a masked base
+    """
+    if not 1 <= k <= MAX_K:
+        raise ValueError("k must be between 1 and {}".format(MAX_K))
+    genome = _as_packed(genome)
+    n_windows = len(genome) - k + 1
+    if n_windows <= 0:
+        empty = np.zeros(0, dtype=np.uint64) if np is not None else array("Q")
+        return empty, empty
+
+    base_codes = genome.codes()
+    count_event("windows_scanned", n_windows)
+
+    if np is not None:
+        bases = np.frombuffer(base_codes, dtype=np.uint8).astype(np.uint64)
+        complements = np.uint64(3) - bases
+        codes = np.zeros(n_windows, dtype=np.uint64)
+        rc_codes = np.zeros(n_windows, dtype=np.uint64)
+        for j in range(k):
+            codes <<= np.uint64(2)
+            codes |= bases[j:j + n_windows]
+            rc_codes |= complements[j:j + n_windows] << np.uint64(2 * j)
+        canonical = np.minimum(codes, rc_codes)
+    else:
+        width = _lane_width(k)
+        lanes = bytearray(len(base_codes) * width)
+        lanes[0::width] = base_codes
+        lanes = int.from_bytes(lanes, "little")
+        complement_lanes = bytearray(len(base_codes) * width)
+        complement_lanes[0::width] = base_codes.translate(_COMPLEMENT_CODE_TABLE)
+        complement_lanes = int.from_bytes(complement_lanes, "little")
+
+        packed = 0
+        rc_packed = 0
+        for j in range(k):
+            packed |= (lanes >> (8 * width * j)) << (2 * (k - 1 - j))
+            rc_packed |= (complement_lanes >> (8 * width * j)) << (2 * j)
+        window_bits = (1 << (8 * width * n_windows)) - 1
+        typecode = {1 : "B", 2 : "H", 4 : "I", 8 : "Q"}[width]
+        codes = array(typecode)
+        codes.frombytes((packed & window_bits).to_bytes(width * n_windows, "little"))
+        rc_codes = array(typecode)
+        rc_codes.frombytes((rc_packed & window_bits).to_bytes(width * n_windows, "little"))
+        canonical = array(typecode, map(min, codes, rc_codes))
+
+    if genome.has_mask:
+        if np is None:
+            codes = array("Q", codes)
+            canonical = array("Q", canonical)
+        mask = genome.mask()
+        masked = mask.find(1)
+        while masked != -1:
+            for i in range(max(masked - k + 1, 0), min(masked + 1, n_windows)):
+                codes[i] = INVALID
+                canonical[i] = INVALID
+            masked = mask.find(1, masked + 1)
+    return codes, canonical
+
+def _count_codes(codes, k):
+    """
+    count_kmers on already computed codes.
+    """
+    if np is not None:
+        if _has_invalid(codes):
+            codes = codes[codes != np.uint64(INVALID)]
+        if k <= DENSE_MAX_K:
+            dense = np.bincount(codes.astype(np.int64), minlength=4 ** k)
+            present = np.flatnonzero(dense)
+            return present, dense[present]
+        return np.unique(codes, return_counts=True)
+
+    counts = Counter(codes)
+    counts.pop(INVALID, None)
+    distinct = sorted(counts)
+    return distinct, [counts[code] for code in distinct]
+
+def count_kmers(genome, k):
+    """
+    Counts every k-mer in the genome from its integer code. Small k are
+    counted into a dense 4**k array (bincount), larger k by sorting the codes
+    into a compact array of distinct codes.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length.
+    Returns:
+        codes - list or numpy.ndarray of int
+            distinct k-mer codes in ascending (alphabetical) order
+        counts - list or numpy.ndarray of int
+            number of times each code occurs
+    """
+    return _count_codes(kmer_codes(genome, k), k)
+
+def merge_kmer_counts(tables, k):
+    """
+    Adds up count_kmers() tables by code, e.g. those of the chunks of a
+    genome counted in parallel. Small k are merged into a dense 4**k array,
+    larger k by sorting the codes of all tables together.
+
+    Parameters:
+        tables - iterable of (codes, counts)
+            as returned by count_kmers.
+        k - int
+            k-mer length.
+    Returns:
+        codes - list or numpy.ndarray of int
+            distinct k-mer codes in ascending (alphabetical) order
+        counts - list or numpy.ndarray of int
+            total number of times each code occurs
+    """
+    tables = list(tables)
+    if np is not None and all(isinstance(codes, np.ndarray) for codes, _ in tables):
+        if not tables:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+        if k <= DENSE_MAX_K:
+            dense = np.zeros(4 ** k, dtype=np.int64)
+            for codes, counts in tables:
+                # codes are distinct within a table, so no add.at needed
+                dense[codes.astype(np.int64)] += counts
+            present = np.flatnonzero(dense)
+            return present, dense[present]
+        codes = np.concatenate([codes for codes, _ in tables])
+        counts = np.concatenate([counts for _, counts in tables]).astype(np.int64)
+        order = np.argsort(codes, kind="stable")
+        codes, counts = codes[order], counts[order]
+        distinct, starts = np.unique(codes, return_index=True)
+        if len(distinct) == 0:
+            return distinct, counts
+        return distinct, np.add.reduceat(counts, starts)
+
+    total = Counter()
+    for codes, counts in tables:
+        for code, count in zip(codes, counts):
+            total[int(code)] += int(count)
+    distinct = sorted(total)
+    return distinct, [total[code] for code in distinct]
+
+def count_canonical_kmers(genome, k):
+    """
+    Counts every k-mer together with its reverse complement, from one
+    rolling pass (see canonical_kmer_codes).
+
+    Returns:
+        codes - list or numpy.ndarray of int
+            distinct canonical codes in ascending order
+        counts - list or numpy.ndarray of int
+            occurrences of the k-mer or its reverse complement. a
+            palindrome (its own reverse complement) counts once per
+            occurrence
+    """
+    return _count_codes(canonical_kmer_codes(genome, k)[1], k)
+
+def frequent_words(genome, k):
+    """
+    Finds the most frequent k-mer(s) without building a dict of strings.
+    Only the winning codes are decoded.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length.
+    Returns:
+        words - list of str
+            most frequent k-mer(s), in alphabetical order
+        count - int
+            number of times each of them occurs
+    """
+    codes, counts = count_kmers(genome, k)
+    return most_frequent(codes, counts, k)
+
+def most_frequent(codes, counts, k):
+    """
+    Picks the most frequent k-mer(s) out of a count_kmers() table, e.g. one
+    read back from a cache.
+
+    Parameters:
+        codes, counts - arrays
+            as returned by count_kmers.
+        k - int
+            k-mer length.
+    Returns:
+        words - list of str
+            most frequent k-mer(s), in alphabetical order
+        count - int
+            number of times each of them occurs
+    """
+    if len(codes) == 0:
+        return [], 0
+
+    if np is not None and hasattr(counts, "max"):
+        max_count = int(counts.max())
+        winners = codes[counts == max_count].tolist()
+    else:
+        max_count = max(counts)
+        winners = [code for code, count in zip(codes, counts) if count == max_count]
+    return [decode_kmer(int(code), k) for code in winners], max_count
+
+def find_clumps(genome, k, window, occurances):
+    """
+    Finds every k-mer that occurs at least t times (occurances) inside some
+    window of the genome, in O(n).
+
+    The window slides one base at a time: the k-mer entering the window is
+    counted up, the one leaving it is counted down, and a k-mer is recorded
+    the first time its count reaches t. Only the entering k-mer can reach t
+    at each step, so no per-window max is needed. With NumPy the same
+    question is answered by sorting the codes (stable, so positions stay
+    ordered) and checking whether occurrence j and j + t - 1 of a k-mer are
+    within one window of each other.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length.
+        window - int
+            window length in bases. k-mers must lie fully inside it
+        occurances - int
+            number of times a k-mer must occur in one window.
+    Returns:
+        clumps - list of str
+            clumping k-mers in alphabetical order
+    """
+    codes = kmer_codes(genome, k)
+    span = window - k + 1
+    if span <= 0 or len(codes) < span:
+        return []
+    occurances = max(occurances, 1)
+
+    if np is not None:
+        positions = np.flatnonzero(codes != np.uint64(INVALID))
+        codes = codes[positions]
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        positions = positions[order]
+
+        last = len(codes) - occurances + 1
+        if last <= 0:
+            return []
+        hits = ((codes[occurances - 1:] == codes[:last])
+            & (positions[occurances - 1:] - positions[:last] < span))
+        found = np.unique(codes[:last][hits]).tolist()
+        return [decode_kmer(int(code), k) for code in found]
+
+    # a window holds at most span distinct k-mers, so a dense 4**k array only
+    # pays off when it is not much larger than that
+    dense = k <= DENSE_MAX_K and 4 ** k <= 16 * span
+    if dense:
+        counts = array("L", [0]) * 4 ** k
+        reached = bytearray((4 ** k + 7) // 8)
+    else:
+        counts = Counter()
+        reached = set()
+    found = []
+
+    for i in range(len(codes)):
+        if i >= span:
+            leaving = codes[i - span]
+            if leaving != INVALID:
+                counts[leaving] -= 1
+
+        code = codes[i]
+        if code == INVALID:
+            continue
+        counts[code] += 1
+        if counts[code] < occurances:
+            continue
+
+        if dense:
+            if not reached[code >> 3] & (1 << (code & 7)):
+                reached[code >> 3] |= 1 << (code & 7)
+                found.append(code)
+        elif code not in reached:
+            reached.add(code)
+            found.append(code)
+
+    return [decode_kmer(code, k) for code in sorted(found)]
+
+def _both_strands(codes, counts, k):
+    """
+    Turns canonical counts into a table of count(x) + count(rc(x)) for
+    every k-mer x seen on either strand, sorted by code.
+    """
+    if np is not None:
+        codes = np.asarray(codes, dtype=np.uint64)
+        counts = np.asarray(counts, dtype=np.int64)
+        rc_codes = reverse_complement_codes(codes, k)
+        palindromes = rc_codes == codes
+        # a palindrome is found by both the forward and the reverse scan
+        counts = np.where(palindromes, 2 * counts, counts)
+        all_codes = np.concatenate((codes, rc_codes[~palindromes]))
+        all_counts = np.concatenate((counts, counts[~palindromes]))
+        order = np.argsort(all_codes, kind="stable")
+        return all_codes[order], all_counts[order]
+
+    table = {}
+    for code, count in zip(codes, counts):
+        rc_code = reverse_complement_codes(code, k)
+        if rc_code == code:
+            table[code] = 2 * count
+        else:
+            table[code] = table[rc_code] = count
+    table_codes = sorted(table)
+    return table_codes, [table[code] for code in table_codes]
+
+def mismatch_scores(genome, k, d, reverse_complement=False):
+    """
+    Approximate occurrence count of every distinct k-mer of the genome,
+    where an occurrence is any window within d mismatches.
+
+    Each distinct k-mer is counted once. Because "y is within d of x" is
+    symmetric and x ^ y is one of a fixed set of XOR masks, the approximate
+    count of y is the sum of the exact counts of y ^ mask over all masks.
+    Cost is distinct k-mers * neighborhood size, not n**2. Windows
+    containing a non-ACGT base are not counted.
+
+    With reverse_complement, occurrences of the reverse complement count
+    too. The forward and reverse complement codes are rolled in the same
+    pass and counted as canonical k-mers, so both strands cost one scan.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length.
+        d - int
+            max amount of mismatches allowed.
+        reverse_complement - bool
+            also count approximate occurrences of the reverse complement.
+    Returns:
+        codes - list or numpy.ndarray of int
+            distinct k-mer codes seen in the genome, ascending
+        scores - list or numpy.ndarray of int
+            their number of approximate occurrences
+    """
+    if reverse_complement:
+        forward, canonical = canonical_kmer_codes(genome, k)
+        # candidates are the k-mers seen on the forward strand, scored
+        # against both strands
+        codes, _ = _count_codes(forward, k)
+        table_codes, table_counts = _both_strands(*_count_codes(canonical, k), k)
+    else:
+        codes, counts = count_kmers(genome, k)
+        table_codes, table_counts = codes, counts
+    masks = mismatch_masks(k, d)
+    count_event("neighbor_lookups", len(codes) * len(masks))
+
+    if np is not None:
+        codes = np.asarray(codes, dtype=np.uint64)
+        table_codes = np.asarray(table_codes, dtype=np.uint64)
+        table_counts = np.asarray(table_counts, dtype=np.int64)
+        scores = np.zeros(len(codes), dtype=np.int64)
+        if len(codes) == 0:
+            return codes, scores
+        if k <= DENSE_MAX_K:
+            dense = np.zeros(4 ** k, dtype=np.int64)
+            dense[table_codes.astype(np.int64)] = table_counts
+            for mask in masks:
+                scores += dense[(codes ^ np.uint64(mask)).astype(np.int64)]
+        else:
+            for mask in masks:
+                neighbors = codes ^ np.uint64(mask)
+                index = np.minimum(np.searchsorted(table_codes, neighbors), len(table_codes) - 1)
+                found = table_codes[index] == neighbors
+                scores[found] += table_counts[index[found]]
+        return codes, scores
+
+    exact = dict(zip(table_codes, table_counts))
+    scores = []
+    for code in codes:
+        score = 0
+        for mask in masks:
+            score += exact.get(code ^ mask, 0)
+        scores.append(score)
+    return codes, scores
+
+def frequent_words_mismatches(genome, k, d, reverse_complement=False):
+    """
+    Finds the k-mer(s) of the genome with the most approximate occurrences
+    (see mismatch_scores).
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length.
+        d - int
+            max amount of mismatches allowed.
+        reverse_complement - bool
+            also count approximate occurrences of the reverse complement.
+    Returns:
+        words - list of str
+            k-mer(s) seen in the genome with the most approximate
+            occurrences, in alphabetical order
+        count - int
+            their number of approximate occurrences
+    """
+    codes, scores = mismatch_scores(genome, k, d, reverse_complement)
+    if len(codes) == 0:
+        return [], 0
+
+    if np is not None:
+        max_count = int(scores.max())
+        winners = codes[scores == max_count].tolist()
+    else:
+        max_count = max(scores)
+        winners = [code for code, score in zip(codes, scores) if score == max_count]
+    return [decode_kmer(int(code), k) for code in winners], max_count
@@ -0,0 +1,129 @@
+from array import array
+from functools import lru_cache
+from itertools import islice
+
+from genome import decode_kmer, encode_kmer
+
+# number of (pattern, d) neighborhoods kept by the LRU cache
+CACHE_SIZE = 256
+
+def neighbor_codes(code, k, d):
+    """
+    Yields every k-mer code within Hamming distance d of code, each exactly
+    once, starting with code itself.
+
+    Each neighbor is reached by picking its mismatch positions in increasing
+    order and XORing a non-zero 2-bit value into each one, so no variant is
+    produced twice.
+
+    Parameters:
+        code - int
+            2-bit encoded k-mer (see genome.encode_kmer).
+        k - int
+            k-mer length.
+        d - int
+            max number of mismatches.
+    Yields:
+        neighbor - int
+    """
+    yield code
+    if d > 0:
+        yield from _substitutions(code, 0, k, d)
+
+def _substitutions(code, first, k, remaining):
+    for i in range(first, k):
+        shift = 2 * (k - 1 - i)
+        for change in (1, 2, 3):
+            neighbor = code ^ (change << shift)
+            yield neighbor
+            if remaining > 1:
+                yield from _substitutions(neighbor, i + 1, k, remaining - 1)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def mismatch_masks(k, d):
+    """
+    Returns the XOR masks that turn a k-mer code into each of its
+    d-neighbors: y is within d mismatches of x exactly when x ^ y is in
+    this list. The first mask is 0 (no mismatch).
+
+    Parameters:
+        k - int
+            k-mer length.
+        d - int
+            max number of mismatches.
+    Returns:
+        masks - tuple of int
+    """
+    return tuple(neighbor_codes(0, k, d))
+
+def neighborhood_size(k, d):
+    """
+    Number of k-mers within d mismatches of any k-mer:
+    sum over j <= d of C(k, j) * 3**j.
+    """
+    size = 0
+    term = 1
+    for j in range(min(d, k) + 1):
+        size += term
+        term = term * (k - j) * 3 // (j + 1)
+    return size
+
+def neighbors(pattern, d):
+    """
+    Lazily yields every sequence within d mismatches of pattern (pattern
+    itself first), each exactly once.
+
+    Parameters:
+        pattern - str
+            nucleotide sequence of A, C, G, T. case insensitive
+        d - int
+            max number of mismatches.
+    Yields:
+        neighbor - str
+    """
+    k = len(pattern)
+    for code in neighbor_codes(encode_kmer(pattern), k, d):
+        yield decode_kmer(code, k)
+
+def neighbor_batches(pattern, d, batch_size=4096):
+    """
+    Yields the d-neighborhood of pattern as packed 2-bit codes, batch_size
+    codes at a time, without decoding anything to str.
+
+    Parameters:
+        pattern - str
+            nucleotide sequence of A, C, G, T. case insensitive
+        d - int
+            max number of mismatches.
+        batch_size - int
+            codes per batch.
+    Yields:
+        batch - array.array of unsigned 64 bit int
+    """
+    codes = neighbor_codes(encode_kmer(pattern), len(pattern), d)
+    while True:
+        batch = array("Q", islice(codes, batch_size))
+        if not batch:
+            return
+        yield batch
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_neighborhood(pattern, d):
+    return array("Q", neighbor_codes(encode_kmer(pattern), len(pattern), d)).tobytes()
+
+def neighborhood(pattern, d):
+    """
+    Returns the d-neighborhood of pattern as packed 2-bit codes. The last
+    CACHE_SIZE neighborhoods are kept in an LRU cache, so repeated patterns
+    are only enumerated once.
+
+    Parameters:
+        pattern - str
+            nucleotide sequence of A, C, G, T. case insensitive
+        d - int
+            max number of mismatches.
+    Returns:
+        codes - memoryview of unsigned 64 bit int
+            read-only, shared with the cache
+    """
+    return memoryview(_cached_neighborhood(pattern.upper(), d)).cast("Q")
@@ -0,0 +1,276 @@
+import os
+from collections import Counter
+
+from genome import PackedSequence
+
+# concurrent.futures and multiprocessing are imported where a pool is
+# started: they take longer to import than a single-process run of most
+# scripts takes to finish.
+
+# chunks handed out per worker, so a slow chunk does not stall the pool
+CHUNKS_PER_WORKER = 4
+
+# smallest chunk worth sending to another process, in bases
+MIN_CHUNK = 1 << 16
+
+def default_workers():
+    """
+    Number of worker processes used when --workers is 0.
+    """
+    return os.cpu_count() or 1
+
+def chunk_bounds(length, k, n_chunks):
+    """
+    Splits the window start positions [0, length - k + 1) into n_chunks
+    contiguous ranges.
+
+    Chunk [start, stop) owns the windows starting in it and covers bases
+    [start, stop + k - 1), so neighbouring chunks overlap by k - 1 bases.
+    Every window lies fully inside exactly one chunk: none are lost at a
+    boundary and none are counted twice.
+
+    Parameters:
+        length - int
+            genome length.
+        k - int
+            window (pattern) length.
+        n_chunks - int
+            number of chunks wanted.
+    Returns:
+        bounds - list of (int, int)
+    """
+    n_windows = length - k + 1
+    if n_windows <= 0:
+        return []
+    n_chunks = max(1, min(n_chunks, n_windows // MIN_CHUNK or 1))
+    step = -(-n_windows // n_chunks)
+    return [(start, min(start + step, n_windows)) for start in range(0, n_windows, step)]
+
+def _chunk(genome, start, stop):
+    if isinstance(genome, PackedSequence):
+        return genome.subsequence(start, stop)
+    return genome[start:stop]
+
+def map_chunks(kernel, genome, k, args=(), workers=1):
+    """
+    Runs kernel(chunk, *args) over overlapping chunks of the genome in a
+    process pool. PackedSequence chunks are sent packed (2 bits per base).
+
+    Parameters:
+        kernel - function
+            module level function taking a genome chunk first.
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            length of the windows the kernel looks at.
+        args - tuple
+            extra arguments passed to kernel.
+        workers - int
+            number of processes. 1 runs in this process, 0 uses every core.
+    Returns:
+        results - list of (int, object)
+            start of each chunk and what kernel returned for it, in
+            genome order.
+    """
+    if workers == 0:
+        workers = default_workers()
+    bounds = chunk_bounds(len(genome), k, workers * CHUNKS_PER_WORKER)
+    chunks = [_chunk(genome, start, stop + k - 1) for start, stop in bounds]
+
+    if workers <= 1 or len(chunks) <= 1:
+        results = [kernel(chunk, *args) for chunk in chunks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(kernel, chunk, *args) for chunk in chunks]
+            results = [future.result() for future in futures]
+    return [(start, result) for (start, _), result in zip(bounds, results)]
+
+def parallel_positions(kernel, genome, k, args=(), workers=1):
+    """
+    Runs a kernel that returns a list of positions over chunks of the
+    genome in parallel and merges the positions back into genome
+    coordinates.
+
+    Returns:
+        positions - list of int
+            in increasing order if the kernel returns them in order
+    """
+    positions = []
+    for start, chunk_positions in map_chunks(kernel, genome, k, args, workers):
+        positions.extend(start + pos for pos in chunk_positions)
+    return positions
+
+def parallel_count(kernel, genome, k, args=(), workers=1):
+    """
+    Runs a kernel that returns a count (int) or counts (dict) over chunks
+    of the genome in parallel and adds them up.
+
+    Returns:
+        count - int or dict
+    """
+    results = [result for _, result in map_chunks(kernel, genome, k, args, workers)]
+    if results and isinstance(results[0], dict):
+        total = Counter()
+        for counts in results:
+            total.update(counts)
+        return dict(total)
+    return sum(results)
+
+class SharedGenome:
+    """
+    Copies the packed bits of a PackedSequence into shared memory once, so
+    worker processes can read any region of the genome without it being
+    pickled to each of them.
+
+    Usage:
+        with SharedGenome(genome) as shared:
+            pool.submit(task, shared.handle, ...)
+    """
+
+    def __init__(self, genome):
+        """
+        Parameters:
+            genome - PackedSequence
+                genome to share.
+        """
+        from multiprocessing import shared_memory
+        packed, mask = genome.packed
+        self._blocks = []
+        names = []
+        for data in (packed, mask):
+            if data is None or len(data) == 0:
+                names.append(None)
+                continue
+            block = shared_memory.SharedMemory(create=True, size=len(data))
+            block.buf[:len(data)] = data
+            self._blocks.append(block)
+            names.append(block.name)
+
+        # picklable description of the genome: (length, bytes, block names)
+        self.handle = (len(genome), len(packed), len(mask or b""), names[0], names[1])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Frees the shared memory. Workers must be done with it.
+        """
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+# handle -> (blocks, views, genome) attached in this worker process
+_attached = {}
+
+def _detach_all():
+    """
+    Releases the views of the attached blocks and closes them, at worker
+    exit. Closing a block whose buffer is still viewed raises BufferError,
+    which SharedMemory's finalizer would print.
+    """
+    for blocks, views, _ in _attached.values():
+        try:
+            for view in views:
+                view.release()
+            for block in blocks:
+                block.close()
+        except BufferError:
+            # a kernel result still views them, the OS unmaps them on exit
+            pass
+    _attached.clear()
+
+def attach_genome(handle):
+    """
+    Returns the PackedSequence described by a SharedGenome handle, reading
+    straight from shared memory. Attached once per worker process.
+    """
+    if handle in _attached:
+        return _attached[handle][2]
+
+    import atexit
+    import sys
+    from multiprocessing import shared_memory
+    length, packed_size, mask_size, packed_name, mask_name = handle
+    blocks = []
+    views = []
+
+    def attach(name, size):
+        # pool workers report to the creating process's resource tracker, the
+        # registration made by attaching is a duplicate of its own and must
+        # not be unregistered, or the tracker fails when the block is unlinked
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        views.append(block.buf[:size])
+        return views[-1]
+
+    packed = b"" if packed_name is None else attach(packed_name, packed_size)
+    mask = None if mask_name is None else attach(mask_name, mask_size)
+
+    genome = PackedSequence.from_packed(packed, length, mask)
+    if not _attached:
+        atexit.register(_detach_all)
+    _attached[handle] = (blocks, views, genome)
+    return genome
+
+def _window_task(kernel, handle, start, stop, args):
+    return kernel(attach_genome(handle).subsequence(start, stop), *args)
+
+def map_windows(kernel, genome, regions, args=(), workers=1):
+    """
+    Runs kernel(genome[start:stop], *args) for every region in a process
+    pool. Workers read the genome from shared memory, only the region
+    bounds are sent to them.
+
+    Parameters:
+        kernel - function
+            module level function taking a genome region first.
+        genome - PackedSequence
+            whole genome.
+        regions - list of (int, int)
+            [start, stop) regions to run kernel on.
+        args - tuple
+            extra arguments passed to kernel.
+        workers - int
+            number of processes. 1 runs in this process, 0 uses every core.
+    Returns:
+        results - list
+            what kernel returned for each region, in region order
+    """
+    if workers == 0:
+        workers = default_workers()
+    if workers <= 1 or len(regions) <= 1:
+        return [kernel(genome.subsequence(start, stop), *args) for start, stop in regions]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with SharedGenome(genome) as shared:
+        with ProcessPoolExecutor(max_workers=min(workers, len(regions))) as pool:
+            futures = [pool.submit(_window_task, kernel, shared.handle, start, stop, args)
+                for start, stop in regions]
+            return [future.result() for future in futures]
+
+def map_items(kernel, items, args=(), workers=1):
+    """
+    Runs kernel(item, *args) for every item in a process pool.
+
+    Returns:
+        results - list
+            in item order
+    """
+    if workers == 0:
+        workers = default_workers()
+    if workers <= 1 or len(items) <= 1:
+        return [kernel(item, *args) for item in items]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        futures = [pool.submit(kernel, item, *args) for item in items]
+        return [future.result() for future in futures]
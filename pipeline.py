@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+
+from aho_corasick import multi_pattern_search
+from cache import open_cache
+from Find_Replication_Origin import approx_pattern, merge_windows
+from genome import load_genome
+from hamming import approx_positions
+from kmers import count_kmers, find_clumps, frequent_words_mismatches, most_frequent
+from parallel import map_windows
+from profiling import Profiler
+from skew import skew_array, skew_extremes
+
+def parse_cmd_line(as_dict=False):
+    """
+    Description:
+        Parses the command line arguments for the program
+    Parameters:
+        as_dict - bool
+            Returns the args as a dict. Default=False
+    Returns:
+        The command line arguments as a dictionary or a Namespace object and the
+        parser used to parse the command line.
+    """
+
+    defaults = {
+        "genome_fname" : "./Salmonella_enterica.txt",
+        "stages" : ["ori"],
+        "pattern_len" : 9,
+        "mismatches" : 1,
+        "window" : 500,
+        "clump_window" : 500,
+        "occurances" : 3,
+        "patterns" : ["ATGATCAAG"],
+        "reverse_complement" : False,
+        "workers" : 1,
+        "cache_dir" : None,
+        "json" : False,
+        "profile" : None,
+        "profile_dump" : None
+    }
+
+    parser = argparse.ArgumentParser(
+        description="""Runs one or more analyses on a genome loaded once.
+        Stages a requested stage depends on (windows needs skew, ori needs
+        windows) are run first, once.""",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("stages",
+        nargs="*",
+        default=defaults["stages"],
+        help="""Stages to run, in order. One or more of: {}""".format(", ".join(STAGES))
+    )
+    parser.add_argument("--genome_fname",
+        type=str,
+        default=defaults["genome_fname"],
+        help="""File containing genome (plain or FASTA). Use file:contig to pick one contig"""
+    )
+    parser.add_argument("--pattern_len",
+        type=int,
+        default=defaults["pattern_len"],
+        help="""Length of k-mers for frequent, frequent_mismatches, clumps and ori"""
+    )
+    parser.add_argument("--mismatches",
+        type=int,
+        default=defaults["mismatches"],
+        help="""Max amount of mismatches allowed"""
+    )
+    parser.add_argument("--window",
+        type=int,
+        default=defaults["window"],
+        help="""Value to subtract and add to skew min positions"""
+    )
+    parser.add_argument("--clump_window",
+        type=int,
+        default=defaults["clump_window"],
+        help="""Length of the sliding window of clumps"""
+    )
+    parser.add_argument("--occurances",
+        type=int,
+        default=defaults["occurances"],
+        help="""Times a k-mer must occur in a window to clump"""
+    )
+    parser.add_argument("--patterns",
+        nargs="+",
+        default=defaults["patterns"],
+        help="""Patterns for find and approx"""
+    )
+    parser.add_argument("--reverse_complement",
+        action="store_true",
+        default=defaults["reverse_complement"],
+        help="""Also find the reverse complement of the patterns"""
+    )
+    parser.add_argument("--workers",
+        type=int,
+        default=defaults["workers"],
+        help="""Number of processes to analyse the ori windows with. 0 uses every core"""
+    )
+    parser.add_argument("--cache_dir",
+        type=str,
+        default=defaults["cache_dir"],
+        help="""Directory to keep skew arrays and k-mer tables in between runs. No caching if not set"""
+    )
+    parser.add_argument("--json",
+        action="store_true",
+        default=defaults["json"],
+        help="""Print the results of every stage as one JSON object"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
+    args = parser.parse_args()
+
+    for stage in args.stages:
+        if stage not in STAGES:
+            parser.error("unknown stage {}".format(stage))
+
+    if as_dict:
+        args = vars(args)
+    return args
+
+# Every stage takes the shared context (genome, cache, results of earlier
+# stages) and the arguments, stores its intermediate data in the context
+# and returns what it reports.
+
+def stage_skew(context, args):
+    """
+    Skew array and its minima.
+    """
+    genome = context["genome"]
+    cache = context["cache"]
+    if cache is None:
+        skew = skew_array(genome)
+    else:
+        skew = cache.cached(genome, "skew", lambda: {"skew" : skew_array(genome)})["skew"]
+
+    min_value, min_list, max_value, max_list = skew_extremes(skew)
+    context["skew"] = skew
+    context["min_list"] = min_list
+    return {"min" : min_value, "min_positions" : min_list,
+        "max" : max_value, "max_positions" : max_list}
+
+def stage_windows(context, args):
+    """
+    Merged windows around the skew minima.
+    """
+    regions = merge_windows(context["min_list"], args["window"], len(context["genome"]))
+    context["regions"] = regions
+    return [list(region) for region in regions]
+
+def stage_ori(context, args):
+    """
+    Most frequent k-mer(s) with mismatches, reverse complements included,
+    in every window around the skew minima.
+    """
+    # workers read the windows from the genome in shared memory
+    words = map_windows(approx_pattern, context["genome"], context["regions"],
+        (args["pattern_len"], args["mismatches"]), args["workers"])
+    return {"ori" + str(i) : seqs for i, seqs in enumerate(words)}
+
+def _kmer_table(context, k):
+    """
+    count_kmers table of the genome, computed once per k and run.
+    """
+    key = ("kmer_table", k)
+    if key not in context:
+        genome = context["genome"]
+        cache = context["cache"]
+        if cache is None:
+            context[key] = count_kmers(genome, k)
+        else:
+            table = cache.cached(genome, "kmer_counts",
+                lambda: dict(zip(("codes", "counts"), count_kmers(genome, k))), k=k)
+            context[key] = table["codes"], table["counts"]
+    return context[key]
+
+def stage_frequent(context, args):
+    """
+    Most frequent k-mer(s).
+    """
+    k = args["pattern_len"]
+    words, count = most_frequent(*_kmer_table(context, k), k)
+    return {"words" : words, "count" : count}
+
+def stage_frequent_mismatches(context, args):
+    """
+    Most frequent k-mer(s) allowing mismatches.
+    """
+    words, count = frequent_words_mismatches(context["genome"], args["pattern_len"],
+        args["mismatches"])
+    return {"words" : words, "count" : count}
+
+def stage_clumps(context, args):
+    """
+    k-mers forming clumps.
+    """
+    return find_clumps(context["genome"], args["pattern_len"], args["clump_window"],
+        args["occurances"])
+
+def stage_find(context, args):
+    """
+    Exact positions of every pattern, all found in one pass.
+    """
+    return multi_pattern_search(context["genome"], args["patterns"],
+        args["reverse_complement"])
+
+def stage_approx(context, args):
+    """
+    Positions of every pattern allowing mismatches.
+    """
+    return {pattern : approx_positions(context["genome"], pattern, args["mismatches"])
+        for pattern in args["patterns"]}
+
+# stage name -> (function, stages it needs run first)
+STAGES = {
+    "skew" : (stage_skew, ()),
+    "windows" : (stage_windows, ("skew",)),
+    "ori" : (stage_ori, ("windows",)),
+    "frequent" : (stage_frequent, ()),
+    "frequent_mismatches" : (stage_frequent_mismatches, ()),
+    "clumps" : (stage_clumps, ()),
+    "find" : (stage_find, ()),
+    "approx" : (stage_approx, ())
+}
+
+def resolve_stages(stages):
+    """
+    Returns the stages to run: the requested ones preceded by the stages
+    they depend on, each once.
+    """
+    order = []
+    def add(stage):
+        if stage in order:
+            return
+        for required in STAGES[stage][1]:
+            add(required)
+        order.append(stage)
+    for stage in stages:
+        add(stage)
+    return order
+
+def run_pipeline(genome, stages, args, cache=None, profiler=None):
+    """
+    Runs stages on an already loaded genome. Intermediate data (skew
+    array, minima, windows, k-mer tables) is handed from stage to stage
+    without copying.
+
+    Parameters:
+        genome - PackedSequence
+            whole genome.
+        stages - list of str
+            names in STAGES.
+        args - dict
+            options, as returned by parse_cmd_line(True).
+        cache - GenomeCache or None
+        profiler - Profiler or None
+            records every stage under its name.
+    Returns:
+        results - dict
+            stage name -> what it reports, in run order
+    """
+    if profiler is None:
+        profiler = Profiler()
+    context = {"genome" : genome, "cache" : cache}
+    results = {}
+    for stage in resolve_stages(stages):
+        with profiler.stage(stage):
+            results[stage] = STAGES[stage][0](context, args)
+    return results
+
+if __name__ == "__main__":
+    args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
+
+    with profiler.stage("load"):
+        genome = load_genome(args["genome_fname"])
+    cache = open_cache(args["cache_dir"])
+
+    results = run_pipeline(genome, args["stages"], args, cache, profiler)
+
+    if args["json"]:
+        print(json.dumps(results))
+    else:
+        for stage, result in results.items():
+            print("{} : ".format(stage), result)
+
+    profiler.finish()
@@ -1,6 +1,12 @@
 import argparse
 import os
 
+from aho_corasick import multi_pattern_search, read_patterns
+from fm_index import FMIndex, load_or_build_index
+from genome import PackedSequence, load_genome
+from parallel import parallel_count
+from profiling import Profiler
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -15,7 +21,13 @@ def parse_cmd_line(as_dict=False):
 
     defaults = {
         "vibrio_genome_fname" : "./Vibrio_cholerae.txt",
-        "promoter" : "ATG"
+        "promoter" : "ATG",
+        "index" : False,
+        "pattern_fname" : None,
+        "reverse_complement" : False,
+        "workers" : 1,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -25,13 +37,43 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--vibrio_genome_fname", 
         type=str,
         default=defaults["vibrio_genome_fname"],
-        help="""File containing vibrio genome"""
+        help="""File containing vibrio genome (plain or FASTA). Use file:contig to pick one contig"""
     )
     parser.add_argument("--promoter", 
         type=str,
         default=defaults["promoter"],
         help="""Sample specified nucleotide sequence"""
     )
+    parser.add_argument("--index",
+        action="store_true",
+        default=defaults["index"],
+        help="""Answer from a suffix array / FM-index saved next to the genome file, building it on first use"""
+    )
+    parser.add_argument("--pattern_fname",
+        type=str,
+        default=defaults["pattern_fname"],
+        help="""File of patterns, one per line. Searches for all of them in one pass over the genome"""
+    )
+    parser.add_argument("--reverse_complement",
+        action="store_true",
+        default=defaults["reverse_complement"],
+        help="""With --pattern_fname, also search for the reverse complement of every pattern"""
+    )
+    parser.add_argument("--workers",
+        type=int,
+        default=defaults["workers"],
+        help="""Number of processes to scan the genome with. 0 uses every core"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
 
     args = parser.parse_args()
     
@@ -45,7 +87,7 @@ def pattern_count(genome, pattern):
     genome.
     
     Parameters:
-        genome - str
+        genome - str, PackedSequence or FMIndex
             whole genome nucleotide sequence. case sensitive
         pattern - str
             specified nucleotide sequence. case sensitive
@@ -53,25 +95,55 @@ def pattern_count(genome, pattern):
         count - int
             Number of times pattern is observed in genome
     """
-    count = 0
-    for i in range(len(genome)):
-        if len(genome[i:(len(pattern)+i)]) < len(pattern):
-            break
+    if isinstance(genome, FMIndex):
+        return genome.count(pattern)
 
-        if genome[i:(len(pattern)+i)] == pattern:
-            count = count + 1
+    if not pattern:
+        return len(genome)
+
+    # decode once and let str.find skip between matches, instead of
+    # slicing (and unpacking) a window at every position
+    if isinstance(genome, PackedSequence):
+        genome = str(genome)
+    count = 0
+    i = genome.find(pattern)
+    while i != -1:
+        count = count + 1
+        i = genome.find(pattern, i + 1)
     return count
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["vibrio_genome_fname"]
-    genome_file = open(genome_file)
+    if args["pattern_fname"] is not None:
+        with profiler.stage("load"):
+            genome = load_genome(args["vibrio_genome_fname"])
+            patterns = read_patterns(args["pattern_fname"])
+        with profiler.stage("search"):
+            results = multi_pattern_search(genome, patterns, args["reverse_complement"])
+    elif args["index"]:
+        with profiler.stage("load"):
+            genome = load_or_build_index(args["vibrio_genome_fname"])
+    else:
+        with profiler.stage("load"):
+            genome = load_genome(args["vibrio_genome_fname"])
 
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
+    if args["pattern_fname"] is not None:
+        for result in results:
+            counts = [str(len(result["positions"]))]
+            if args["reverse_complement"]:
+                counts.append(str(len(result["reverse_complement_positions"])))
+            print(result["pattern"], *counts, sep="\t")
+    else:
+        promoter = args["promoter"]
 
-    promoter = args["promoter"]
+        with profiler.stage("count"):
+            if isinstance(genome, FMIndex):
+                count = pattern_count(genome, promoter)
+            else:
+                count = parallel_count(pattern_count, genome, len(promoter), (promoter,),
+                    args["workers"])
+        print(count)
 
-    print(pattern_count(genome, promoter))
-    
+    profiler.finish()
@@ -1,6 +1,12 @@
 import argparse
 import os
 
+from genome import load_genome, reverse_complement
+from hamming import approx_count
+from kmers import frequent_words_mismatches
+from profiling import Profiler
+from topk import top_k_mismatch_words
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -16,7 +22,10 @@ def parse_cmd_line(as_dict=False):
     defaults = {
         "genome_fname" : "./test_genome.txt",
         "pattern_len" : 4,
-        "mismatches" : 1
+        "mismatches" : 1,
+        "top_k" : None,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -26,7 +35,7 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome"""
+        help="""File containing genome (plain or FASTA). Use file:contig to pick one contig"""
     )
     parser.add_argument("--pattern_len", 
         type=int,
@@ -38,6 +47,21 @@ def parse_cmd_line(as_dict=False):
         default=defaults["mismatches"],
         help="""Max amount of mismatches allowed"""
     )
+    parser.add_argument("--top_k",
+        type=int,
+        default=defaults["top_k"],
+        help="""Report the top_k sequences grouped by count instead of only the most frequent"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
 
     args = parser.parse_args()
     
@@ -50,10 +74,10 @@ def pattern_mismatch(genome, pattern, mismatches):
     Counts the number of times the approximate pattern is observed in genome.
     
     Parameters:
-        genome - str
-            whole genome nucleotide sequence. case sensitive
+        genome - str or PackedSequence
+            whole genome nucleotide sequence. case insensitive
         pattern - str
-            specified nucleotide sequence. case sensitive
+            specified nucleotide sequence. case insensitive
         mismatches - int
             max amount of mismatches between genome and pattern allowed
     Returns:
@@ -61,41 +85,7 @@ def pattern_mismatch(genome, pattern, mismatches):
             number of times approx pattern occurs in genome
 
     """
-    pattern_index = []
-    
-    for i in range(len(genome) - (len(pattern)-1)):
-        j = 0
-        count = 0
-        while j < len(pattern):
-            if genome[j] != pattern[j]:
-                count += 1
-            j += 1
-
-        if count <= mismatches:
-            pattern_index.append(i)
-
-        genome = genome[1:]
-    
-    return len(pattern_index)
-
-def reverse_complement(forward_sequence):
-    """
-    Generates the reverse complement of a nucleotide sequence
-    
-    Parameters:
-        forward_sequence - str
-            nucleotide sequence.
-    Returns:
-        rev_comp - str
-            the reverse complement of the input nucleotide sequence
-            
-    """
-    complement = forward_sequence.replace('A', '%temp%').replace('T', 'A').replace('%temp%', 'T')
-    complement = complement.replace('G', '%temp%').replace('C', 'G').replace('%temp%', 'C')
-
-    rev_comp = complement[::-1]
-
-    return rev_comp
+    return approx_count(genome, pattern, mismatches)
 
 def approx_pattern(genome, pattern_len, mismatches):
     """
@@ -103,7 +93,7 @@ def approx_pattern(genome, pattern_len, mismatches):
     Pattern reverse compliments are included in the count.
     
     Parameters:
-        genome - str
+        genome - str or PackedSequence
             whole genome nucleotide sequence
         pattern_len - int
             length of nucleotide sequence
@@ -111,49 +101,40 @@ def approx_pattern(genome, pattern_len, mismatches):
             max amount of mismatches between genome and pattern allowed
     Returns:
         max_key_list - list of str
-             nucleotide seq n nucleotides long (pattern_len) that occur most frequently
+             nucleotide seq n nucleotides long (pattern_len) that occur most frequently,
+             in alphabetical order
 
     """
 
-    counts_dict = {}
-    for i in range(len(genome) - pattern_len-1):
-        seq = genome[i:pattern_len+i]
-        
-        # counting how many times seq appears in genome, allowing n mismatches
-        forward_count = pattern_mismatch(genome, seq, mismatches)
-        
-        # finding reverse compliment and counting how often it occurs, allowing n mismatches
-        reverse_comp = reverse_complement(seq)
-        reverse_count = pattern_mismatch(genome, reverse_comp, mismatches)
-
-        count = forward_count + reverse_count
-
-        if seq not in counts_dict:
-            counts_dict[seq] = count
-    
-    max_key = max(counts_dict, key=counts_dict.get)
-
-    max_key_list = []
-
-    for key, value in counts_dict.items():
-        if value == counts_dict[max_key]:
-            max_key_list.append(key)
-
+    # k-mers and their reverse complements are counted together from one
+    # pass over the genome, then scored with their mismatch neighborhoods
+    max_key_list, _ = frequent_words_mismatches(genome, pattern_len, mismatches,
+        reverse_complement=True)
     return max_key_list
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
-
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
+    with profiler.stage("load"):
+        genome = load_genome(args["genome_fname"])
 
     pattern_len = args["pattern_len"]
     mismatches = args["mismatches"]
 
-    max_approx_seq = approx_pattern(genome, pattern_len, mismatches)
-
-    print('Most frequent sequence(s) (forward and reverse complement) allowing {} mismatch(es) : '.format(mismatches), 
-    max_approx_seq)
\ No newline at end of file
+    if args["top_k"] is not None:
+        with profiler.stage("top_k"):
+            groups = top_k_mismatch_words(genome, pattern_len, mismatches, args["top_k"],
+                reverse_complement=True)
+        print('Top {} sequence(s) (forward and reverse complement) allowing {} mismatch(es) : '.format(
+            args["top_k"], mismatches))
+        for count, words in groups:
+            print(count, " ".join(words), sep="\t")
+    else:
+        with profiler.stage("approx_pattern"):
+            max_approx_seq = approx_pattern(genome, pattern_len, mismatches)
+
+        print('Most frequent sequence(s) (forward and reverse complement) allowing {} mismatch(es) : '.format(mismatches), 
+        max_approx_seq)
+
+    profiler.finish()
@@ -1,6 +1,9 @@
 import argparse
 import os
 
+from neighborhood import neighbors
+from profiling import Profiler
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -15,25 +18,43 @@ def parse_cmd_line(as_dict=False):
 
     defaults = {
         "pattern" : "ACG",
-        "mismatches" : 1
+        "mismatches" : 1,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
-        description="""Generates patterns (using 'pattern') with n mismatches allowed""",
+        description="""Generates every pattern within n mismatches of 'pattern', the pattern
+        itself (0 mismatches) included and listed first""",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     parser.add_argument("--pattern", 
         type=str,
         default=defaults["pattern"],
-        help="""Sample specified nucleotide sequence"""
+        help="""Sample specified nucleotide sequence, of A, C, G and T only"""
     )
     parser.add_argument("--mismatches", 
         type=int,
         default=defaults["mismatches"],
         help="""Max amount of mismatches allowed"""
     )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
 
     args = parser.parse_args()
+
+    if set(args.pattern.upper()) - set("ACGT"):
+        parser.error("--pattern may only contain A, C, G and T, got {}".format(args.pattern))
+    if args.mismatches < 0:
+        parser.error("--mismatches must be at least 0")
     
     if as_dict:
         args = vars(args)
@@ -45,31 +66,26 @@ def generator(pattern, mismatches):
     
     Parameters:
         pattern - str
-            specified nucleotide sequence. case sensitive
+            specified nucleotide sequence. case insensitive
         mismatches - int
             max amount of mismatches between pattern and generated pattern allowed
-    Returns:
-         - list
-            all patterns possible with n mismatches allowed
+    Yields:
+        poss_pattern - str
+            every pattern with at most n mismatches, pattern itself first.
+            each one is produced once
 
     """
-    bases = [ "A", "C", "T", "G"]
-    pattern = list(pattern)
-    poss_patterns = []
-    for i in range(len(pattern)):
-        pattern_copy = pattern.copy()
-        for b in range(len(bases)):
-            if bases[b] != pattern[i]:
-                pattern_copy[i] = bases[b]
-                new_pattern = "".join(pattern_copy)
-                poss_patterns.append(new_pattern)
-    return poss_patterns
+    yield from neighbors(pattern, mismatches)
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     pattern = args["pattern"]
     mismatches = args["mismatches"]
 
-    poss_patterns = generator(pattern, mismatches)
+    with profiler.stage("neighbors"):
+        poss_patterns = list(generator(pattern, mismatches))
+
+    print("All possible patterns allowing {} mismatch(es) of {} : ".format(mismatches, pattern) , poss_patterns)
 
-    print("All possible patterns allowing {} mismatch(es) of {} : ".format(mismatches, pattern) , poss_patterns)
\ No newline at end of file
+    profiler.finish()
@@ -1,6 +1,14 @@
 import argparse
 import os
 
+from cache import open_cache
+from genome import decode_kmer, load_genome
+from kmers import count_kmers, frequent_words, merge_kmer_counts, most_frequent
+from parallel import map_chunks
+from profiling import Profiler
+from sketch import approximate_frequent_words
+from topk import top_k_words
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -15,7 +23,18 @@ def parse_cmd_line(as_dict=False):
 
     defaults = {
         "genome_fname" : "./Vibrio_cholerae.txt",
-        "sequence_len" : 3
+        "sequence_len" : 3,
+        "workers" : 1,
+        "cache_dir" : None,
+        "approximate" : False,
+        "top" : 10,
+        "error" : 1e-5,
+        "confidence" : 0.99,
+        "hll_precision" : 14,
+        "top_k" : None,
+        "capacity" : None,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -26,13 +45,71 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome"""
+        help="""File containing genome (plain or FASTA). Use file:contig to pick one contig"""
     )
     parser.add_argument("--sequence_len", 
         type=int,
         default=defaults["sequence_len"],
         help="""Desired length of nucleotide sequence to look for"""
     )
+    parser.add_argument("--workers",
+        type=int,
+        default=defaults["workers"],
+        help="""Number of processes to scan the genome with. 0 uses every core"""
+    )
+    parser.add_argument("--cache_dir",
+        type=str,
+        default=defaults["cache_dir"],
+        help="""Directory to keep k-mer tables in between runs. No caching if not set"""
+    )
+    parser.add_argument("--approximate",
+        action="store_true",
+        default=defaults["approximate"],
+        help="""Count with a count-min sketch and HyperLogLog in fixed memory, for large
+        sequence_len where nearly every k-mer is distinct"""
+    )
+    parser.add_argument("--top",
+        type=int,
+        default=defaults["top"],
+        help="""Number of sequences reported with --approximate"""
+    )
+    parser.add_argument("--error",
+        type=float,
+        default=defaults["error"],
+        help="""With --approximate, max overcount as a fraction of all k-mers. Memory grows as 1/error"""
+    )
+    parser.add_argument("--confidence",
+        type=float,
+        default=defaults["confidence"],
+        help="""With --approximate, probability that a count is within --error"""
+    )
+    parser.add_argument("--hll_precision",
+        type=int,
+        default=defaults["hll_precision"],
+        help="""With --approximate, distinct k-mers are estimated in 2**hll_precision bytes"""
+    )
+    parser.add_argument("--top_k",
+        type=int,
+        default=defaults["top_k"],
+        help="""Report the top_k sequences grouped by count instead of only the most frequent"""
+    )
+    parser.add_argument("--capacity",
+        type=int,
+        default=defaults["capacity"],
+        help="""With --top_k, track at most this many sequences (Space-Saving) instead of
+        counting every one exactly. Counts are then upper bounds, printed with the count each
+        sequence is guaranteed to reach, and the sequences are candidates, not a verified top"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
 
     args = parser.parse_args()
     
@@ -45,50 +122,92 @@ def pattern_frequency(genome, pattern_len):
     Counts frequency of every nucleotide sequence (n letters long) in a genome.
     
     Parameters:
-        genome - str
+        genome - str or PackedSequence
             whole genome nucleotide sequence.
         pattern_len - int
             length of nucleotide sequence.
     Returns:
         count - dict
             keys - sequence (str) n letters long (pattern_len) 
-            values - number of times pattern found in genome
+            values - number of times pattern found in genome. k-mers
+            containing a non-ACGT base are not counted
     """
+    codes, counts = count_kmers(genome, pattern_len)
+
     count = {}
+    for code, n in zip(codes, counts):
+        count[decode_kmer(int(code), pattern_len)] = int(n)
 
-    for i in range(len(genome)-(pattern_len-1)):
-        pattern = genome[i:pattern_len+i]
-        
-        if pattern in count:
-            count[pattern] = count[pattern] + 1
-        else:
-            count[pattern] = 1
-        
     return count
 
+def kmer_table(genome, pattern_len):
+    """
+    Counts every k-mer of the genome as a table of 2-bit codes, the form
+    stored in the cache.
+
+    Returns:
+        table - dict
+            codes - distinct k-mer codes, increasing
+            counts - number of times each of them occurs
+    """
+    codes, counts = count_kmers(genome, pattern_len)
+    return {"codes" : codes, "counts" : counts}
+
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
-
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
+    with profiler.stage("load"):
+        genome = load_genome(args["genome_fname"])
     
     pattern_len = args["sequence_len"]
 
-    counts_dict = pattern_frequency(genome, pattern_len)
-    max_key = max(counts_dict, key=counts_dict.get)
+    cache = open_cache(args["cache_dir"])
 
-    max_key_list = []
-
-    for key, value in counts_dict.items():
-        if value == counts_dict[max_key]:
-            max_key_list.append(key)
-    
-    # print(counts_dict)
-    print('Most frequent sequence(s) in genome : ', max_key_list)
-    print('Number of occurances : ', counts_dict[max_key])
+    if args["approximate"]:
+        with profiler.stage("sketch"):
+            result = approximate_frequent_words(genome, pattern_len, args["top"],
+                args["error"], 1 - args["confidence"], args["hll_precision"])
+        print('Most frequent sequence(s) in genome (estimated count, at least) : ')
+        for word, estimate, lower_bound in result["words"]:
+            print(word, estimate, lower_bound, sep="\t")
+        print('Counts are overestimated by at most {:.1f} with probability {:.4f}'.format(
+            result["error_bound"], result["confidence"]))
+        print('Distinct sequences : ~{} (+/- {:.1%})'.format(result["distinct"],
+            result["distinct_error"]))
+        print('Sketch memory (bytes) : ', result["memory_bytes"])
+    elif args["top_k"] is not None:
+        with profiler.stage("top_k"):
+            groups = top_k_words(genome, pattern_len, args["top_k"], args["capacity"])
+        if args["capacity"] is None:
+            print('Top {} sequence(s) in genome (occurances, sequences, exact) : '.format(args["top_k"]))
+            for count, words, _ in groups:
+                print(count, " ".join(words), True, sep="\t")
+        else:
+            print('Top {} candidate sequence(s) in genome (estimated count, at least) : '.format(
+                args["top_k"]))
+            for count, words, lower_bounds in groups:
+                for word, lower_bound in zip(words, lower_bounds):
+                    print(word, count, lower_bound, sep="\t")
+            print('Estimates are upper bounds: a candidate whose lower bound is below the '
+                'estimate of another may not be in the top {}'.format(args["top_k"]))
+    else:
+        with profiler.stage("count"):
+            if cache is not None:
+                table = cache.cached(genome, "kmer_counts",
+                    lambda: kmer_table(genome, pattern_len), k=pattern_len)
+                max_key_list, max_count = most_frequent(table["codes"], table["counts"], pattern_len)
+            elif args["workers"] == 1:
+                max_key_list, max_count = frequent_words(genome, pattern_len)
+            else:
+                # chunks come back as code/count arrays, merged by code, and
+                # only the winners are decoded
+                tables = [table for _, table in map_chunks(count_kmers, genome, pattern_len,
+                    (pattern_len,), args["workers"])]
+                codes, counts = merge_kmer_counts(tables, pattern_len)
+                max_key_list, max_count = most_frequent(codes, counts, pattern_len)
 
+        print('Most frequent sequence(s) in genome : ', max_key_list)
+        print('Number of occurances : ', max_count)
 
-    
+    profiler.finish()
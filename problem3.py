@@ -1,6 +1,10 @@
 import argparse
 import os
 
+from fasta import write_reverse_complement
+from genome import load_genome, reverse_complement
+from profiling import Profiler
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -15,6 +19,9 @@ def parse_cmd_line(as_dict=False):
 
     defaults = {
         "genome_fname" : "./test_genome.txt",
+        "output_fname" : None,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -24,7 +31,23 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome sequence"""
+        help="""File containing genome sequence (plain or FASTA). Use file:contig to pick one contig"""
+    )
+    parser.add_argument("--output_fname",
+        type=str,
+        default=defaults["output_fname"],
+        help="""Write the reverse complement to this FASTA file, reading the genome
+        backwards in chunks instead of loading it. Nothing is printed"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
     )
 
     args = parser.parse_args()
@@ -33,33 +56,20 @@ def parse_cmd_line(as_dict=False):
         args = vars(args)
     return args
 
-def reverse_complement(forward_sequence):
-    """
-    Generates the reverse complement of a nucleotide sequence
-    
-    Parameters:
-        forward_sequence - str
-            nucleotide sequence.
-    Returns:
-        rev_comp - str
-            the reverse complement of the input nucleotide sequence
-            
-    """
-    complement = forward_sequence.replace('A', '%temp%').replace('T', 'A').replace('%temp%', 'T')
-    complement = complement.replace('G', '%temp%').replace('C', 'G').replace('%temp%', 'C')
-
-    rev_comp = complement[::-1]
-
-    return rev_comp
-
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
+    if args["output_fname"] is not None:
+        with profiler.stage("reverse_complement"):
+            write_reverse_complement(args["genome_fname"], args["output_fname"])
+    else:
+        with profiler.stage("load"):
+            genome = load_genome(args["genome_fname"])
+        with profiler.stage("reverse_complement"):
+            rev_comp = reverse_complement(genome)
 
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
-    
-    print('Original sequence : ', genome)
-    print('Reverse complement sequence : ', reverse_complement(genome))
\ No newline at end of file
+        print('Original sequence : ', genome)
+        print('Reverse complement sequence : ', rev_comp)
+
+    profiler.finish()
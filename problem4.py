@@ -1,6 +1,12 @@
 import argparse
 import os
 
+from aho_corasick import multi_pattern_search, read_patterns
+from fm_index import FMIndex, load_or_build_index
+from genome import PackedSequence, load_genome
+from parallel import parallel_positions
+from profiling import Profiler
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -15,7 +21,13 @@ def parse_cmd_line(as_dict=False):
 
     defaults = {
         "genome_fname" : "./test_genome.txt",
-        "specified_seq" : "ATG"
+        "specified_seq" : "ATG",
+        "index" : False,
+        "pattern_fname" : None,
+        "reverse_complement" : False,
+        "workers" : 1,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -25,13 +37,43 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome"""
+        help="""File containing genome (plain or FASTA). Use file:contig to pick one contig"""
     )
     parser.add_argument("--specified_seq", 
         type=str,
         default=defaults["specified_seq"],
         help="""Sample specified nucleotide sequence"""
     )
+    parser.add_argument("--index",
+        action="store_true",
+        default=defaults["index"],
+        help="""Answer from a suffix array / FM-index saved next to the genome file, building it on first use"""
+    )
+    parser.add_argument("--pattern_fname",
+        type=str,
+        default=defaults["pattern_fname"],
+        help="""File of patterns, one per line. Searches for all of them in one pass over the genome"""
+    )
+    parser.add_argument("--reverse_complement",
+        action="store_true",
+        default=defaults["reverse_complement"],
+        help="""With --pattern_fname, also search for the reverse complement of every pattern"""
+    )
+    parser.add_argument("--workers",
+        type=int,
+        default=defaults["workers"],
+        help="""Number of processes to scan the genome with. 0 uses every core"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
 
     args = parser.parse_args()
     
@@ -44,7 +86,7 @@ def seq_position(genome, specified_seq):
     Identifies position(s) of specific nucleotide sequence in genome
 
     Parameters:
-        genome - str
+        genome - str, PackedSequence or FMIndex
             whole genome nucleotide sequence. case sensitive
         specified_seq - str
             specified nucleotide sequence. case sensitive
@@ -52,22 +94,55 @@ def seq_position(genome, specified_seq):
         pos - list
             list of positions specified nucleotide sequence occures in genome
     """
+    if isinstance(genome, FMIndex):
+        return genome.locate(specified_seq)
+
+    # decode once and let str.find skip between matches, instead of
+    # slicing (and unpacking) a window at every position
+    if isinstance(genome, PackedSequence):
+        genome = str(genome)
     pos = []
-    for i in range(len(genome)-(len(specified_seq)-1)):
-        if genome[i:(len(specified_seq)+i)] == specified_seq:
-            pos.append(i)
+    i = genome.find(specified_seq)
+    while i != -1:
+        pos.append(i)
+        i = genome.find(specified_seq, i + 1)
     return pos
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
+    if args["pattern_fname"] is not None:
+        with profiler.stage("load"):
+            genome = load_genome(args["genome_fname"])
+            patterns = read_patterns(args["pattern_fname"])
+        with profiler.stage("search"):
+            results = multi_pattern_search(genome, patterns, args["reverse_complement"])
+    elif args["index"]:
+        with profiler.stage("load"):
+            genome = load_or_build_index(args["genome_fname"])
+    else:
+        with profiler.stage("load"):
+            genome = load_genome(args["genome_fname"])
+
+    if args["pattern_fname"] is not None:
+        for result in results:
+            print('Looking for : ', result["pattern"])
+            print('Found in position(s) : ', result["positions"])
+            if args["reverse_complement"]:
+                print('Reverse complement found in position(s) : ',
+                    result["reverse_complement_positions"])
+    else:
+        specified_seq = args["specified_seq"]
 
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
+        with profiler.stage("search"):
+            if isinstance(genome, FMIndex):
+                positions = seq_position(genome, specified_seq)
+            else:
+                positions = parallel_positions(seq_position, genome, len(specified_seq),
+                    (specified_seq,), args["workers"])
 
-    specified_seq = args["specified_seq"]
+        print('Looking for : ', specified_seq)
+        print('Found in position(s) : ', positions)
 
-    print('Looking for : ', specified_seq)
-    print('Found in position(s) : ', seq_position(genome, specified_seq))
\ No newline at end of file
+    profiler.finish()
@@ -1,6 +1,11 @@
 import argparse
 import os
 
+from cache import open_cache
+from genome import decode_kmer, encode_kmer, load_genome
+from kmers import find_clumps
+from profiling import Profiler
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -17,7 +22,10 @@ def parse_cmd_line(as_dict=False):
         "genome_fname" : "./test_genome.txt",
         "sequence_len" : 5,
         "range" : 50,
-        "occurances" : 4
+        "occurances" : 4,
+        "cache_dir" : None,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -27,7 +35,7 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome"""
+        help="""File containing genome (plain or FASTA). Use file:contig to pick one contig"""
     )
     parser.add_argument("--sequence_len", 
         type=int,
@@ -44,6 +52,21 @@ def parse_cmd_line(as_dict=False):
         default=defaults["occurances"],
         help="""Number of times you want to see a pattern occur"""
     )
+    parser.add_argument("--cache_dir",
+        type=str,
+        default=defaults["cache_dir"],
+        help="""Directory to keep results in between runs. No caching if not set"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
     args = parser.parse_args()
     
     if as_dict:
@@ -56,59 +79,49 @@ def clump_finder(genome, pattern_len, window, occurances):
     given genome sequence (window) t number of times (occurances).
     
     Parameters:
-        genome - str
+        genome - str or PackedSequence
             whole genome nucleotide sequence.
         pattern_len - int
             length of nucleotide sequence.
         window - int
-            desired length of sliding window.
+            desired length of sliding window, in bases.
         occurances - int
             number of times you want to see a pattern occur.
     Returns:
         clumping_seq - list
             nucleotide sequences that appear at least t times (occurances) in a
-            speficied window
+            speficied window, in alphabetical order
     """
 
-    # Describe at a high level what method was used to solve the problem below..
-
-    count = {}
-    clumping_seqs = []
-    for i in range(len(genome)-(pattern_len-1)):
-        pattern = genome[i:pattern_len+i]
-        
-        if pattern in count:
-            count[pattern] = count[pattern] + 1
-        else:
-            count[pattern] = 1
-        
-        if i == window:
-            max_key = max(count, key=count.get)
-            if count[max_key] >= occurances:
-                clumping_seqs.append(max_key)
-            
-            # need to delete first key value pair in count because when window
-            # is moved the first entry is no longer in bounds of the next widnow.
-            del count[list(count.keys())[0]]
-
-            window = window + 1
-    # Specific comment about how you're achieving what you described above..
-    clumping_seqs = list(set(clumping_seqs))
+    # Slide the window one base at a time, counting the k-mer that enters
+    # and un-counting the one that leaves, so each step is O(1).
+    clumping_seqs = find_clumps(genome, pattern_len, window, occurances)
     return clumping_seqs
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
-
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
+    with profiler.stage("load"):
+        genome = load_genome(args["genome_fname"])
     
     pattern_len = args["sequence_len"]
     window = args["range"]
     occurances = args["occurances"]
 
-    clumping_seqs = clump_finder(genome, pattern_len, window, occurances)
+    cache = open_cache(args["cache_dir"])
+
+    with profiler.stage("clumps"):
+        if cache is None:
+            clumping_seqs = clump_finder(genome, pattern_len, window, occurances)
+        else:
+            # stored as 2-bit codes
+            table = cache.cached(genome, "clumps",
+                lambda: {"codes" : [encode_kmer(seq) for seq in
+                    clump_finder(genome, pattern_len, window, occurances)]},
+                k=pattern_len, window=window, occurances=occurances)
+            clumping_seqs = [decode_kmer(int(code), pattern_len) for code in table["codes"]]
     print("Sequence(s) that clump : ", clumping_seqs)
-    print("Number of sequence(s) that clump : ", len(clumping_seqs))
\ No newline at end of file
+    print("Number of sequence(s) that clump : ", len(clumping_seqs))
+
+    profiler.finish()
@@ -1,6 +1,10 @@
 import argparse
 import os
 
+from genome import load_genome
+from profiling import Profiler
+from skew import skew_array
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -15,6 +19,8 @@ def parse_cmd_line(as_dict=False):
 
     defaults = {
         "genome_fname" : "./test_genome.txt",
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -24,7 +30,17 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome"""
+        help="""File containing genome (plain or FASTA). Use file:contig to pick one contig"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
     )
 
     args = parser.parse_args()
@@ -38,33 +54,24 @@ def tally(genome):
     Finds skew of nucleuotide sequence.
     
     Parameters:
-        genome - str
+        genome - str or PackedSequence
             whole genome nucleotide sequence.
     Returns:
-         - list
-            ints
+        skew - int32 array
+            len(genome) + 1 values. C = -1, G = +1, other bases 0
     """
-    skew = [0]
-    for i in range(len(genome)):
-        if genome[i] == 'C':
-            count = skew[i] - 1
-        elif genome[i] == 'G':
-            count = skew[i] + 1
-        else:
-            count = skew[i] + 0
-
-        skew.append(count)
-    return skew
+    return skew_array(genome)
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
+    with profiler.stage("load"):
+        genome = load_genome(args["genome_fname"])
 
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
+    with profiler.stage("skew"):
+        skew = tally(genome)
 
-    skew = tally(genome)
+    print(skew.tolist())
 
-    print(skew)
\ No newline at end of file
+    profiler.finish()
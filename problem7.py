@@ -1,5 +1,12 @@
 import argparse
 import os
+import sys
+
+from cache import open_cache
+from genome import load_genome
+from profiling import Profiler
+from skew import skew_array, skew_extremes, stream_skew_extremes
+from skew_index import SkewTree, load_or_build_rmq
 
 def parse_cmd_line(as_dict=False):
     """
@@ -15,59 +22,164 @@ def parse_cmd_line(as_dict=False):
 
     defaults = {
         "genome_fname" : "./test_genome.txt",
+        "stream" : False,
+        "cache_dir" : None,
+        "edits" : [],
+        "regions" : [],
+        "per_contig" : False,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
-        description="""Finds min of nucleotide sequence based on 'skew' """",
+        description="""Finds min of nucleotide sequence based on 'skew'""",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome"""
+        help="""File containing genome (plain or FASTA). Use file:contig to pick one contig"""
+    )
+    parser.add_argument("--stream",
+        action="store_true",
+        default=defaults["stream"],
+        help="""Read the genome in chunks and never hold it or its skew in memory"""
+    )
+    parser.add_argument("--cache_dir",
+        type=str,
+        default=defaults["cache_dir"],
+        help="""Directory to keep skew arrays in between runs. No caching if not set"""
+    )
+    parser.add_argument("--edits",
+        type=parse_edit,
+        nargs="*",
+        default=defaults["edits"],
+        help="""Base changes to apply before finding the min, as position:base (0-based),
+        e.g. 1042:G. The skew is kept in a segment tree updated per edit"""
+    )
+    parser.add_argument("--regions",
+        type=parse_region,
+        nargs="*",
+        default=defaults["regions"],
+        help="""Skew position ranges start:stop to find the min in, answered from a range-minimum
+        index saved next to the genome file"""
+    )
+    parser.add_argument("--per_contig",
+        action="store_true",
+        default=defaults["per_contig"],
+        help="""Find the min of each contig, from the range-minimum index saved next to the genome file"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
     )
 
     args = parser.parse_args()
+
+    if args.stream and args.edits:
+        parser.error("--edits needs the genome in memory, not --stream")
+    if args.edits and (args.regions or args.per_contig):
+        parser.error("--regions and --per_contig use the saved skew, without --edits")
     
     if as_dict:
         args = vars(args)
     return args
 
+def parse_edit(edit):
+    """
+    Parses a position:base edit.
+
+    Returns:
+        position - int
+        base - str
+    """
+    position, _, base = edit.partition(":")
+    if not position.isdigit() or len(base) != 1:
+        raise argparse.ArgumentTypeError("expected position:base, got {}".format(edit))
+    return int(position), base.upper()
+
+def parse_region(region):
+    """
+    Parses a start:stop range.
+
+    Returns:
+        start - int
+        stop - int
+    """
+    start, _, stop = region.partition(":")
+    if not (start.isdigit() and stop.isdigit()) or int(start) >= int(stop):
+        raise argparse.ArgumentTypeError("expected start:stop, got {}".format(region))
+    return int(start), int(stop)
+
 def tally(genome):
     """
     Finds skew of nucleuotide sequence.
     
     Parameters:
-        genome - str
+        genome - str or PackedSequence
             whole genome nucleotide sequence.
     Returns:
-        skew - list
-            ints
+        skew - int32 array
+            len(genome) + 1 values. C = -1, G = +1, other bases 0
     """
-    skew = [0]
-    for i in range(len(genome)):
-        if genome[i] == 'C':
-            count = skew[i] - 1
-        elif genome[i] == 'G':
-            count = skew[i] + 1
-        else:
-            count = skew[i] + 0
-
-        skew.append(count)
-    return skew
+    return skew_array(genome)
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
+    if args["regions"] or args["per_contig"]:
+        with profiler.stage("index"):
+            rmq = load_or_build_rmq(args["genome_fname"])
+        outside = ["{}:{}".format(start, stop) for start, stop in args["regions"] if stop > len(rmq)]
+        if outside:
+            sys.exit("{}: error: --regions {} outside the skew positions [0, {})".format(
+                os.path.basename(sys.argv[0]), ", ".join(outside), len(rmq)))
+        with profiler.stage("extremes"):
+            minima = [("[{}, {})".format(start, stop),) + rmq.range_min(start, stop)
+                for start, stop in args["regions"]]
+            if args["per_contig"]:
+                minima.extend(rmq.contig_minima())
+        for name, min_value, min_list in minima:
+            print("Minimum of {} at position(s) : ".format(name), min_list)
+            print(min_value)
+    else:
+        if args["stream"]:
+            with profiler.stage("skew"):
+                min_value, min_list, _, _ = stream_skew_extremes(args["genome_fname"])
+        else:
+            with profiler.stage("load"):
+                genome = load_genome(args["genome_fname"])
 
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
+            cache = open_cache(args["cache_dir"])
+            if args["edits"]:
+                outside = [position for position, _ in args["edits"] if position >= len(genome)]
+                if outside:
+                    sys.exit("{}: error: --edits position(s) {} outside the genome ({} bases)".format(
+                        os.path.basename(sys.argv[0]), ", ".join(map(str, outside)), len(genome)))
+                with profiler.stage("skew"):
+                    tree = SkewTree(genome)
+                with profiler.stage("edits"):
+                    for position, base in args["edits"]:
+                        tree.update(position, base)
+                with profiler.stage("extremes"):
+                    min_value, min_list = tree.range_min()
+            else:
+                with profiler.stage("skew"):
+                    if cache is None:
+                        skew = tally(genome)
+                    else:
+                        skew = cache.cached(genome, "skew", lambda: {"skew" : tally(genome)})["skew"]
 
-    skew = tally(genome)
-    
-    min_value = min(skew)
-    min_list = [i for i, x in enumerate(skew) if x == min_value]
-    print("Minimum at position(s) : ", min_list)
-    print(skew[min_list[0]])
+                with profiler.stage("extremes"):
+                    min_value, min_list, _, _ = skew_extremes(skew)
+        print("Minimum at position(s) : ", min_list)
+        print(min_value)
+
+    profiler.finish()
@@ -1,6 +1,11 @@
 import argparse
 import os
 
+from genome import load_genome
+from hamming import approx_positions
+from parallel import parallel_positions
+from profiling import Profiler
+
 def parse_cmd_line(as_dict=False):
     """
     Description:
@@ -16,7 +21,10 @@ def parse_cmd_line(as_dict=False):
     defaults = {
         "genome_fname" : "./test_genome.txt",
         "pattern" : "ACGT",
-        "mismatches" : 1
+        "mismatches" : 1,
+        "workers" : 1,
+        "profile" : None,
+        "profile_dump" : None
     }
     
     parser = argparse.ArgumentParser(
@@ -26,7 +34,7 @@ def parse_cmd_line(as_dict=False):
     parser.add_argument("--genome_fname", 
         type=str,
         default=defaults["genome_fname"],
-        help="""File containing genome"""
+        help="""File containing genome (plain or FASTA). Use file:contig to pick one contig"""
     )
     parser.add_argument("--pattern", 
         type=str,
@@ -38,6 +46,21 @@ def parse_cmd_line(as_dict=False):
         default=defaults["mismatches"],
         help="""Max amount of mismatches allowed"""
     )
+    parser.add_argument("--workers",
+        type=int,
+        default=defaults["workers"],
+        help="""Number of processes to scan the genome with. 0 uses every core"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats"""
+    )
 
     args = parser.parse_args()
     
@@ -50,10 +73,10 @@ def approx_pattern(genome, pattern, mismatches):
     Counts the number of times the approximate pattern is observed in genome.
     
     Parameters:
-        genome - str
-            whole genome nucleotide sequence. case sensitive
+        genome - str or PackedSequence
+            whole genome nucleotide sequence. case insensitive
         pattern - str
-            specified nucleotide sequence. case sensitive
+            specified nucleotide sequence. case insensitive
         mismatches - int
             max amount of mismatches between genome and pattern allowed
     Returns:
@@ -61,36 +84,25 @@ def approx_pattern(genome, pattern, mismatches):
             positon(s) in genome where approx pattern is found
 
     """
-    pattern_index = []
-    
-    for i in range(len(genome) - (len(pattern)-1)):
-        j = 0
-        count = 0
-        while j < len(pattern):
-            if genome[j] != pattern[j]:
-                count += 1
-            j += 1
-
-        if count <= mismatches:
-            pattern_index.append(i)
+    pattern_index = approx_positions(genome, pattern, mismatches)
 
-        genome = genome[1:]
-    
     return pattern_index
 
 if __name__ == "__main__":
     args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
     
-    genome_file = args["genome_fname"]
-    genome_file = open(genome_file)
-
-    genome = genome_file.read().replace("\n", " ")
-    genome_file.close()
+    with profiler.stage("load"):
+        genome = load_genome(args["genome_fname"])
 
     pattern = args["pattern"]
     mismatches = args["mismatches"]
 
-    pattern_index = approx_pattern(genome, pattern, mismatches)
+    with profiler.stage("search"):
+        pattern_index = parallel_positions(approx_pattern, genome, len(pattern),
+            (pattern, mismatches), args["workers"])
 
     print("Approx pattern found at position(s) : ", pattern_index)
     print(len(pattern_index))
+
+    profiler.finish()
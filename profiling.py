@@ -0,0 +1,138 @@
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# profiler collecting count_event() calls, None when not profiling
+_active = None
+
+def count_event(name, n=1):
+    """
+    Adds n to the hot-loop counter name (windows scanned, comparisons...)
+    of the running profiler. Does nothing when not profiling, so kernels
+    call it once per chunk or call, not once per window.
+
+    Counts made in worker processes are not collected.
+    """
+    if _active is not None:
+        _active.add(name, n)
+
+class Profiler:
+    """
+    Records per stage wall time, peak traced memory and hot-loop counters
+    of a run, and writes them as a JSON report. Optionally runs cProfile
+    over the whole run and dumps its stats (readable with pstats).
+
+    Does nothing if neither a report nor a dump file is given, so scripts
+    can always wrap their stages in it.
+    """
+
+    def __init__(self, report_fname=None, cprofile_fname=None):
+        """
+        Parameters:
+            report_fname - str or None
+                file to write the JSON report to. '-' writes it to stderr.
+            cprofile_fname - str or None
+                file to dump the cProfile stats to.
+        """
+        self.report_fname = report_fname
+        self.cprofile_fname = cprofile_fname
+        self.enabled = report_fname is not None or cprofile_fname is not None
+        self.counters = {}
+        self.stages = []
+        # open stages: (record, peak seen before a nested stage reset it)
+        self._open = []
+        self._cprofile = None
+        self._start = None
+
+    def start(self):
+        """
+        Starts tracing memory, counting events and cProfile. Returns self.
+        """
+        global _active
+        if not self.enabled:
+            return self
+        tracemalloc.start()
+        _active = self
+        if self.cprofile_fname is not None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def add(self, name, n=1):
+        """
+        Adds n to counter name, for the whole run and every open stage.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+        for record, _ in self._open:
+            record["counters"][name] = record["counters"].get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the block as stage name. Stages may be nested, the peak
+        memory of the outer stage includes the inner ones.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        if self._open:
+            # resetting the peak loses the outer stage's peak so far, keep it
+            outer = self._open[-1]
+            outer[1] = max(outer[1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        record = {"name" : name, "seconds" : None, "peak_bytes" : None, "counters" : {}}
+        self.stages.append(record)
+        self._open.append([record, 0])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            _, peak = self._open.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            record["peak_bytes"] = peak
+            if self._open:
+                self._open[-1][1] = max(self._open[-1][1], peak)
+
+    def report(self):
+        """
+        Returns the report as a JSON serializable dict: argv, total
+        seconds, peak traced bytes, counters and the stages in run order.
+        """
+        return {
+            "argv" : sys.argv,
+            "seconds" : time.perf_counter() - self._start if self._start is not None else None,
+            "peak_bytes" : tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+            "counters" : self.counters,
+            "stages" : self.stages
+        }
+
+    def finish(self):
+        """
+        Stops profiling and writes the report and the cProfile dump.
+        """
+        global _active
+        if not self.enabled:
+            return
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_fname)
+        report = self.report()
+        # peak of the whole run, not only since the last stage started
+        report["peak_bytes"] = max([report["peak_bytes"] or 0]
+            + [stage["peak_bytes"] for stage in self.stages if stage["peak_bytes"] is not None])
+        tracemalloc.stop()
+        if _active is self:
+            _active = None
+
+        if self.report_fname == "-":
+            json.dump(report, sys.stderr, indent=1)
+            sys.stderr.write("\n")
+        elif self.report_fname is not None:
+            with open(self.report_fname, "w") as f:
+                json.dump(report, f, indent=1)
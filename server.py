@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from aho_corasick import multi_pattern_search
+from fm_index import load_or_build_index
+from genome import load_genome
+from hamming import approx_count, approx_positions
+from kmers import DENSE_MAX_K, count_kmers, frequent_words_mismatches, most_frequent
+from neighborhood import neighborhood_size
+from profiling import Profiler
+from skew import skew_array, skew_extremes
+
+# most k-mers within the mismatches of one k-mer that /frequent_mismatches
+# enumerates (k = 13 with 3 mismatches is 8464)
+MAX_NEIGHBORHOOD = 10000
+
+def parse_cmd_line(as_dict=False):
+    """
+    Description:
+        Parses the command line arguments for the program
+    Parameters:
+        as_dict - bool
+            Returns the args as a dict. Default=False
+    Returns:
+        The command line arguments as a dictionary or a Namespace object and the
+        parser used to parse the command line.
+    """
+
+    defaults = {
+        "genome_fnames" : ["./Salmonella_enterica.txt"],
+        "kmer_lens" : [9],
+        "index" : True,
+        "host" : "127.0.0.1",
+        "port" : 8765,
+        "profile" : None,
+        "profile_dump" : None
+    }
+
+    parser = argparse.ArgumentParser(
+        description="""Keeps genomes, their skews, FM-indexes and k-mer tables
+        in memory and answers queries over local HTTP.""",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--genome_fnames",
+        nargs="+",
+        default=defaults["genome_fnames"],
+        help="""Files containing genomes (plain or FASTA). Use file:contig to pick one contig.
+        Queries name a genome by its file name without the directory"""
+    )
+    parser.add_argument("--kmer_lens",
+        type=int,
+        nargs="*",
+        default=defaults["kmer_lens"],
+        help="""k-mer lengths to count up front. Others, up to {}, are counted on first request
+        and kept""".format(DENSE_MAX_K)
+    )
+    parser.add_argument("--no_index",
+        dest="index",
+        action="store_false",
+        default=defaults["index"],
+        help="""Do not load FM-indexes. count and positions then scan the genome"""
+    )
+    parser.add_argument("--host",
+        type=str,
+        default=defaults["host"],
+        help="""Address to listen on"""
+    )
+    parser.add_argument("--port",
+        type=int,
+        default=defaults["port"],
+        help="""Port to listen on"""
+    )
+    parser.add_argument("--profile",
+        type=str,
+        default=defaults["profile"],
+        help="""File to write a JSON report of per stage time, peak memory and hot-loop counters to
+        when the server is stopped. '-' writes it to stderr"""
+    )
+    parser.add_argument("--profile_dump",
+        type=str,
+        default=defaults["profile_dump"],
+        help="""File to dump cProfile stats of the run to, read with pstats. Only the main thread
+        is profiled: loading, not the queries"""
+    )
+    args = parser.parse_args()
+
+    if as_dict:
+        args = vars(args)
+    return args
+
+class QueryError(ValueError):
+    """
+    Bad query. Answered with a 400 and the message.
+    """
+
+class UnknownQuery(Exception):
+    """
+    Query path that does not exist. Answered with a 404.
+    """
+
+class GenomeStore:
+    """
+    Genomes loaded once, with what queries need precomputed: skew extremes,
+    the FM-index (memory-mapped) and k-mer count tables. Tables for other
+    k are computed on first use and kept.
+    """
+
+    def __init__(self, genome_fnames, kmer_lens=(), index=True):
+        """
+        Parameters:
+            genome_fnames - list of str
+                files containing genomes, optionally followed by ':contig'.
+            kmer_lens - list of int
+                k-mer lengths to count now.
+            index - bool
+                load (building if needed) the FM-index of every genome.
+        """
+        self._lock = threading.Lock()
+        self.genomes = {}
+        for genome_fname in genome_fnames:
+            genome = load_genome(genome_fname)
+            min_value, min_list, max_value, max_list = skew_extremes(skew_array(genome))
+            self.genomes[os.path.basename(genome_fname)] = {
+                "genome" : genome,
+                "index" : load_or_build_index(genome_fname, genome) if index else None,
+                "skew" : {"min" : min_value, "min_positions" : min_list,
+                    "max" : max_value, "max_positions" : max_list},
+                "kmer_tables" : {k : count_kmers(genome, k) for k in kmer_lens}
+            }
+
+    def entry(self, name):
+        """
+        Returns the loaded data of a genome. name may be omitted when only
+        one genome is loaded.
+        """
+        if name is None and len(self.genomes) == 1:
+            return next(iter(self.genomes.values()))
+        if name not in self.genomes:
+            raise QueryError("unknown genome {}, loaded: {}".format(name, sorted(self.genomes)))
+        return self.genomes[name]
+
+    def kmer_table(self, entry, k):
+        """
+        Returns the count_kmers table of a genome for k, counting it once.
+        """
+        tables = entry["kmer_tables"]
+        if k not in tables:
+            table = count_kmers(entry["genome"], k)
+            with self._lock:
+                tables.setdefault(k, table)
+        return tables[k]
+
+def _param(params, name, type=str, default=None):
+    if name not in params:
+        if default is None:
+            raise QueryError("missing parameter {}".format(name))
+        return default
+    try:
+        return type(params[name][-1])
+    except ValueError:
+        raise QueryError("bad value for {}".format(name))
+
+def _mismatches(params, k):
+    # more than k mismatches is the same as k: every k-mer matches
+    mismatches = _param(params, "mismatches", int, 0)
+    if not 0 <= mismatches <= k:
+        raise QueryError("mismatches must be between 0 and {}".format(k))
+    return mismatches
+
+def _kmer_len(params, entry):
+    # every k counted is kept, so only the k preloaded with --kmer_lens and
+    # those counted in a dense table can be asked for
+    k = _param(params, "k", int)
+    if k not in entry["kmer_tables"] and not 1 <= k <= DENSE_MAX_K:
+        raise QueryError("k must be between 1 and {}".format(DENSE_MAX_K))
+    return k
+
+QUERIES = ("/genomes", "/skew", "/count", "/positions", "/approx", "/frequent",
+    "/frequent_mismatches")
+
+def query(store, path, params):
+    """
+    Answers one query.
+
+    Parameters:
+        store - GenomeStore
+        path - str
+            /genomes, /skew, /count, /positions, /approx, /frequent or
+            /frequent_mismatches.
+        params - dict of str to list of str
+            parsed query string. genome names the genome, pattern, k and
+            mismatches the query.
+    Returns:
+        result - object
+            JSON serializable
+    """
+    if path not in QUERIES:
+        raise UnknownQuery(path)
+    if path == "/genomes":
+        return {name : len(entry["genome"]) for name, entry in store.genomes.items()}
+
+    entry = store.entry(params.get("genome", [None])[-1])
+    genome = entry["genome"]
+
+    if path == "/skew":
+        return entry["skew"]
+    if path in ("/count", "/positions"):
+        pattern = _param(params, "pattern").upper()
+        # the scan never matches N, the index would: keep both answers equal
+        if not pattern or set(pattern) - set("ACGT"):
+            raise QueryError("pattern must be a non-empty sequence of A, C, G and T")
+        index = entry["index"]
+        if index is not None:
+            positions = index.locate(pattern) if path == "/positions" else None
+            count = index.count(pattern)
+        else:
+            positions = multi_pattern_search(genome, [pattern])[0]["positions"]
+            count = len(positions)
+        if path == "/count":
+            return {"pattern" : pattern, "count" : count}
+        return {"pattern" : pattern, "positions" : positions}
+    if path == "/approx":
+        pattern = _param(params, "pattern")
+        mismatches = _mismatches(params, len(pattern))
+        if _param(params, "count_only", int, 0):
+            return {"pattern" : pattern, "count" : approx_count(genome, pattern, mismatches)}
+        return {"pattern" : pattern, "positions" : approx_positions(genome, pattern, mismatches)}
+    if path == "/frequent":
+        k = _kmer_len(params, entry)
+        words, count = most_frequent(*store.kmer_table(entry, k), k)
+        return {"words" : words, "count" : count}
+    if path == "/frequent_mismatches":
+        k = _kmer_len(params, entry)
+        mismatches = _mismatches(params, k)
+        # every k-mer of the genome has its whole neighborhood enumerated,
+        # refuse the queries where that is too large to answer
+        if neighborhood_size(k, mismatches) > MAX_NEIGHBORHOOD:
+            raise QueryError("k = {} with {} mismatches is more than {} k-mers per k-mer".format(
+                k, mismatches, MAX_NEIGHBORHOOD))
+        words, count = frequent_words_mismatches(genome, k, mismatches)
+        return {"words" : words, "count" : count}
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    GET /<query>?genome=...&pattern=... answered with JSON. Each request
+    runs in its own thread.
+    """
+
+    store = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            result = query(self.store, url.path, parse_qs(url.query))
+            status = 200
+        except ValueError as error:
+            # QueryError, or arguments the functions reject (k too large...)
+            result = {"error" : str(error)}
+            status = 400
+        except UnknownQuery:
+            result = {"error" : "unknown query {}".format(url.path)}
+            status = 404
+
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(store, host, port):
+    """
+    Returns a threaded HTTP server answering queries from store.
+    """
+    handler = type("Handler", (QueryHandler,), {"store" : store})
+    return ThreadingHTTPServer((host, port), handler)
+
+if __name__ == "__main__":
+    args = parse_cmd_line(True)
+    profiler = Profiler(args["profile"], args["profile_dump"]).start()
+
+    with profiler.stage("load"):
+        store = GenomeStore(args["genome_fnames"], args["kmer_lens"], args["index"])
+    server = make_server(store, args["host"], args["port"])
+    print("Serving {} on http://{}:{}".format(sorted(store.genomes), args["host"],
+        server.server_address[1]), flush=True)
+    # queries are answered in other threads, their counters go to this stage
+    with profiler.stage("serve"):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    server.server_close()
+
+    profiler.finish()
@@ -0,0 +1,322 @@
+import heapq
+import math
+import random
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from genome import PackedSequence, decode_kmer
+from kmers import INVALID, kmer_codes
+
+_FULL = (1 << 64) - 1
+
+# windows whose codes are computed at a time, bounds the memory of a scan
+CHUNK_SIZE = 1 << 20
+
+def _mix(codes):
+    """
+    splitmix64 finalizer: spreads the bits of k-mer codes (which differ in
+    a few low bits) over the whole 64 bit word.
+    """
+    if np is not None and isinstance(codes, np.ndarray):
+        x = codes.astype(np.uint64)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+    x = codes
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _FULL
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _FULL
+    return x ^ (x >> 31)
+
+def distinct_codes(genome, k, chunk_size=CHUNK_SIZE):
+    """
+    Yields the k-mer counts of the genome chunk by chunk, so only
+    chunk_size codes are held at a time. A k-mer spread over several chunks
+    is yielded once per chunk.
+
+    Yields:
+        codes - numpy.ndarray or list of int
+            distinct valid codes of the chunk
+        counts - numpy.ndarray or list of int
+            occurrences of each code in the chunk
+    """
+    if not isinstance(genome, PackedSequence):
+        genome = PackedSequence(genome)
+    n_windows = len(genome) - k + 1
+    for start in range(0, max(n_windows, 0), chunk_size):
+        stop = min(start + chunk_size, n_windows)
+        codes = kmer_codes(genome.subsequence(start, stop + k - 1), k)
+        if np is not None:
+            codes = codes[codes != np.uint64(INVALID)]
+            yield np.unique(codes, return_counts=True)
+        else:
+            counts = Counter(codes)
+            counts.pop(INVALID, None)
+            yield list(counts), list(counts.values())
+
+class CountMinSketch:
+    """
+    Count-min sketch of k-mer codes with conservative update: depth rows
+    of width counters, each row indexed by its own hash. An estimate is
+    never below the true count, and is above it by more than
+    e / width * total with probability at most exp(-depth).
+
+    Memory is width * depth * 4 bytes whatever the number of distinct
+    k-mers.
+    """
+
+    def __init__(self, width, depth, seed=0):
+        """
+        Parameters:
+            width - int
+                counters per row. rounded up to a power of 2.
+            depth - int
+                number of rows (hash functions).
+            seed - int
+                seed of the hash functions.
+        """
+        self.bits = max(1, (width - 1).bit_length())
+        self.width = 1 << self.bits
+        self.depth = depth
+        self.total = 0
+
+        rng = random.Random(seed)
+        # multiply-shift hashing: row i takes the top bits of a_i * x + b_i
+        self._hashes = [(rng.getrandbits(64) | 1, rng.getrandbits(64)) for _ in range(depth)]
+        if np is not None:
+            self._table = np.zeros((depth, self.width), dtype=np.uint32)
+        else:
+            self._table = [array("I", bytes(4 * self.width)) for _ in range(depth)]
+
+    @classmethod
+    def from_error(cls, epsilon, delta, seed=0):
+        """
+        Builds a sketch whose estimates are within epsilon * total of the
+        true count with probability at least 1 - delta.
+        """
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)), seed)
+
+    @property
+    def nbytes(self):
+        return 4 * self.width * self.depth
+
+    @property
+    def error_bound(self):
+        """
+        Largest overestimate, e / width * total, that holds with probability
+        confidence.
+        """
+        return math.e / self.width * self.total
+
+    @property
+    def confidence(self):
+        """
+        Probability that an estimate is within error_bound.
+        """
+        return 1 - math.exp(-self.depth)
+
+    def _rows(self, codes):
+        mixed = _mix(codes)
+        shift = 64 - self.bits
+        if np is not None and isinstance(mixed, np.ndarray):
+            return [((mixed * np.uint64(a) + np.uint64(b)) >> np.uint64(shift)).astype(np.int64)
+                for a, b in self._hashes]
+        return [((mixed * a + b) & _FULL) >> shift for a, b in self._hashes]
+
+    def update(self, codes, counts):
+        """
+        Adds counts[i] occurrences of codes[i], codes being distinct.
+        Conservative update: each counter of a code only grows to the
+        code's new estimate, which keeps collisions from inflating it.
+        """
+        if np is not None:
+            codes = np.asarray(codes, dtype=np.uint64)
+            counts = np.asarray(counts, dtype=np.int64)
+            if len(codes) == 0:
+                return
+            rows = self._rows(codes)
+            new = self._estimate_rows(rows) + counts
+            for i, row in enumerate(rows):
+                np.maximum.at(self._table[i], row, new.astype(np.uint32))
+            self.total += int(counts.sum())
+            return
+
+        for code, count in zip(codes, counts):
+            rows = self._rows(code)
+            new = min(table[row] for table, row in zip(self._table, rows)) + count
+            for table, row in zip(self._table, rows):
+                if table[row] < new:
+                    table[row] = new
+            self.total += count
+
+    def _estimate_rows(self, rows):
+        estimates = self._table[0][rows[0]].astype(np.int64)
+        for i in range(1, self.depth):
+            np.minimum(estimates, self._table[i][rows[i]], out=estimates)
+        return estimates
+
+    def estimate(self, codes):
+        """
+        Estimated counts of codes (never below the true counts).
+
+        Returns:
+            estimates - numpy.ndarray or list of int
+        """
+        if np is not None:
+            codes = np.asarray(codes, dtype=np.uint64)
+            if len(codes) == 0:
+                return np.zeros(0, dtype=np.int64)
+            return self._estimate_rows(self._rows(codes))
+        return [min(table[row] for table, row in zip(self._table, self._rows(code)))
+            for code in codes]
+
+class HyperLogLog:
+    """
+    HyperLogLog estimate of the number of distinct k-mers in 2**precision
+    one byte registers, with a relative standard error of
+    1.04 / sqrt(2**precision).
+    """
+
+    def __init__(self, precision=14):
+        """
+        Parameters:
+            precision - int
+                4 to 18. each step doubles the memory and divides the
+                error by sqrt(2).
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.m = 1 << precision
+        self._registers = bytearray(self.m)
+
+    @property
+    def nbytes(self):
+        return self.m
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, codes):
+        """
+        Adds codes to the set. Repeated codes change nothing.
+        """
+        p = self.precision
+        registers = self._registers
+        if np is not None:
+            hashes = _mix(np.asarray(codes, dtype=np.uint64))
+            index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+            # rank of the first set bit in the next 32 bits, 33 if none
+            rest = ((hashes >> np.uint64(32 - p)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+            _, exponent = np.frexp(rest)
+            rank = np.where(rest > 0, 33 - exponent, 33).astype(np.uint8)
+            current = np.frombuffer(registers, dtype=np.uint8)
+            np.maximum.at(current, index, rank)
+            return
+
+        for code in codes:
+            hashed = _mix(code)
+            index = hashed >> (64 - p)
+            rest = (hashed >> (32 - p)) & 0xFFFFFFFF
+            rank = 33 - rest.bit_length()
+            if registers[index] < rank:
+                registers[index] = rank
+
+    def estimate(self):
+        """
+        Estimated number of distinct codes added.
+        """
+        m = self.m
+        alpha = {16 : 0.673, 32 : 0.697, 64 : 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        raw = alpha * m * m / sum(2.0 ** -register for register in self._registers)
+        zeros = self._registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # linear counting is more accurate for small sets
+            return m * math.log(m / zeros)
+        return raw
+
+def approximate_frequent_words(genome, k, top=10, epsilon=1e-5, delta=0.01, precision=14,
+        chunk_size=CHUNK_SIZE):
+    """
+    Finds the most frequent k-mers in bounded memory: a count-min sketch
+    takes the counts and a HyperLogLog the number of distinct k-mers, so
+    memory does not grow with the number of distinct k-mers (every k-mer
+    is distinct at large k). The genome is scanned twice, chunk by chunk:
+    once to fill the sketches, once to pick the top estimates.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length.
+        top - int
+            number of k-mers to report.
+        epsilon - float
+            counts are overestimated by at most epsilon * total k-mers...
+        delta - float
+            ...except with probability delta.
+        precision - int
+            HyperLogLog precision, 2**precision bytes.
+        chunk_size - int
+            windows encoded at a time.
+    Returns:
+        result - dict
+            words - list of (str, int, int)
+                k-mer, estimated count and lower bound of its true count,
+                highest estimate first
+            error_bound - float
+                largest overestimate of a count, with probability confidence
+            confidence - float
+            distinct - int
+                estimated number of distinct k-mers
+            distinct_error - float
+                relative standard error of distinct
+            total - int
+                number of k-mers counted
+            memory_bytes - int
+                size of the sketches
+    """
+    sketch = CountMinSketch.from_error(epsilon, delta)
+    distinct = HyperLogLog(precision)
+    for codes, counts in distinct_codes(genome, k, chunk_size):
+        sketch.update(codes, counts)
+        distinct.add(codes)
+
+    # heap of the best (estimate, code) seen so far
+    best = []
+    in_best = set()
+    for codes, _ in distinct_codes(genome, k, chunk_size):
+        estimates = sketch.estimate(codes)
+        floor = best[0][0] if best and len(best) >= top else 0
+        if np is not None:
+            keep = np.flatnonzero(estimates >= floor)
+            codes, estimates = codes[keep].tolist(), estimates[keep].tolist()
+        for code, estimate in zip(codes, estimates):
+            if estimate < floor or code in in_best:
+                continue
+            if len(best) < top:
+                heapq.heappush(best, (estimate, code))
+            elif estimate > best[0][0]:
+                in_best.discard(heapq.heapreplace(best, (estimate, code))[1])
+            else:
+                continue
+            in_best.add(code)
+            floor = best[0][0] if best and len(best) >= top else 0
+
+    error_bound = sketch.error_bound
+    words = [(decode_kmer(code, k), estimate, max(0, math.ceil(estimate - error_bound)))
+        for estimate, code in sorted(best, key=lambda entry: (-entry[0], entry[1]))]
+    return {
+        "words" : words,
+        "error_bound" : error_bound,
+        "confidence" : sketch.confidence,
+        "distinct" : round(distinct.estimate()),
+        "distinct_error" : distinct.standard_error,
+        "total" : sketch.total,
+        "memory_bytes" : sketch.nbytes + distinct.nbytes
+    }
@@ -0,0 +1,170 @@
+from array import array
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from fasta import stream_sequence
+from genome import PackedSequence
+from profiling import count_event
+
+# ASCII byte -> skew step stored as a signed byte: C = -1, G = +1, else 0
+_SKEW_TABLE = bytearray(256)
+_SKEW_TABLE[ord("C")] = 0xFF
+_SKEW_TABLE[ord("G")] = 1
+_SKEW_TABLE = bytes(_SKEW_TABLE)
+
+# 2-bit code -> skew step (A=0, C=1, G=2, T=3). masked bases are coded 0
+_CODE_SKEW_TABLE = bytes([0, 0xFF, 1, 0]) + bytes(252)
+
+def skew_steps(genome, start=0, stop=None):
+    """
+    Maps every base of genome[start:stop] to its skew step in one bulk
+    translate: C = -1, G = +1, anything else 0.
+
+    Parameters:
+        genome - str, bytes or PackedSequence
+            nucleotide sequence.
+        start, stop - int
+            region of genome to map. Default is the whole genome
+    Returns:
+        steps - bytes
+            one signed byte per base (0xFF = -1)
+    """
+    if stop is None:
+        stop = len(genome)
+    if isinstance(genome, PackedSequence):
+        return genome.codes(start, stop).translate(_CODE_SKEW_TABLE)
+    if isinstance(genome, str):
+        genome = genome[start:stop].encode("ascii", "replace")
+    else:
+        genome = bytes(genome[start:stop])
+    return genome.translate(_SKEW_TABLE)
+
+def skew_array(genome):
+    """
+    Finds skew of nucleotide sequence as a compact int32 array. Same values
+    as the list built by tally(): skew[0] = 0 and skew[i + 1] is the skew
+    after genome[i].
+
+    Uses a NumPy cumulative sum when NumPy is installed and falls back to
+    array('i') otherwise.
+
+    Parameters:
+        genome - str, bytes or PackedSequence
+            whole genome nucleotide sequence.
+    Returns:
+        skew - numpy.ndarray or array.array
+            len(genome) + 1 int32 values
+    """
+    steps = skew_steps(genome)
+    count_event("bases_scanned", len(steps))
+
+    if np is not None:
+        skew = np.empty(len(steps) + 1, dtype=np.int32)
+        skew[0] = 0
+        np.cumsum(np.frombuffer(steps, dtype=np.int8), dtype=np.int32, out=skew[1:])
+        return skew
+
+    return array("i", accumulate(array("b", steps), initial=0))
+
+def skew_extremes(skew):
+    """
+    Finds the min and max of a skew array and every position they occur at.
+
+    Parameters:
+        skew - numpy.ndarray, array.array or list
+            output of skew_array() or tally().
+    Returns:
+        min_value - int
+        min_positions - list of int
+        max_value - int
+        max_positions - list of int
+    """
+    if np is not None:
+        skew = np.asarray(skew)
+        min_value = int(skew.min())
+        max_value = int(skew.max())
+        return (
+            min_value, np.flatnonzero(skew == min_value).tolist(),
+            max_value, np.flatnonzero(skew == max_value).tolist()
+        )
+
+    min_value = min(skew)
+    max_value = max(skew)
+    min_positions = []
+    max_positions = []
+    for i, x in enumerate(skew):
+        if x == min_value:
+            min_positions.append(i)
+        if x == max_value:
+            max_positions.append(i)
+    return min_value, min_positions, max_value, max_positions
+
+def _positions(values, value, offset):
+    """
+    Returns offset + i for every i where values[i] == value.
+    """
+    if np is not None:
+        return (np.flatnonzero(values == value) + offset).tolist()
+    positions = []
+    i = values.index(value)
+    while True:
+        positions.append(offset + i)
+        try:
+            i = values.index(value, i + 1)
+        except ValueError:
+            return positions
+
+def stream_skew_extremes(genome_fname, chunk_size=1 << 22):
+    """
+    Finds the min and max skew of a genome file and every position they
+    occur at without holding the genome or the skew in memory. The file is
+    read chunk by chunk and only a running skew is carried between chunks.
+
+    Positions are the same as skew_extremes(tally(load_genome(fname))).
+
+    Parameters:
+        genome_fname - str
+            file containing genome, optionally followed by ':contig'.
+        chunk_size - int
+            raw bytes read per chunk.
+    Returns:
+        min_value - int
+        min_positions - list of int
+        max_value - int
+        max_positions - list of int
+    """
+    running = 0
+    pos = 0
+    min_value, min_positions = 0, [0]
+    max_value, max_positions = 0, [0]
+
+    for chunk in stream_sequence(genome_fname, chunk_size):
+        if not chunk:
+            continue
+        steps = chunk.translate(_SKEW_TABLE)
+        count_event("bases_scanned", len(steps))
+        if np is not None:
+            skew = np.cumsum(np.frombuffer(steps, dtype=np.int8), dtype=np.int64)
+            skew += running
+            chunk_min, chunk_max = int(skew.min()), int(skew.max())
+        else:
+            skew = array("q", accumulate(array("b", steps), initial=running))[1:]
+            chunk_min, chunk_max = min(skew), max(skew)
+
+        if chunk_min < min_value:
+            min_value, min_positions = chunk_min, []
+        if chunk_min == min_value:
+            min_positions.extend(_positions(skew, chunk_min, pos + 1))
+        if chunk_max > max_value:
+            max_value, max_positions = chunk_max, []
+        if chunk_max == max_value:
+            max_positions.extend(_positions(skew, chunk_max, pos + 1))
+
+        running = int(skew[-1])
+        pos += len(chunk)
+
+    return min_value, min_positions, max_value, max_positions
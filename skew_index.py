@@ -0,0 +1,649 @@
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from fasta import FastaFile, split_genome_fname
+from genome import load_genome
+from skew import skew_array, skew_steps
+
+# larger than any skew, stands for the min/max of an empty node
+_INF = 1 << 62
+
+MAGIC = b"SKEWRMQ1"
+
+# skew positions per block of the range-minimum index
+RMQ_BLOCK = 64
+
+# magic, skew length, block size, contigs, source size, source mtime (ns)
+_HEADER = struct.Struct("<8sQQQQQ")
+# contig start (in skew positions), length (in bases), name length
+_CONTIG = struct.Struct("<QQH")
+
+class SkewTree:
+    """
+    Segment tree over the skew steps of a genome (C = -1, G = +1, other
+    bases 0, as tally() counts them). Each node keeps the sum of its steps
+    and the min and max of their running sums, so after a base is changed
+    in place the skew at any position and the min/max of the skew over any
+    region are answered in O(log n) without recomputing the skew array.
+
+    Leaves are blocks of block_size bases scanned directly, which keeps
+    the tree at 3 * 16 bytes per block instead of per base.
+
+    Positions are those of the skew array: skew[0] = 0 and skew[i + 1] is
+    the skew after genome[i]. Insertions and deletions are not supported.
+    """
+
+    def __init__(self, genome, block_size=32):
+        """
+        Parameters:
+            genome - str, bytes or PackedSequence
+                whole genome nucleotide sequence.
+            block_size - int
+                bases per leaf.
+        """
+        self._steps = bytearray(skew_steps(genome))
+        self.block_size = block_size
+        self.n_blocks = max(1, -(-len(self._steps) // block_size))
+        self.size = 1 << (self.n_blocks - 1).bit_length()
+
+        # node i has children 2i and 2i + 1, block b is node size + b
+        self._sum = array("q", [0]) * (2 * self.size)
+        self._min = array("q", [_INF]) * (2 * self.size)
+        self._max = array("q", [-_INF]) * (2 * self.size)
+
+        if np is not None and len(self._steps) >= block_size:
+            n_full = len(self._steps) // block_size
+            running = np.cumsum(np.frombuffer(self._steps, dtype=np.int8)[:n_full * block_size]
+                .reshape(n_full, block_size), axis=1, dtype=np.int64)
+            leaves = slice(self.size, self.size + n_full)
+            self._sum[leaves] = array("q", running[:, -1].tolist())
+            self._min[leaves] = array("q", running.min(axis=1).tolist())
+            self._max[leaves] = array("q", running.max(axis=1).tolist())
+            first = n_full
+        else:
+            first = 0
+        for block in range(first, self.n_blocks):
+            self._set_leaf(block)
+        for node in range(self.size - 1, 0, -1):
+            self._pull(node)
+
+    def __len__(self):
+        """
+        Number of bases. The skew has len + 1 positions.
+        """
+        return len(self._steps)
+
+    def _block_range(self, block):
+        start = block * self.block_size
+        return start, min(start + self.block_size, len(self._steps))
+
+    def _scan(self, start, stop):
+        """
+        (sum, min, max) of the running sums of steps[start:stop].
+        """
+        if start >= stop:
+            return 0, _INF, -_INF
+        running = list(accumulate(array("b", self._steps[start:stop])))
+        return running[-1], min(running), max(running)
+
+    def _set_leaf(self, block):
+        node = self.size + block
+        self._sum[node], self._min[node], self._max[node] = self._scan(*self._block_range(block))
+
+    def _pull(self, node):
+        left, right = 2 * node, 2 * node + 1
+        left_sum = self._sum[left]
+        self._sum[node] = left_sum + self._sum[right]
+        self._min[node] = min(self._min[left], left_sum + self._min[right])
+        self._max[node] = max(self._max[left], left_sum + self._max[right])
+
+    def _pieces(self, start, stop):
+        """
+        Splits steps[start:stop] into ('scan', start, stop) and ('node',
+        node) pieces, in genome order.
+        """
+        if start >= stop:
+            return []
+        size = self.block_size
+        first, last = start // size, (stop - 1) // size
+        if first == last:
+            return [("scan", start, stop)]
+
+        pieces = []
+        if start % size:
+            pieces.append(("scan", start, (first + 1) * size))
+            first += 1
+        end_block = stop // size
+        # whole blocks [first, end_block), standard bottom-up decomposition
+        left, right = [], []
+        lo, hi = first + self.size, end_block + self.size
+        while lo < hi:
+            if lo & 1:
+                left.append(("node", lo))
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                right.append(("node", hi))
+            lo >>= 1
+            hi >>= 1
+        pieces.extend(left)
+        pieces.extend(reversed(right))
+        if stop % size:
+            pieces.append(("scan", end_block * size, stop))
+        return pieces
+
+    def _fold(self, start, stop):
+        """
+        (sum, min, max) of the running sums of steps[start:stop].
+        """
+        total, low, high = 0, _INF, -_INF
+        for piece in self._pieces(start, stop):
+            if piece[0] == "scan":
+                piece_sum, piece_min, piece_max = self._scan(piece[1], piece[2])
+            else:
+                node = piece[1]
+                piece_sum, piece_min, piece_max = self._sum[node], self._min[node], self._max[node]
+            low = min(low, total + piece_min)
+            high = max(high, total + piece_max)
+            total += piece_sum
+        return total, low, high
+
+    def _find(self, start, stop, target, extremes, first=False):
+        """
+        Returns the skew positions j + 1 (j in [start, stop)) where the
+        running sum of steps[start:j + 1] equals target, which is the min
+        (extremes is self._min) or max (self._max) of those sums. Only
+        nodes reaching target are descended into. With first, stops at the
+        first one.
+        """
+        positions = []
+
+        def scan(lo, hi, offset):
+            running = offset
+            for j in range(lo, hi):
+                step = self._steps[j]
+                running += step - 256 if step > 127 else step
+                if running == target:
+                    positions.append(j + 1)
+                    if first:
+                        return
+
+        def descend(node, offset):
+            if offset + extremes[node] != target or (first and positions):
+                return
+            if node >= self.size:
+                scan(*self._block_range(node - self.size), offset)
+                return
+            descend(2 * node, offset)
+            descend(2 * node + 1, offset + self._sum[2 * node])
+
+        offset = 0
+        for piece in self._pieces(start, stop):
+            if first and positions:
+                break
+            if piece[0] == "scan":
+                scan(piece[1], piece[2], offset)
+                offset += self._scan(piece[1], piece[2])[0]
+            else:
+                descend(piece[1], offset)
+                offset += self._sum[piece[1]]
+        return positions
+
+    def _check_range(self, start, stop):
+        if stop is None:
+            stop = len(self._steps) + 1
+        if not 0 <= start < stop <= len(self._steps) + 1:
+            raise ValueError("skew range [{}, {}) outside [0, {}]".format(start, stop,
+                len(self._steps)))
+        return stop
+
+    def update(self, pos, base):
+        """
+        Changes genome[pos] to base and updates the tree in
+        O(block_size + log n).
+
+        Parameters:
+            pos - int
+                0-based position in the genome.
+            base - str
+                new base. non-ACGT bases step 0
+        """
+        if not 0 <= pos < len(self._steps):
+            raise IndexError("position {} outside the genome".format(pos))
+        self._steps[pos] = skew_steps(base.upper())[0]
+        self._set_leaf(pos // self.block_size)
+        node = (self.size + pos // self.block_size) >> 1
+        while node:
+            self._pull(node)
+            node >>= 1
+
+    def skew(self, pos):
+        """
+        Skew at position pos, i.e. tally(genome)[pos].
+        """
+        if not 0 <= pos <= len(self._steps):
+            raise IndexError("skew position {} outside [0, {}]".format(pos, len(self._steps)))
+        return self._fold(0, pos)[0]
+
+    def range_min(self, start=0, stop=None):
+        """
+        Minimum of the skew over positions [start, stop) and every
+        position it occurs at.
+
+        Returns:
+            min_value - int
+            min_positions - list of int
+                ascending
+        """
+        return self._extreme(start, stop, True)
+
+    def range_max(self, start=0, stop=None):
+        """
+        Maximum of the skew over positions [start, stop) and every
+        position it occurs at.
+
+        Returns:
+            max_value - int
+            max_positions - list of int
+                ascending
+        """
+        return self._extreme(start, stop, False)
+
+    def _extreme(self, start, stop, minimum, first=False):
+        stop = self._check_range(start, stop)
+        base = self.skew(start)
+        _, low, high = self._fold(start, stop - 1)
+        relative = min(0, low) if minimum else max(0, high)
+        positions = [start] if relative == 0 else []
+        if (low if minimum else high) == relative and not (first and positions):
+            positions.extend(self._find(start, stop - 1, relative,
+                self._min if minimum else self._max, first))
+        return base + relative, positions
+
+    def argmin(self, start=0, stop=None):
+        """
+        First position of the minimum skew in [start, stop).
+        """
+        return self._extreme(start, stop, True, first=True)[1][0]
+
+    def argmax(self, start=0, stop=None):
+        """
+        First position of the maximum skew in [start, stop).
+        """
+        return self._extreme(start, stop, False, first=True)[1][0]
+
+    def extremes(self):
+        """
+        Same as skew_extremes(tally(genome)) for the current genome.
+
+        Returns:
+            min_value - int
+            min_positions - list of int
+            max_value - int
+            max_positions - list of int
+        """
+        return self.range_min() + self.range_max()
+
+def rmq_fname(genome_fname):
+    """
+    Returns the file the skew index of genome_fname is saved to: next to
+    the genome file, with the contig name (if any) in the file name.
+    """
+    fname, contig = split_genome_fname(genome_fname)
+    if contig is None:
+        return fname + ".skew"
+    return "{}.{}.skew".format(fname, contig)
+
+def contig_spans(genome_fname):
+    """
+    Returns where each contig lies in load_genome(genome_fname), where
+    contigs are joined with one 'N' between them.
+
+    Returns:
+        spans - list of (str, int, int)
+            contig name, start and length in bases
+    """
+    fname, contig = split_genome_fname(genome_fname)
+    spans = []
+    start = 0
+    with FastaFile(fname) as fasta:
+        records = [fasta[contig]] if contig is not None else fasta
+        for record in records:
+            length = len(record.sequence())
+            spans.append((record.name, start, length))
+            start += length + 1
+    return spans
+
+class SkewRMQ:
+    """
+    Range-minimum index over the skew array of a genome: the min of any
+    [start, stop) and every position it occurs at, without scanning the
+    region.
+
+    The skew is cut into blocks of RMQ_BLOCK positions. A sparse table
+    over the block minima gives the minimal block of any run of whole
+    blocks in O(1) (two overlapping power of 2 spans), and at most two
+    partial blocks are scanned at the ends. The table takes
+    n / RMQ_BLOCK * log2(n / RMQ_BLOCK) entries instead of n * log2(n).
+    Positions of the minimum are found by splitting the run of blocks at
+    each minimal block, so the cost grows with the number of minima found,
+    not the length of the region.
+
+    The skew array itself is kept in the index, so a saved index answers
+    queries without the genome.
+    """
+
+    def __init__(self, skew, block_min, levels, block_size, contigs=(), buffer=None):
+        """
+        Use build() or load().
+
+        Parameters:
+            skew - array of int32
+                skew array.
+            block_min - array of int32
+                min of each block.
+            levels - list of arrays of uint32
+                levels[j - 1][i] is the minimal block of blocks
+                [i, i + 2**j), leftmost on ties.
+            block_size - int
+            contigs - list of (str, int, int)
+                contig name, start and length, see contig_spans.
+            buffer - mmap or None
+                memory map the arrays live in, if loaded.
+        """
+        self._skew = skew
+        self._block_min = block_min
+        self._levels = levels
+        self.block_size = block_size
+        self.contigs = list(contigs)
+        self._buffer = buffer
+
+    def __len__(self):
+        """
+        Number of skew positions, bases + 1.
+        """
+        return len(self._skew)
+
+    @classmethod
+    def build(cls, genome, contigs=(), block_size=RMQ_BLOCK):
+        """
+        Builds the index of a genome.
+
+        Parameters:
+            genome - str, bytes or PackedSequence
+                whole genome nucleotide sequence.
+            contigs - list of (str, int, int)
+                contig spans to keep with the index, see contig_spans.
+            block_size - int
+                skew positions per block.
+        Returns:
+            rmq - SkewRMQ
+        """
+        skew = skew_array(genome)
+        n_blocks = -(-len(skew) // block_size)
+
+        if np is not None:
+            skew = np.asarray(skew, dtype=np.int32)
+            padded = np.full(n_blocks * block_size, np.iinfo(np.int32).max, dtype=np.int32)
+            padded[:len(skew)] = skew
+            block_min = padded.reshape(n_blocks, block_size).min(axis=1)
+            levels = []
+            previous = np.arange(n_blocks, dtype=np.uint32)
+            span = 1
+            while 2 * span <= n_blocks:
+                n_entries = n_blocks - 2 * span + 1
+                left, right = previous[:n_entries], previous[span:span + n_entries]
+                best = np.where(block_min[right] < block_min[left], right, left)
+                level = np.zeros(n_blocks, dtype=np.uint32)
+                level[:n_entries] = best
+                levels.append(level)
+                previous = level
+                span *= 2
+            return cls(skew, block_min, levels, block_size, contigs)
+
+        block_min = array("i", (min(skew[i:i + block_size])
+            for i in range(0, len(skew), block_size)))
+        levels = []
+        previous = array("I", range(n_blocks))
+        span = 1
+        while 2 * span <= n_blocks:
+            level = array("I", bytes(4 * n_blocks))
+            for i in range(n_blocks - 2 * span + 1):
+                left, right = previous[i], previous[i + span]
+                level[i] = right if block_min[right] < block_min[left] else left
+            levels.append(level)
+            previous = level
+            span *= 2
+        return cls(skew, block_min, levels, block_size, contigs)
+
+    def save(self, fname, source_size=0, source_mtime_ns=0):
+        """
+        Writes the index to fname. The size and mtime of the genome file
+        are stored so load() can tell when the index is stale.
+        """
+        # written aside and renamed over fname, as FMIndex.save does
+        handle, tmp_fname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)),
+            suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as rmq_file:
+                rmq_file.write(_HEADER.pack(MAGIC, len(self._skew), self.block_size,
+                    len(self.contigs), source_size, source_mtime_ns))
+                written = _HEADER.size
+                for name, start, length in self.contigs:
+                    encoded = name.encode("utf-8")
+                    rmq_file.write(_CONTIG.pack(start, length, len(encoded)) + encoded)
+                    written += _CONTIG.size + len(encoded)
+                # keep the arrays 4 byte aligned
+                rmq_file.write(bytes(-written % 4))
+                for section in [self._skew, self._block_min] + list(self._levels):
+                    rmq_file.write(memoryview(section).cast("B"))
+            os.replace(tmp_fname, fname)
+        except BaseException:
+            os.unlink(tmp_fname)
+            raise
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Memory-maps an index written by save().
+
+        Returns:
+            rmq - SkewRMQ
+            source_size, source_mtime_ns - int
+                genome file stats recorded when the index was saved.
+        """
+        with open(fname, "rb") as rmq_file:
+            buffer = mmap.mmap(rmq_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, block_size, n_contigs, source_size, source_mtime_ns = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            buffer.close()
+            raise ValueError("{} is not a skew index file".format(fname))
+
+        offset = _HEADER.size
+        contigs = []
+        for _ in range(n_contigs):
+            start, length, name_len = _CONTIG.unpack_from(buffer, offset)
+            offset += _CONTIG.size
+            contigs.append((buffer[offset:offset + name_len].decode("utf-8"), start, length))
+            offset += name_len
+        offset += -offset % 4
+
+        n_blocks = -(-n // block_size)
+        view = memoryview(buffer)
+        if np is not None:
+            skew = np.frombuffer(buffer, dtype=np.int32, count=n, offset=offset)
+        else:
+            skew = view[offset:offset + 4 * n].cast("i")
+        offset += 4 * n
+        block_min = view[offset:offset + 4 * n_blocks].cast("i")
+        offset += 4 * n_blocks
+        levels = []
+        span = 1
+        while 2 * span <= n_blocks:
+            levels.append(view[offset:offset + 4 * n_blocks].cast("I"))
+            offset += 4 * n_blocks
+            span *= 2
+        if offset > len(buffer):
+            buffer.close()
+            raise struct.error("truncated skew index {}".format(fname))
+        return cls(skew, block_min, levels, block_size, contigs, buffer), source_size, source_mtime_ns
+
+    def close(self):
+        """
+        Releases the memory map of a loaded index.
+        """
+        if self._buffer is not None:
+            self._skew = self._block_min = self._levels = None
+            self._buffer.close()
+            self._buffer = None
+
+    def skew(self, pos):
+        """
+        Skew at position pos.
+        """
+        return int(self._skew[pos])
+
+    def _check_range(self, start, stop):
+        if stop is None:
+            stop = len(self._skew)
+        if not 0 <= start < stop <= len(self._skew):
+            raise ValueError("skew range [{}, {}) outside [0, {})".format(start, stop,
+                len(self._skew)))
+        return stop
+
+    def _min_block(self, lo, hi):
+        """
+        Leftmost block with the smallest min in blocks [lo, hi).
+        """
+        if hi - lo == 1:
+            return lo
+        j = (hi - lo).bit_length() - 1
+        level = self._levels[j - 1]
+        # plain ints: numpy scalars from a freshly built index lack bit_length
+        left, right = int(level[lo]), int(level[hi - (1 << j)])
+        return right if self._block_min[right] < self._block_min[left] else left
+
+    def _scan(self, start, stop, value=None):
+        """
+        Min of skew[start:stop] and the positions where skew equals value
+        (the min if value is None).
+        """
+        values = self._skew[start:stop]
+        if np is not None:
+            values = np.asarray(values)
+            if value is None:
+                value = int(values.min())
+            return value, (np.flatnonzero(values == value) + start).tolist()
+        values = values.tolist()
+        if value is None:
+            value = min(values)
+        return value, [start + i for i, x in enumerate(values) if x == value]
+
+    def range_min(self, start=0, stop=None):
+        """
+        Minimum of the skew over positions [start, stop) and every position
+        it occurs at.
+
+        Returns:
+            min_value - int
+            min_positions - list of int
+                ascending
+        """
+        stop = self._check_range(start, stop)
+        size = self.block_size
+        lo, hi = -(-start // size), stop // size
+        if lo >= hi:
+            return self._scan(start, stop)
+
+        candidates = []
+        if start < lo * size:
+            candidates.append(self._scan(start, lo * size)[0])
+        candidates.append(int(self._block_min[self._min_block(lo, hi)]))
+        if hi * size < stop:
+            candidates.append(self._scan(hi * size, stop)[0])
+        value = min(candidates)
+
+        positions = []
+        if start < lo * size:
+            positions.extend(self._scan(start, lo * size, value)[1])
+        # split the run of blocks at each block reaching value
+        blocks = []
+        pending = [(lo, hi)]
+        while pending:
+            block_lo, block_hi = pending.pop()
+            if block_lo >= block_hi:
+                continue
+            block = self._min_block(block_lo, block_hi)
+            if self._block_min[block] != value:
+                continue
+            blocks.append(block)
+            pending.append((block_lo, block))
+            pending.append((block + 1, block_hi))
+        for block in sorted(blocks):
+            positions.extend(self._scan(block * size, min((block + 1) * size, stop), value)[1])
+        if hi * size < stop:
+            positions.extend(self._scan(hi * size, stop, value)[1])
+        return value, positions
+
+    def argmin(self, start=0, stop=None):
+        """
+        First position of the minimum skew in [start, stop).
+        """
+        return self.range_min(start, stop)[1][0]
+
+    def contig_minima(self):
+        """
+        Minimum skew of each contig, as if the contig were loaded alone
+        (skew 0 at its start, positions from its start).
+
+        Returns:
+            minima - list of (str, int, list of int)
+                contig name, min value and its positions
+        """
+        minima = []
+        for name, start, length in self.contigs:
+            value, positions = self.range_min(start, start + length + 1)
+            offset = self.skew(start)
+            minima.append((name, value - offset, [pos - start for pos in positions]))
+        return minima
+
+def load_or_build_rmq(genome_fname, genome=None):
+    """
+    Memory-maps the saved skew index of a genome file, building and saving
+    it first if it is missing or older than the genome file.
+
+    Parameters:
+        genome_fname - str
+            file containing genome, optionally followed by ':contig'.
+        genome - PackedSequence or None
+            the already loaded genome, to avoid reading it again on a build.
+    Returns:
+        rmq - SkewRMQ
+    """
+    fname, _ = split_genome_fname(genome_fname)
+    stat = os.stat(fname)
+    saved = rmq_fname(genome_fname)
+
+    if os.path.exists(saved):
+        try:
+            rmq, size, mtime_ns = SkewRMQ.load(saved)
+        except (ValueError, struct.error):
+            rmq = None
+        if rmq is not None:
+            if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                return rmq
+            rmq.close()
+
+    if genome is None:
+        genome = load_genome(genome_fname)
+    SkewRMQ.build(genome, contig_spans(genome_fname)).save(saved, stat.st_size, stat.st_mtime_ns)
+    return SkewRMQ.load(saved)[0]
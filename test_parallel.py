@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Runs map_windows in a fresh interpreter so the resource tracker's output
+# (it reports on stderr, not through exceptions) can be checked.
+SCRIPT = """
+import multiprocessing
+import sys
+
+from genome import PackedSequence
+from parallel import map_windows
+
+multiprocessing.set_start_method(sys.argv[1])
+genome = PackedSequence("ACGTNACGGT" * 200)
+regions = [(0, 300), (500, 800), (1500, 2000)]
+inline = map_windows(str, genome, regions, workers=1)
+pooled = map_windows(str, genome, regions, workers=2)
+assert pooled == inline, "pooled results differ"
+print("ok")
+"""
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_map_windows_workers(start_method):
+    if start_method not in __import__("multiprocessing").get_all_start_methods():
+        pytest.skip("{} not available".format(start_method))
+    result = subprocess.run([sys.executable, "-c", SCRIPT, start_method],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "ok"
+    # the tracker prints tracebacks (KeyError) or leak warnings here
+    assert result.stderr == ""
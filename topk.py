@@ -0,0 +1,260 @@
+import heapq
+from collections import Counter
+from itertools import groupby
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from genome import decode_kmer
+from kmers import mismatch_scores
+from sketch import CHUNK_SIZE, distinct_codes
+
+def top_items(codes, counts, top):
+    """
+    Picks the top entries of a count table without sorting all of it.
+    Entries tied with the last one kept are kept too.
+
+    Parameters:
+        codes, counts - sequences of int
+            count table, e.g. from count_kmers.
+        top - int
+            number of entries wanted.
+    Returns:
+        items - list of (int, int)
+            (code, count), highest count first, ties by code
+    """
+    if len(codes) == 0 or top <= 0:
+        return []
+    if np is not None:
+        codes = np.asarray(codes)
+        counts = np.asarray(counts)
+        cut = len(counts) - min(top, len(counts))
+        threshold = np.partition(counts, cut)[cut]
+        keep = np.flatnonzero(counts >= threshold)
+        items = list(zip(codes[keep].tolist(), counts[keep].tolist()))
+    else:
+        threshold = heapq.nlargest(top, counts)[-1]
+        items = [(code, count) for code, count in zip(codes, counts) if count >= threshold]
+    items.sort(key=lambda item: (-item[1], item[0]))
+    return items
+
+def tie_groups(items):
+    """
+    Groups (code, count, ...) items sorted by decreasing count.
+
+    Returns:
+        groups - list of (int, list of int)
+            count and the codes that have it
+    """
+    return [(count, [item[0] for item in group])
+        for count, group in groupby(items, key=lambda item: item[1])]
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters: at most capacity counters, whatever the
+    number of distinct k-mers. A k-mer that is not tracked takes over the
+    smallest counter and inherits its count as error, so a count is never
+    below the true count and above it by at most its error. Any k-mer
+    occurring more than total / capacity times is tracked.
+
+    Summaries of separate chunks can be merged.
+    """
+
+    def __init__(self, capacity):
+        """
+        Parameters:
+            capacity - int
+                number of counters.
+        """
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        # (count, code) min-heap, with stale entries skipped on pop
+        self._heap = []
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _smallest(self):
+        heap = self._heap
+        while heap[0][0] != self._counts.get(heap[0][1]):
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _set(self, code, count, error):
+        self._counts[code] = count
+        self._errors[code] = error
+        heapq.heappush(self._heap, (count, code))
+        if len(self._heap) > 4 * self.capacity + 16:
+            self._heap = [(count, code) for code, count in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def update(self, codes, counts=None):
+        """
+        Adds occurrences of codes (counts[i] of codes[i], one each if
+        counts is None).
+        """
+        if counts is None:
+            counts = [1] * len(codes)
+        if np is not None and isinstance(codes, np.ndarray):
+            codes, counts = codes.tolist(), np.asarray(counts).tolist()
+        for code, count in zip(codes, counts):
+            self.total += count
+            if code in self._counts:
+                self._set(code, self._counts[code] + count, self._errors[code])
+            elif len(self._counts) < self.capacity:
+                self._set(code, count, 0)
+            else:
+                smallest, evicted = self._smallest()
+                heapq.heappop(self._heap)
+                del self._counts[evicted]
+                del self._errors[evicted]
+                self._set(code, smallest + count, smallest)
+
+    @property
+    def min_count(self):
+        """
+        Smallest tracked count: the most an untracked k-mer can occur. 0
+        while there are free counters.
+        """
+        if len(self._counts) < self.capacity:
+            return 0
+        return self._smallest()[0]
+
+    def merge(self, other):
+        """
+        Returns the summary of both streams. A k-mer missing from one
+        summary is counted as the smallest count of that summary there,
+        which keeps counts upper bounds.
+        """
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        merged.total = self.total + other.total
+        floors = (self.min_count, other.min_count)
+        entries = []
+        for code in set(self._counts) | set(other._counts):
+            count = error = 0
+            for n, summary in enumerate((self, other)):
+                if code in summary._counts:
+                    count += summary._counts[code]
+                    error += summary._errors[code]
+                else:
+                    count += floors[n]
+                    error += floors[n]
+            entries.append((count, error, code))
+        for count, error, code in heapq.nlargest(merged.capacity, entries):
+            merged._set(code, count, error)
+        return merged
+
+    def top(self, top):
+        """
+        Returns the top entries, ties with the last one included.
+
+        Returns:
+            items - list of (int, int, int)
+                (code, count, error), highest count first. the true count
+                is between count - error and count
+        """
+        items = top_items(list(self._counts), list(self._counts.values()), top)
+        return [(code, count, self._errors[code]) for code, count in items]
+
+class ExactTopK:
+    """
+    Exact top-k: every distinct k-mer is counted and the top ones are
+    picked with a partial selection, not a full sort. Mergeable like
+    SpaceSaving, but memory grows with the number of distinct k-mers.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self._counts = Counter()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def update(self, codes, counts=None):
+        """
+        Adds occurrences of codes (counts[i] of codes[i], one each if
+        counts is None).
+        """
+        if counts is None:
+            counts = [1] * len(codes)
+        if np is not None and isinstance(codes, np.ndarray):
+            codes, counts = codes.tolist(), np.asarray(counts).tolist()
+        for code, count in zip(codes, counts):
+            self._counts[code] += count
+            self.total += count
+
+    def merge(self, other):
+        """
+        Returns the counts of both streams.
+        """
+        merged = ExactTopK()
+        merged._counts = self._counts + other._counts
+        merged.total = self.total + other.total
+        return merged
+
+    def top(self, top):
+        """
+        Returns the top entries, ties with the last one included.
+
+        Returns:
+            items - list of (int, int, int)
+                (code, count, 0), highest count first
+        """
+        items = top_items(list(self._counts), list(self._counts.values()), top)
+        return [(code, count, 0) for code, count in items]
+
+def top_k_words(genome, k, top=50, capacity=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams the k-mers of the genome chunk by chunk and returns the top
+    ones grouped by count.
+
+    Parameters:
+        genome - str or PackedSequence
+            whole genome nucleotide sequence.
+        k - int
+            k-mer length.
+        top - int
+            number of k-mers wanted. a tie group crossing the cut is kept
+            whole.
+        capacity - int or None
+            None counts exactly. Otherwise Space-Saving with this many
+            counters (at least top), in bounded memory.
+        chunk_size - int
+            windows encoded at a time.
+    Returns:
+        groups - list of (int, list of str, list of int)
+            count, the k-mers with that count in alphabetical order, and
+            the count each of them is guaranteed to reach. with Space-Saving
+            the count is an upper bound and the lower bound is count - error,
+            so the k-mers are candidates for the top, not a verified top.
+            exact counts have lower bounds equal to the count
+    """
+    if capacity is None:
+        summary = ExactTopK()
+    else:
+        summary = SpaceSaving(max(capacity, top))
+    for codes, counts in distinct_codes(genome, k, chunk_size):
+        summary.update(codes, counts)
+
+    items = summary.top(top)
+    errors = {code : error for code, _, error in items}
+    return [(count, [decode_kmer(code, k) for code in codes],
+        [count - errors[code] for code in codes]) for count, codes in tie_groups(items)]
+
+def top_k_mismatch_words(genome, k, d, top=50, reverse_complement=False):
+    """
+    Top k-mers by approximate occurrences (within d mismatches), grouped
+    by count. See kmers.mismatch_scores.
+
+    Returns:
+        groups - list of (int, list of str)
+            count and the k-mers with that count in alphabetical order,
+            highest count first. a tie group crossing the cut is kept whole
+    """
+    codes, scores = mismatch_scores(genome, k, d, reverse_complement)
+    return [(count, [decode_kmer(int(code), k) for code in codes])
+        for count, codes in tie_groups(top_items(codes, scores, top))]